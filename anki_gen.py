@@ -0,0 +1,239 @@
+import argparse
+import csv
+import importlib
+import os
+import runpy
+import shards
+import subprocess
+import sys
+import time
+
+# One entry point for the four generators:  python anki_gen.py words|sentence|sentences|verbs [--dry-run] [script args]
+# A normal run executes the script exactly as 'python <script>.py' would. --dry-run imports the script for its settings
+# and helper functions (the run itself is in its main(), and openai, gtts and Cloud TTS are only imported on first use),
+# then works out what a run would do (new pairs, missing audio, new verbs, batches, estimated tokens) from the CSVs and
+# the local caches, read-only.
+# sentences and verbs also take --workers N [--claim]: N local worker processes share one sharded run (see shards.py)
+# and their part files are merged into the script's CSVs once they all finish.
+
+here = os.path.dirname(os.path.abspath(__file__))
+commands = {
+    'words': "Add new pairs to the vocabulary and synthesize missing word audio",
+    'sentence': "Generate example sentences (gTTS audio)",
+    'sentences': "Generate example sentences (gTTS + Cloud TTS audio, resumable)",
+    'verbs': "Conjugate new verbs into present/past/future cards",
+}
+
+def script_path(name):
+    return os.path.join(here, f"{name}.py")
+
+def import_script(name):
+    # The script as a module: its settings and helpers, without running it
+    return importlib.import_module(name)
+
+def script_settings(script):
+    return {name: value for name, value in vars(script).items() if not name.startswith('__')}
+
+def token_plan(build_prompt, items, model, completion_per_item, max_items, max_output_tokens=None, max_batches=0):
+    from batcher import TokenBatcher, count_tokens
+    batcher = TokenBatcher(model, count_tokens(build_prompt([]), model), completion_per_item, max_items=max_items, max_output_tokens=max_output_tokens)
+    batches = batcher.plan(items)
+    if max_batches > 0:
+        batches = batches[:max_batches]
+    prompt_tokens = sum(count_tokens(build_prompt(batch), model) for batch in batches)
+    return len(batches), prompt_tokens, int(completion_per_item * sum(len(batch) for batch in batches))
+
+def cached_split(kind, items, model, prompt_version, ttl_days=None):
+    import llm_cache
+    if not os.path.exists(llm_cache.db_path): # Don't create the cache file just to look at it
+        return {}, list(items)
+    return llm_cache.cache.split(kind, items, model, prompt_version, ttl_days)
+
+def existing_audio(folder, suffix):
+    if not os.path.isdir(folder):
+        return set()
+    import media_manifest
+    known = media_manifest.peek(folder, suffix) # No folder listing when words.py's manifest is current
+    return known if known is not None else {name[:-len(suffix)] for name in os.listdir(folder) if name.endswith(suffix)}
+
+def plan_words(script, settings):
+    from vocab_store import VocabularyStore
+    normalize = script.remove_parentheses
+
+    candidates = []
+    with open(settings['csv_in'], 'r', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        for row in reader:
+            if len(row) < 2 or not row[0].strip() or not row[1].strip():
+                continue
+            en, pt = row[0].strip(), row[1].strip()
+            if not (en.istitle() and pt.istitle()):
+                candidates.append((en, pt))
+
+    db_path = os.environ.get('ANKI_VOCAB_DB', settings['vocab_db'])
+    if os.path.exists(db_path):
+        store = VocabularyStore(db_path, normalize=normalize)
+        total = len(store)
+        new_pairs = store.unknown(candidates)
+        rows = [(en_clean, pt_clean) for en_clean, pt_clean, _, _ in store.missing_audio()]
+        store.db.close()
+    else: # First run: words.py seeds the store from filtered.csv
+        known = set()
+        if os.path.exists(settings['filtered_csv']):
+            with open(settings['filtered_csv'], 'r', encoding='utf-8') as file:
+                known = {tuple(row[:2]) for row in csv.reader(file) if len(row) >= 2}
+        total = len(known)
+        new_pairs = [pair for pair in dict.fromkeys(candidates) if pair not in known]
+        rows = [(normalize(en), normalize(pt)) for en, pt in known]
+    rows += [(normalize(en), normalize(pt)) for en, pt in new_pairs]
+
+    for folder in dict.fromkeys([settings['en_folder'], settings['pt_folder']]):
+        if not os.path.isdir(folder):
+            print(f"  (audio folder '{folder}' not found; counting every clip as missing)")
+    en_exists = existing_audio(settings['en_folder'], '_en.mp3')
+    pt_exists = existing_audio(settings['pt_folder'], '_pt.mp3')
+    en_missing = {en for en, _ in rows if en not in en_exists}
+    pt_missing = {pt for _, pt in rows if pt not in pt_exists}
+    clips = len(en_missing) + len(pt_missing)
+    rate = settings.get('tts_rate') or 0
+
+    print(f"  {len(candidates)} candidate pairs in '{settings['csv_in']}', {total} already stored, {len(new_pairs)} new")
+    print(f"  {len({row for row in rows if row[0] not in en_exists or row[1] not in pt_exists})} pairs need audio: "
+          f"{len(en_missing)} EN + {len(pt_missing)} PT clips to synthesize")
+    if rate and clips:
+        print(f"  At tts_rate={rate}/s that is at least {clips / rate / 60:.1f} minutes of gTTS calls (fewer if the audio cache has them)")
+
+def coverage_sample(settings):
+    import csv_sample, word_coverage
+    strategy = settings.get('sampling', 'uniform')
+    rows, total = word_coverage.coverage.sample_csv(settings['csv_in'], settings['list_size'], strategy, settings.get('sampling_power', 2.0)) # Read-only
+    counts = word_coverage.coverage.lookup(word_coverage.word_key(row) for row in rows)
+    fresh = sum(1 for row in rows if word_coverage.word_key(row) not in counts)
+    print(f"  {total} rows in '{settings['csv_in']}', sampling {len(rows)} ({strategy}): {fresh} without any sentence yet")
+    print(f"  {word_coverage.coverage.summary(csv_sample.RowStream(settings['csv_in']))}")
+    return rows
+
+def plan_sentences(script, settings, resume):
+    journal = settings.get('journal_file')
+
+    if resume and journal and os.path.exists(journal):
+        rows = script.read_plan(journal)
+        done = {entry['word'] for entry in script.journal_entries(journal)}
+        print(f"  Resuming '{journal}': {len(rows)} planned words, {len(done)} already done")
+    else:
+        rows = coverage_sample(settings)
+        done = set()
+
+    words = [word for word in dict.fromkeys(script.clean_word(row[0].strip()) for row in rows) if word not in done]
+    cached, words = cached_split(settings['cache_kind'], words, settings['model'], settings['prompt_version'], settings.get('llm_cache_ttl_days'))
+    if not resume and cached: # Outside crash recovery a cached answer usually repeats its old card, so count it as an API word
+        print(f"  {len(cached)} cached answers are re-checked against the sentence index and asked again if they repeat a card")
+        words, cached = words + list(cached), {}
+    batches, prompt_tokens, completion_tokens = token_plan(script.build_prompt, words, settings['model'],
+                                                          settings['completion_tokens_per_word'], settings['batch_size'])
+    print(f"  {len(cached)} words answered from the LLM cache, {len(words)} for the API in {batches} batches")
+    print(f"  Estimated {prompt_tokens} prompt + {completion_tokens} completion tokens ({settings['model']}), "
+          f"{2 * (len(cached) + len(words))} audio clips (before the audio cache)")
+
+def plan_verbs(script, settings):
+    from conjugate import conjugate
+    config = settings['config']
+
+    import verb_progress
+    existing = verb_progress.peek(config.get('progress_db', verb_progress.db_path))
+    if existing is None: # verbs.py seeds its progress store from the decks on its next run
+        existing = {verb for details in config['tenses'].values() for verb in script.read_cards(details['csv'])}
+    verb_pairs = script.filter_verbs(config['input_csv'])
+    verbs = [pt for _, pt in verb_pairs if pt.lower() not in existing]
+    print(f"  {len(existing)} verbs already in the decks, {len(verbs)} new")
+
+    local = 0
+    if config.get('local_conjugation'):
+        remaining = [verb for verb in verbs if not conjugate(verb, config['tenses'])]
+        local, verbs = len(verbs) - len(remaining), remaining
+    cached, verbs = cached_split('conjugation', verbs, config['model'], config['prompt_version'])
+    batches, prompt_tokens, completion_tokens = token_plan(script.build_prompt, verbs, config['model'], config['completion_tokens_per_verb'],
+                                                          config['batch_size'], config['max_tokens'], config.get('max_batches', 0))
+    print(f"  {local} conjugated locally, {len(cached)} from the LLM cache, {len(verbs)} for the API in {batches} batches"
+          + (f" (capped at max_batches={config['max_batches']})" if 0 < config.get('max_batches', 0) <= batches else ""))
+    print(f"  Estimated {prompt_tokens} prompt + {completion_tokens} completion tokens ({config['model']}), "
+          f"{(local + len(cached) + len(verbs)) * len(config['tenses'])} audio clips (before the audio cache)")
+
+def dry_run(name, extra):
+    start = time.perf_counter()
+    import metrics
+    metrics.recorder.log_path = '' # The helpers' timers would otherwise append to the metrics log
+    script = import_script(name)
+    settings = script_settings(script)
+    print(f"Dry run of {name}.py (nothing is written, no API is called):")
+    if name == 'words':
+        plan_words(script, settings)
+    elif name == 'verbs':
+        plan_verbs(script, settings)
+    else:
+        plan_sentences(script, settings, '--resume' in extra)
+    print(f"Planned in {time.perf_counter() - start:.2f}s")
+
+def run_workers(name, workers, claim, extra):
+    # Starts a fresh sharded run (or continues the last one with --resume) in 'workers' processes, then merges
+    settings = script_settings(import_script(name))
+    config = settings.get('config', settings)
+    if name == 'verbs':
+        targets, append = [details['csv'] for details in config['tenses'].values()], True # New verbs are added to the decks
+    else:
+        targets, append = [settings['csv_out']], False
+    if '--resume' in extra:
+        extra = [arg for arg in extra if arg != '--resume'] # The ledger and part files are the resume state
+    else:
+        for path in [config['shard_ledger']] + [part for target in targets for part in shards.part_paths(target)]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    processes = []
+    for i in range(1, workers + 1):
+        if claim:
+            split = ['--claim'] if name == 'verbs' else ['--claim', str(workers)] # sentences.py divides its rate limits by N
+        else:
+            split = ['--shard', f"{i}/{workers}"]
+        log = open(f"{name}.worker-{i}.log", 'w', encoding='utf-8')
+        processes.append((i, log, subprocess.Popen([sys.executable, script_path(name)] + split + extra, stdout=log, stderr=subprocess.STDOUT)))
+        print(f"Worker {i}: {' '.join(split)}, output in '{log.name}'")
+    failed = 0
+    for i, log, process in processes:
+        code = process.wait()
+        log.close()
+        failed += code != 0
+        print(f"Worker {i} finished" + (f" with exit code {code}" if code else ""))
+
+    ledger = shards.WorkLedger(config['shard_ledger'])
+    print(ledger.summary())
+    ledger.close()
+    for target in targets:
+        parts, added = shards.merge(target, append)
+        print(f"Merged {len(parts)} part files into '{target}' ({added} rows{' added' if append else ''}).")
+    if failed:
+        sys.exit(f"{failed} workers failed; run again with --resume to finish their words.")
+
+def main():
+    parser = argparse.ArgumentParser(prog='anki-gen', description="Generate Anki cards and audio.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in commands.items():
+        command = sub.add_parser(name, help=help_text, description=help_text)
+        command.add_argument('--dry-run', action='store_true', help="Show the work plan without calling any API or writing files")
+        if name in ('sentences', 'verbs'):
+            command.add_argument('--workers', type=int, default=0, help="Split the run across this many local worker processes")
+            command.add_argument('--claim', action='store_true', help="With --workers: claim words from the work ledger instead of fixed hash shards")
+    args, extra = parser.parse_known_args() # Anything else (e.g. sentences --resume) goes to the script
+
+    if args.dry_run:
+        dry_run(args.command, extra)
+        return
+    if getattr(args, 'workers', 0) > 0:
+        run_workers(args.command, args.workers, args.claim, extra)
+        return
+    sys.argv = [script_path(args.command)] + extra
+    runpy.run_path(script_path(args.command), run_name='__main__')
+
+if __name__ == "__main__":
+    main()
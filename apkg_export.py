@@ -0,0 +1,220 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zipfile
+
+# Builds a ready-to-import Anki package (.apkg) from the front/back strings the scripts already write to CSV:
+# a collection.anki2 SQLite file, a 'media' map and the referenced mp3s, streamed into the zip from disk.
+# Note GUIDs are derived from each card's source key - (en, pt) for words, (en, pt, PT sentence) for sentences and
+# (en, verb, tense) for verbs - so importing again after a card's text changed (a re-conjugated or repaired verb) updates
+# the note instead of creating a duplicate, while a word's new sentence becomes a note of its own. Note type and deck
+# ids are derived from their names for the same reason.
+
+model_name = 'Basic (anki-gen)'
+sound_tag = re.compile(r'\[sound:(.*?)\]')
+html_tag = re.compile(r'<[^>]+>')
+base91 = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!#$%&()*+,-./:;<=>?@[]^_`{|}~' # Anki's GUID alphabet
+
+schema = """
+CREATE TABLE col (id integer primary key, crt integer not null, mod integer not null, scm integer not null,
+    ver integer not null, dty integer not null, usn integer not null, ls integer not null, conf text not null,
+    models text not null, decks text not null, dconf text not null, tags text not null);
+CREATE TABLE notes (id integer primary key, guid text not null, mid integer not null, mod integer not null,
+    usn integer not null, tags text not null, flds text not null, sfld integer not null, csum integer not null,
+    flags integer not null, data text not null);
+CREATE TABLE cards (id integer primary key, nid integer not null, did integer not null, ord integer not null,
+    mod integer not null, usn integer not null, type integer not null, queue integer not null, due integer not null,
+    ivl integer not null, factor integer not null, reps integer not null, lapses integer not null, left integer not null,
+    odue integer not null, odid integer not null, flags integer not null, data text not null);
+CREATE TABLE revlog (id integer primary key, cid integer not null, usn integer not null, ease integer not null,
+    ivl integer not null, lastIvl integer not null, factor integer not null, time integer not null, type integer not null);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+"""
+
+def stable_id(name): # Positive 63-bit id that is the same on every run
+    return int(hashlib.sha256(name.encode('utf-8')).hexdigest()[:15], 16)
+
+def strip_html(text):
+    return html_tag.sub('', sound_tag.sub('', text)).strip()
+
+def note_guid(key):
+    # key is the card's source key, e.g. ('sentence', 'cat', 'gato'); the kind keeps a word's card apart from its sentence card
+    value = int(hashlib.sha256("\x1f".join(key).encode('utf-8')).hexdigest()[:16], 16)
+    guid = ''
+    while value:
+        value, digit = divmod(value, len(base91))
+        guid = base91[digit] + guid
+    return guid or base91[0]
+
+def sound_names(text):
+    return sound_tag.findall(text)
+
+# Source keys of the scripts' CSV rows. Each script's row layout is fixed, so the key can be read back from the row
+def word_key(front, back): # words.py: 'cat<br>[sound:cat_en.mp3]' / 'gato<br>[sound:gato_pt.mp3]'
+    return 'word', strip_html(front), strip_html(back)
+
+def sentence_key(front, back):
+    # sentence.py / sentences.py: the sentence audio is named after the source pair, 'cat__en.mp3' and 'gato__pt.mp3'.
+    # A word gets a new sentence on later runs, so the PT sentence is part of the key and each sentence stays its own note
+    en, pt = sound_names(front), sound_names(back)
+    if not (en and pt):
+        return None
+    return 'sentence', en[0].rsplit('__en.mp3', 1)[0], pt[0].rsplit('__pt.mp3', 1)[0], strip_html(back)
+
+def verb_key(front, back):
+    # verbs.py: 'to leave<br>[sound:to leave_en.mp3]' / '<b>sair</b><br>...[sound:sair_present_verb.mp3]'. One PT verb can
+    # have several English pairs ('to leave', 'to go out'), each with its own cards, so the English side is part of the key
+    verb, sounds = re.search(r'<b>(.*?)</b>', back), sound_names(back)
+    tense = re.search(r'_([^_]+)_verb\.mp3$', sounds[-1]) if sounds else None
+    if not (verb and tense):
+        return None
+    return 'verb', strip_html(front), verb.group(1).lower(), tense.group(1)
+
+source_keys = {'words': word_key, 'sentences': sentence_key, 'verbs': verb_key}
+
+def field_checksum(text):
+    return int(hashlib.sha1(strip_html(text).encode('utf-8')).hexdigest()[:8], 16)
+
+def model_json(mid, did, now):
+    field = {'sticky': False, 'rtl': False, 'font': 'Arial', 'size': 20, 'media': []}
+    return {
+        'id': mid, 'name': model_name, 'type': 0, 'mod': now, 'usn': -1, 'sortf': 0, 'did': did, 'tags': [], 'vers': [],
+        'flds': [dict(field, name='Front', ord=0), dict(field, name='Back', ord=1)],
+        'tmpls': [{'name': 'Card 1', 'ord': 0, 'qfmt': '{{Front}}', 'afmt': '{{FrontSide}}<hr id=answer>{{Back}}',
+                   'bqfmt': '', 'bafmt': '', 'did': None, 'bfont': '', 'bsize': 0}],
+        'css': '.card { font-family: arial; font-size: 20px; text-align: center; color: black; background-color: white; }',
+        'latexPre': '\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n\\usepackage[utf8]{inputenc}\n'
+                    '\\usepackage{amssymb,amsmath}\n\\pagestyle{empty}\n\\setlength{\\parindent}{0in}\n\\begin{document}\n',
+        'latexPost': '\\end{document}', 'latexsvg': False, 'req': [[0, 'any', [0]]],
+    }
+
+def deck_json(did, name, now):
+    return {'id': did, 'name': name, 'mod': now, 'usn': -1, 'desc': '', 'dyn': 0, 'conf': 1, 'collapsed': False,
+            'browserCollapsed': False, 'extendNew': 0, 'extendRev': 0,
+            'lrnToday': [0, 0], 'revToday': [0, 0], 'newToday': [0, 0], 'timeToday': [0, 0]}
+
+default_dconf = {'1': {
+    'id': 1, 'name': 'Default', 'mod': 0, 'usn': 0, 'maxTaken': 60, 'autoplay': True, 'timer': 0, 'replayq': True, 'dyn': False,
+    'new': {'bury': False, 'delays': [1, 10], 'initialFactor': 2500, 'ints': [1, 4, 0], 'order': 1, 'perDay': 20},
+    'lapse': {'delays': [10], 'leechAction': 1, 'leechFails': 8, 'minInt': 1, 'mult': 0},
+    'rev': {'bury': False, 'ease4': 1.3, 'ivlFct': 1, 'maxIvl': 36500, 'perDay': 200, 'hardFactor': 1.2},
+}}
+
+class ApkgWriter:
+    def __init__(self, path, media_folders=()):
+        self.path = path
+        self.media_folders = list(media_folders) # Where to look for the files named in [sound:...] tags
+        self.now = int(time.time())
+        self.mid = stable_id(model_name)
+        self.decks = {}
+        self.media = {} # File name -> path on disk; only names, never file contents, are kept in memory
+        self.missing_media = set()
+        self.next_id = int(time.time() * 1000)
+        self.notes = 0
+        self.tmpdir = tempfile.mkdtemp()
+        self.db = sqlite3.connect(os.path.join(self.tmpdir, 'collection.anki2'))
+        self.db.executescript(schema)
+
+    def unique_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    def deck_id(self, name):
+        if name not in self.decks:
+            self.decks[name] = stable_id(f"deck:{name}")
+        return self.decks[name]
+
+    def add_note(self, front, back, deck='Default', key=None):
+        # key: the card's source key (see word_key and friends); without one the card's text stands in for it
+        did = self.deck_id(deck)
+        nid = self.unique_id()
+        self.db.execute("INSERT INTO notes VALUES (?, ?, ?, ?, -1, '', ?, ?, ?, 0, '')",
+                        (nid, note_guid(key or ('text', strip_html(front), strip_html(back))), self.mid, self.now, f"{front}\x1f{back}", strip_html(front), field_checksum(front)))
+        self.db.execute("INSERT INTO cards VALUES (?, ?, ?, 0, ?, -1, 0, 0, ?, 0, 0, 0, 0, 0, 0, 0, 0, '')",
+                        (self.unique_id(), nid, did, self.now, self.notes))
+        self.notes += 1
+        for name in sound_tag.findall(front) + sound_tag.findall(back):
+            self.add_media(name)
+
+    def add_media(self, name):
+        if name in self.media or name in self.missing_media:
+            return
+        for folder in self.media_folders:
+            path = os.path.join(folder, name)
+            if os.path.exists(path):
+                self.media[name] = path
+                return
+        self.missing_media.add(name)
+
+    def write_collection(self):
+        decks = {'1': deck_json(1, 'Default', self.now)}
+        decks.update({str(did): deck_json(did, name, self.now) for name, did in self.decks.items()})
+        first_deck = next(iter(self.decks.values()), 1)
+        conf = {'activeDecks': [first_deck], 'curDeck': first_deck, 'newSpread': 0, 'collapseTime': 1200, 'timeLim': 0,
+                'estTimes': True, 'dueCounts': True, 'curModel': str(self.mid), 'nextPos': self.notes + 1,
+                'sortType': 'noteFld', 'sortBackwards': False, 'addToCur': True}
+        self.db.execute("INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, '{}')",
+                        (self.now, self.now * 1000, self.now * 1000, json.dumps(conf),
+                         json.dumps({str(self.mid): model_json(self.mid, first_deck, self.now)}), json.dumps(decks), json.dumps(default_dconf)))
+        self.db.commit()
+        self.db.close()
+
+    def close(self):
+        self.write_collection()
+        collection = os.path.join(self.tmpdir, 'collection.anki2')
+        media_map = {}
+        with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED) as package:
+            package.write(collection, 'collection.anki2')
+            for index, (name, path) in enumerate(self.media.items()):
+                package.write(path, str(index), compress_type=zipfile.ZIP_STORED) # Streamed from disk in chunks; mp3s don't deflate anyway
+                media_map[str(index)] = name
+            package.writestr('media', json.dumps(media_map))
+        os.remove(collection)
+        os.rmdir(self.tmpdir)
+        if self.missing_media:
+            print(f"Warning: {len(self.missing_media)} referenced audio files were not found and are not in the package.")
+        print(f"Wrote {self.notes} notes and {len(media_map)} media files to '{self.path}'.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def export_csv(sources, path, media_folders=(), key=None):
+    # sources: [(csv file, deck name), ...]. Rows are the [front, back] pairs the scripts write; key(front, back) gives a
+    # row's source key (word_key, sentence_key or verb_key)
+    with ApkgWriter(path, media_folders) as writer:
+        for csv_file, deck in sources:
+            with open(csv_file, 'r', newline='', encoding='utf-8') as file:
+                for row in csv.reader(file):
+                    if len(row) >= 2:
+                        writer.add_note(row[0], row[1], deck, key(row[0], row[1]) if key else None)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an Anki .apkg from the scripts' CSV output.")
+    parser.add_argument('csv', nargs='+', help="CSV files with front/back columns; use FILE=DECK to pick the deck name")
+    parser.add_argument('-o', '--output', required=True, help="Package to write, e.g. sentences.apkg")
+    parser.add_argument('--deck', default='Default', help="Deck for CSV files given without '=DECK'")
+    parser.add_argument('--media', action='append', default=[], help="Folder holding the referenced mp3s (repeatable)")
+    parser.add_argument('--kind', choices=source_keys, help="Which script wrote the CSVs, so notes get their source key as GUID")
+    args = parser.parse_args()
+
+    sources = [tuple(item.split('=', 1)) if '=' in item else (item, args.deck) for item in args.csv]
+    export_csv(sources, args.output, args.media, source_keys.get(args.kind))
+
+if __name__ == "__main__":
+    main()
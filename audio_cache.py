@@ -0,0 +1,120 @@
+import hashlib
+import json
+import metrics
+import os
+import shutil
+import threading
+
+cache_dir = os.environ.get('ANKI_AUDIO_CACHE', '.audio_cache') # Shared by words.py, sentence.py, sentences.py and verbs.py
+max_bytes = 2 * 1024 ** 3 # Evict least recently used clips once the cache grows past this size
+
+def cache_key(text, lang, engine, voice_name=None, pitch=0, speaking_rate=1.0):
+    # Everything that changes the synthesized audio is part of the key
+    params = [text, lang, engine, voice_name, float(pitch or 0), float(speaking_rate or 1.0)]
+    return hashlib.sha256(json.dumps(params, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def gtts_synthesizer(text, lang): # A synthesize() for fetch(); gTTS is only imported once a clip is actually missing
+    def synthesize(path):
+        from gtts import gTTS
+        gTTS(text=text, lang=lang).save(path)
+    return synthesize
+
+def link_or_copy(src, dst):
+    if os.path.exists(dst):
+        os.remove(dst) # Scripts have always overwritten their output files
+    try:
+        os.link(src, dst)
+    except OSError: # Different drive, or a filesystem without hard links
+        shutil.copyfile(src, dst)
+
+class AudioCache:
+    # Content-addressed mp3 store. A clip's mtime doubles as its last-used time, so eviction is LRU
+    def __init__(self, folder=cache_dir, limit=max_bytes):
+        self.folder = folder
+        self.limit = limit
+        self.size = None # Computed on first insert
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def path_for(self, key):
+        return os.path.join(self.folder, key[:2], f"{key}.mp3")
+
+    def fetch(self, dest, synthesize, text, lang, engine, voice_name=None, pitch=0, speaking_rate=1.0, guard=None):
+        # Copies a cached clip to 'dest', or calls synthesize(path) to create it first. Returns True on a cache hit.
+        # guard, if given, is a context manager factory wrapped around the copy into dest (see media_manifest.writing)
+        key = cache_key(text, lang, engine, voice_name, pitch, speaking_rate)
+        cached = self.path_for(key)
+
+        if os.path.exists(cached):
+            os.utime(cached) # Mark as recently used
+            self.place(cached, dest, guard)
+            with self.lock:
+                self.hits += 1
+            metrics.count('audio_cache_hits')
+            return True
+
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        tmp = f"{cached}.{threading.get_ident()}.tmp" # Unique per thread so concurrent misses never share a file
+        try:
+            with metrics.timer('tts_synthesize'):
+                synthesize(tmp)
+            os.replace(tmp, cached)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        self.place(cached, dest, guard)
+        size = os.path.getsize(cached)
+        with self.lock:
+            self.misses += 1
+        metrics.count('audio_cache_misses')
+        metrics.count('tts_bytes', size)
+        self.added(size)
+        return False
+
+    def place(self, cached, dest, guard):
+        if guard is None:
+            link_or_copy(cached, dest)
+        else:
+            with guard():
+                link_or_copy(cached, dest)
+
+    def entries(self):
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                if name.endswith('.mp3'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    yield stat.st_mtime, stat.st_size, path
+
+    def added(self, nbytes):
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self.entries())
+            else:
+                self.size += nbytes
+            if self.size > self.limit:
+                self.evict()
+
+    def evict(self):
+        # Drop the least recently used clips until we are back under 90% of the limit
+        target = self.limit * 0.9
+        for _, size, path in sorted(self.entries()):
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+                self.size -= size
+            except OSError as e:
+                print(f"Could not evict {path}: {e}")
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return f"Audio cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate)"
+
+cache = AudioCache()
+
+def fetch(dest, synthesize, text, lang, engine, voice_name=None, pitch=0, speaking_rate=1.0, guard=None):
+    return cache.fetch(dest, synthesize, text, lang, engine, voice_name, pitch, speaking_rate, guard)
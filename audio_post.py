@@ -0,0 +1,62 @@
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Optional clean-up for the mp3s the scripts generate: trims leading/trailing silence, normalizes loudness and
+# re-encodes as mono at a low bitrate with a local ffmpeg. Every file is its own ffmpeg process, so a thread pool
+# already runs them in parallel across cores (and, unlike a process pool, doesn't re-import the top-level scripts
+# on Windows). Files are replaced via a temp file, so a hard link into the audio cache is broken rather than modified.
+
+bitrate = '48k' # Plenty for speech on flashcards
+silence_threshold = '-50dB'
+loudness = 'loudnorm=I=-16:TP=-1.5:LRA=11'
+workers = os.cpu_count() or 4
+
+def audio_filter():
+    trim = f"silenceremove=start_periods=1:start_threshold={silence_threshold}"
+    return f"{trim},areverse,{trim},areverse,{loudness}" # Trimming the reversed clip removes the trailing silence
+
+def process_file(path, target_bitrate=bitrate):
+    # Returns (bytes before, bytes after). Leaves the original untouched if ffmpeg fails
+    before = os.path.getsize(path)
+    tmp = f"{path}.post.mp3"
+    result = subprocess.run(
+        ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', path, '-af', audio_filter(),
+         '-ac', '1', '-codec:a', 'libmp3lame', '-b:a', target_bitrate, tmp],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0 or not os.path.exists(tmp):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise RuntimeError(result.stderr.strip() or f"ffmpeg exited with {result.returncode}")
+    os.replace(tmp, path)
+    return before, os.path.getsize(path)
+
+def post_process(paths, target_bitrate=bitrate, max_workers=workers):
+    paths = [path for path in dict.fromkeys(paths) if os.path.exists(path)] # Each file once, skipping failed syntheses
+    if not paths:
+        return
+    if shutil.which('ffmpeg') is None:
+        print("Skipping audio post-processing: ffmpeg was not found on PATH.")
+        return
+
+    print(f"Post-processing {len(paths)} audio files with {max_workers} workers...")
+    start = time.monotonic()
+    saved = done = errors = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(process_file, path, target_bitrate): path for path in paths}
+        for future, path in futures.items():
+            try:
+                before, after = future.result()
+                saved += before - after
+                done += 1
+            except Exception as e:
+                errors += 1
+                print(f"Error post-processing {path}: {e}")
+
+    elapsed = time.monotonic() - start
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"Audio post-processing: {done} files in {elapsed:.1f}s ({rate:.2f} files/sec), "
+          f"{saved / 1024:.0f} KB saved, {errors} errors")
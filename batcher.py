@@ -0,0 +1,81 @@
+from collections import deque
+
+tiktoken = False # Optional, imported on first count: exact token counts. Without it we fall back to ~4 characters per token
+
+model_limits = { # (context window, max completion tokens)
+    'gpt-4o': (128000, 16384),
+    'gpt-4o-mini': (128000, 16384),
+    'gpt-3.5-turbo-1106': (16385, 4096),
+}
+encodings = {}
+
+def count_tokens(text, model='gpt-4o'):
+    global tiktoken
+    if tiktoken is False:
+        try:
+            import tiktoken
+        except ImportError:
+            tiktoken = None
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    if model not in encodings:
+        try:
+            encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encodings[model] = tiktoken.get_encoding('o200k_base')
+    return len(encodings[model].encode(text))
+
+def is_truncated(batch, missing, finish_reason=None):
+    # The API reports a response cut off by the token limit with finish_reason 'length', and such a response loses its
+    # last entries, so the missing items are a suffix of the batch. An entry missing for any other reason (a last entry
+    # the parser couldn't read) says nothing about the batch size
+    return finish_reason == 'length' and bool(missing) and list(missing) == list(batch[len(batch) - len(missing):])
+
+class TokenBatcher:
+    # Packs as many items per request as fit the model's context and completion limits, based on locally counted
+    # prompt tokens and a per-item completion estimate. Whenever a response is cut off by the token limit it halves the batch
+    # size and raises the estimate, then grows back one item per clean response.
+    def __init__(self, model, prompt_tokens, completion_tokens_per_item, max_items=50, max_output_tokens=None, safety=0.8):
+        context, output = model_limits.get(model, (16385, 4096))
+        self.model = model
+        self.prompt_tokens = prompt_tokens # Tokens used by the prompt template itself
+        self.completion_tokens_per_item = completion_tokens_per_item
+        self.max_items = max_items
+        self.item_limit = max_items
+        self.output_budget = min(output, max_output_tokens or output) * safety
+        self.input_budget = (context - min(output, max_output_tokens or output) - prompt_tokens) * safety
+        self.truncations = 0
+        self.rejected = set() # Items whose answer arrived but was thrown away (e.g. a repeated sentence); never evidence of truncation
+
+    def next_batch(self, queue):
+        # Pops the next batch off the front of 'queue' (a deque). Always returns at least one item if any are left
+        batch, input_tokens = [], 0
+        while queue and len(batch) < self.item_limit:
+            tokens = count_tokens(f"{queue[0]}, ", self.model)
+            output_tokens = (len(batch) + 1) * self.completion_tokens_per_item
+            if batch and (input_tokens + tokens > self.input_budget or output_tokens > self.output_budget):
+                break
+            batch.append(queue.popleft())
+            input_tokens += tokens
+        return batch
+
+    def plan(self, items): # Splits a whole list up front, for the async dispatcher
+        queue, batches = deque(items), []
+        while queue:
+            batches.append(self.next_batch(queue))
+        return batches
+
+    def record(self, batch, missing, finish_reason=None):
+        # Feeds back one response and the finish_reason the API gave for it. Returns True if it was truncated
+        if self.rejected:
+            batch = [item for item in batch if item not in self.rejected]
+            missing = [item for item in missing if item not in self.rejected]
+        if is_truncated(batch, missing, finish_reason) and len(missing) < len(batch):
+            self.truncations += 1
+            self.item_limit = max(1, len(batch) // 2)
+            self.completion_tokens_per_item *= 1.25
+            print(f"Response was truncated ({len(missing)} trailing entries missing), batch size now {self.item_limit}")
+            return True
+        if not missing:
+            self.item_limit = min(self.max_items, self.item_limit + 1)
+        return False
@@ -0,0 +1,148 @@
+import random
+import re
+import time
+import parsers
+
+# Micro-benchmark for parsers.py: builds synthetic 1,000-entry responses in both formats, checks that the shared
+# parsers give the same results as the per-script parsers they replaced (copied below), and times both.
+
+entries = 1000
+repeats = 5
+tenses = ['present', 'past', 'future']
+
+def legacy_parse_sentences(text, words, fallback): # generate_and_parse_sentences from sentence.py/sentences.py, minus the API call
+    cleaned_words = [w.strip() for w in words]
+    word_sentence_pairs = {}
+
+    entries = re.split(r'\n\s*\d+\.\s*', '\n' + text)
+    if entries and not entries[0].strip():
+        entries = entries[1:]
+
+    for entry in entries:
+        lines = [line.strip() for line in entry.strip().split('\n') if line.strip()]
+        if len(lines) >= 3:
+            word_match = re.match(r'WORD:\s*(.*)', lines[0], re.IGNORECASE)
+            if word_match:
+                original_word = word_match.group(1).strip()
+                en_sentence = None
+                pt_sentence = None
+
+                for line in lines[1:]:
+                    if re.match(r'^\s*EN\s*:', line, re.IGNORECASE):
+                        en_sentence = line.split(":", 1)[1].strip()
+                    elif re.match(r'^\s*PT\s*:', line, re.IGNORECASE):
+                        pt_sentence = line.split(":", 1)[1].strip()
+
+                if original_word and en_sentence and pt_sentence:
+                    word_sentence_pairs[original_word.lower()] = (en_sentence, pt_sentence)
+
+    found_pairs = []
+    missing_words = []
+
+    for word in cleaned_words:
+        word_lower = word.lower()
+        if word_lower in word_sentence_pairs:
+            found_pairs.append((word, word_sentence_pairs[word_lower]))
+        else:
+            found = False
+            if fallback:
+                for _, (en_sent, pt_sent) in word_sentence_pairs.items():
+                    if legacy_word_in_sentence(word, en_sent):
+                        found_pairs.append((word, (en_sent, pt_sent)))
+                        found = True
+                        break
+
+            if not found:
+                missing_words.append(word)
+
+    return found_pairs, missing_words
+
+def legacy_word_in_sentence(word, sentence):
+    word = word.strip().lower()
+    word_pattern = r'\b' + re.escape(word) + r'\b'
+    return bool(re.search(word_pattern, sentence.lower()))
+
+def legacy_parse_conjugations(raw_data): # parse_conjugations from verbs.py
+    parsed_verbs = {}
+    verb_blocks = raw_data.strip().split('---')
+
+    def process_tense_block(text_block):
+        lines = [line.strip().split(' ', 1)[1] for line in text_block.strip().split('\n') if ' ' in line.strip()]
+        return {'html': "<br>".join(lines), 'gTTS': ", ".join(lines)}
+
+    for block in filter(None, verb_blocks):
+        verb_match = re.search(r'VERB:\s*(.+)', block, re.IGNORECASE)
+        if not verb_match: continue
+
+        verb_infinitive = verb_match.group(1).lower().strip()
+        parsed_verbs[verb_infinitive] = {}
+
+        for i, tense in enumerate(tenses):
+            if i + 1 == len(tenses):
+                pattern = re.compile(rf'{tense.upper()}:(.*)', re.DOTALL | re.IGNORECASE)
+            else:
+                next_tense = tenses[i + 1].upper()
+                pattern = re.compile(rf'{tense.upper()}:(.*?){next_tense}', re.DOTALL | re.IGNORECASE)
+
+            match = pattern.search(block)
+            if match:
+                parsed_verbs[verb_infinitive][tense] = process_tense_block(match.group(1))
+
+    return parsed_verbs
+
+def sentence_response(n, rng):
+    words, lines = [], []
+    for i in range(1, n + 1):
+        word = f"word{i}"
+        words.append(word)
+        label = word if rng.random() > 0.05 else f"other{i}" # Some entries are mislabelled so the fallback scan runs
+        lines += [f"{i}. WORD: {label}", f"EN: I think {word} is nice today.", f"PT: Eu acho que {word} é legal hoje."]
+    words += [f"missing{i}" for i in range(n // 20)] # Words the model skipped entirely
+    return "\n".join(lines), words
+
+def conjugation_response(n):
+    blocks = []
+    for i in range(n):
+        stem = f"verb{i}"
+        blocks.append("\n".join([
+            f"VERB: {stem}ar",
+            "PRESENT:", f"Eu {stem}o", f"Você/Ele/Ela {stem}a", f"Nós {stem}amos", f"Vocês/Eles/Elas {stem}am",
+            "PAST:", f"Eu {stem}ei", f"Você/Ele/Ela {stem}ou", f"Nós {stem}amos", f"Vocês/Eles/Elas {stem}aram",
+            "FUTURE:", f"Eu {stem}arei", f"Você/Ele/Ela {stem}ará", f"Nós {stem}aremos", f"Vocês/Eles/Elas {stem}arão",
+            "---",
+        ]))
+    return "\n".join(blocks)
+
+def best_time(fn):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def compare(label, old, new):
+    old_result, new_result = old(), new()
+    if old_result != new_result:
+        raise SystemExit(f"{label}: shared parser output differs from the legacy parser")
+    old_time, new_time = best_time(old), best_time(new)
+    print(f"{label:<32} legacy {old_time * 1000:8.1f}ms   shared {new_time * 1000:8.1f}ms   {old_time / new_time:5.1f}x faster   (outputs match)")
+
+def main():
+    rng = random.Random(42)
+    text, words = sentence_response(entries, rng)
+    raw = conjugation_response(entries)
+    print(f"Synthetic responses: {entries} sentence entries, {entries} verb blocks, best of {repeats} runs\n")
+
+    compare("sentences (labelled only)",
+            lambda: legacy_parse_sentences(text, words, fallback=False),
+            lambda: parsers.match_words([w.strip() for w in words], parsers.parse_sentence_response(text)))
+    compare("sentence (with fallback scan)",
+            lambda: legacy_parse_sentences(text, words, fallback=True),
+            lambda: parsers.match_words([w.strip() for w in words], parsers.parse_sentence_response(text), fallback=True))
+    compare("conjugations",
+            lambda: legacy_parse_conjugations(raw),
+            lambda: parsers.parse_conjugation_response(raw, tenses))
+
+if __name__ == "__main__":
+    main()
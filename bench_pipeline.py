@@ -0,0 +1,550 @@
+import argparse
+import ast
+import atexit
+import csv
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import parsers
+import random
+import re
+import shards
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# End-to-end benchmark for words.py, sentence.py, sentences.py and verbs.py that never touches a paid API.
+# A local HTTP server stands in for OpenAI's chat completions endpoint (the scripts' own openai client is pointed at it
+# through OPENAI_BASE_URL) and in-process fakes replace gTTS and Google Cloud TTS. Both have configurable latency,
+# error rate and 429 injection. Each script runs as a child process in a scratch folder on a synthetic vocabulary,
+# with its caches redirected there too, and we report wall time, requests, retries, TTS calls and peak RSS.
+# The scripts' own counters (metrics.py) are read back from their event log and included in --json output.
+#
+#   python bench_pipeline.py                                  # every script on 100, 10k and 100k pairs
+#   python bench_pipeline.py --scripts verbs --sizes 10000 --llm-429-rate 0.1
+#   python bench_pipeline.py --scripts sentences --set async_mode=True --runs 2   # the second run shows the caches
+#   python bench_pipeline.py --scripts verbs --llm-format-error-rate 0.05 --set structured_output=True
+#   python bench_pipeline.py --scripts sentence --sizes 300 --llm-latency 5 --set stream_responses=True   # 'first entry' column
+#   python bench_pipeline.py --scripts sentences verbs --sizes 2000 --workers 4 [--claim]   # sharded run, parts merged after
+#
+# Module-level settings (and verbs.py's config keys) can be changed with --set, without editing the scripts.
+
+scripts = ['words', 'sentence', 'sentences', 'verbs']
+sizes = [100, 10000, 100000]
+verb_share = 0.05 # Fraction of the synthetic vocabulary that is "to ..." verbs
+irregular_share = 0.2 # Fraction of those verbs conjugate.py can't handle, so verbs.py sends them to the API
+sharded_scripts = ['sentences', 'verbs'] # The scripts --workers applies to
+script_overrides = { # Keep the scripts inside the scratch folder; everything else runs with its real settings
+    'words': {'en_folder': 'media', 'pt_folder': 'media', 'tts_rate': 0}, # Real gTTS limits would make 100k pairs take hours
+}
+error_markers = ('Traceback', 'No module named', 'An error occurred during the API call', 'Error processing batch', 'writing failed')
+stream_first_share = 0.1 # Streamed answers: share of the latency before the first token, the rest is spread over the text
+stream_piece = 16 # Characters per streamed chunk, a few tokens like the real API sends
+sentence_request = re.compile(r'for each of the following words: (.*?)\.\n')
+verb_request = re.compile(r'Verbs to conjugate: (.*)')
+
+def letters(number): # 0 -> 'a', 25 -> 'z', 26 -> 'ba', ... so synthetic words are plain lowercase text
+    text = ''
+    while True:
+        number, digit = divmod(number, 26)
+        text = chr(ord('a') + digit) + text
+        if not number:
+            return text
+
+def write_vocabulary(folder, size, seed=42, script='words'):
+    # 'PT 9-27 Fix.csv' (with a header) for words.py, 'filtered.csv' for the other scripts. words.py gets no filtered.csv,
+    # otherwise it would seed its store from it and find no new pairs
+    rng = random.Random(seed)
+    rows = []
+    for i in range(size):
+        stem = letters(i + 26 * 26)
+        if rng.random() < verb_share:
+            ending = 'uir' if rng.random() < irregular_share else rng.choice(['ar', 'er', 'ir'])
+            rows.append((f"to {stem}", f"{stem}{ending}"))
+        else:
+            rows.append((f"{stem} thing", f"coisa {stem}"))
+    name = 'PT 9-27 Fix.csv' if script == 'words' else 'filtered.csv'
+    with open(os.path.join(folder, name), 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        if script == 'words':
+            writer.writerow(['English', 'Portuguese'])
+        writer.writerows(rows)
+
+subjects = [('I', 'Eu'), ('My sister', 'Minha irmã'), ('The teacher', 'O professor'), ('We', 'Nós'), ('Our neighbor', 'Nosso vizinho'),
+            ('The children', 'As crianças'), ('Grandpa', 'O vovô'), ('Nobody', 'Ninguém')]
+verbs = [('saw', 'viu'), ('bought', 'comprou'), ('painted', 'pintou'), ('forgot', 'esqueceu'), ('found', 'achou'), ('wanted', 'quis'),
+         ('cleaned', 'limpou'), ('sold', 'vendeu')]
+places = [('at home', 'em casa'), ('in the park', 'no parque'), ('at school', 'na escola'), ('downtown', 'no centro'),
+          ('by the river', 'perto do rio'), ('at the market', 'no mercado'), ('upstairs', 'lá em cima'), ('at work', 'no trabalho')]
+times = [('today', 'hoje'), ('every morning', 'toda manhã'), ('after dinner', 'depois do jantar'), ('on Sunday', 'no domingo'),
+         ('again', 'de novo'), ('last year', 'no ano passado'), ('at noon', 'ao meio-dia'), ('in winter', 'no inverno')]
+
+def sentence_answer(words, drop, garble, structured=False, attempt=lambda word: 0):
+    # Varied per word and per time the word was asked, so sentence_index.py doesn't reject the synthetic answers as repeats
+    # of each other or of an earlier run's. garble() mangles one text entry the way real answers sometimes are (a renamed
+    # label); structured answers are schema-valid by construction
+    lines, entries = [], []
+    for word in words:
+        if drop():
+            continue
+        rng = random.Random(f"{word}:{attempt(word)}")
+        (en_subject, pt_subject), (en_verb, pt_verb), (en_place, pt_place), (en_time, pt_time) = [rng.choice(options) for options in (subjects, verbs, places, times)]
+        en, pt = f"{en_subject} {en_verb} the {word} {en_place} {en_time}.", f"{pt_subject} {pt_verb} a {word} {pt_place} {pt_time}."
+        entries.append({'word': word, 'en': en, 'pt': pt})
+        lines += [f"{len(lines) // 3 + 1}. WORD: {word}", f"{'English' if not structured and garble() else 'EN'}: {en}", f"PT: {pt}"]
+    return json.dumps({'sentences': entries}, ensure_ascii=False) if structured else "\n".join(lines)
+
+def verb_answer(verbs, drop, garble, structured=False):
+    blocks, entries = [], []
+    for verb in verbs:
+        if drop():
+            continue
+        stem = verb[:-2]
+        forms = {
+            'present': [f"{stem}o", f"{stem}e", f"{stem}imos", f"{stem}em"],
+            'past': [f"{stem}i", f"{stem}iu", f"{stem}imos", f"{stem}iram"],
+            'future': [f"{verb}ei", f"{verb}á", f"{verb}emos", f"{verb}ão"],
+        }
+        entries.append({'verb': verb, **{tense: dict(zip(parsers.persons, conjugated)) for tense, conjugated in forms.items()}})
+        lines = [f"VERB: {verb}"]
+        for tense, conjugated in forms.items():
+            lines.append(f"{tense.upper()} TENSE:" if not structured and garble() else f"{tense.upper()}:")
+            lines += [f"{pronoun} {form}" for pronoun, form in zip(['Eu', 'Você/Ele/Ela', 'Nós', 'Vocês/Eles/Elas'], conjugated)]
+        blocks.append("\n".join(lines + ["---"]))
+    return json.dumps({'verbs': entries}, ensure_ascii=False) if structured else "\n".join(blocks)
+
+class FakeOpenAI(ThreadingHTTPServer):
+    # Answers POST /v1/chat/completions in the formats the scripts' prompts ask for
+    daemon_threads = True
+
+    def __init__(self, latency=0.2, error_rate=0.0, rate_429=0.0, drop_rate=0.0, format_error_rate=0.0, seed=42):
+        super().__init__(('127.0.0.1', 0), FakeOpenAIHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.drop_rate = drop_rate
+        self.format_error_rate = format_error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.asked = {} # Word -> times a sentence was asked for it, across runs
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {'requests': 0, 'retries': 0, 'errors': 0, 'rate_limited': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+            self.seen = set()
+
+    def roll(self, rate):
+        with self.lock:
+            return self.rng.random() < rate
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def record_prompt(self, prompt): # A prompt we have answered before means the client or the script retried
+        digest = hashlib.sha256(prompt.encode('utf-8')).digest()
+        with self.lock:
+            self.stats['requests'] += 1
+            if digest in self.seen:
+                self.stats['retries'] += 1
+            self.seen.add(digest)
+
+    def attempt(self, word):
+        with self.lock:
+            self.asked[word] = self.asked.get(word, 0) + 1
+            return self.asked[word] - 1
+
+    def answer(self, prompt, structured=False):
+        drop, garble = lambda: self.roll(self.drop_rate), lambda: self.roll(self.format_error_rate)
+        match = verb_request.search(prompt)
+        if match:
+            return verb_answer([verb.strip() for verb in match.group(1).split(',') if verb.strip()], drop, garble, structured)
+        match = sentence_request.search(prompt)
+        if match:
+            return sentence_answer([word.strip() for word in match.group(1).split(',') if word.strip()], drop, garble, structured, self.attempt)
+        return ''
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args): # Keep the benchmark output readable
+        pass
+
+    def reply(self, status, body, headers=()):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        prompt = "\n".join(str(message.get('content', '')) for message in request.get('messages', []))
+        server.record_prompt(prompt)
+        latency = server.latency * (0.5 + server.rng.random()) # +/-50% jitter around the configured latency
+        time.sleep(latency * stream_first_share if request.get('stream') else latency)
+
+        if server.roll(server.rate_429):
+            server.count('rate_limited')
+            return self.reply(429, {'error': {'message': 'Rate limit reached (benchmark)', 'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                              [('retry-after-ms', '200'), ('x-ratelimit-reset-requests', '200ms')])
+        if server.roll(server.error_rate):
+            server.count('errors')
+            return self.reply(500, {'error': {'message': 'Injected server error (benchmark)', 'type': 'server_error'}})
+
+        content = server.answer(prompt, (request.get('response_format') or {}).get('type') == 'json_schema')
+        finish_reason = 'stop'
+        max_tokens = request.get('max_tokens') or request.get('max_completion_tokens')
+        if max_tokens and len(content) // 4 > max_tokens: # Cut off at the token limit like the real API
+            content, finish_reason = content[:max_tokens * 4], 'length'
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+        server.count('prompt_tokens', prompt_tokens)
+        server.count('completion_tokens', completion_tokens)
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens}
+        if request.get('stream'):
+            return self.stream(request, content, usage, latency * (1 - stream_first_share), finish_reason)
+        self.reply(200, {
+            'id': f"chatcmpl-bench-{time.monotonic_ns()}", 'object': 'chat.completion', 'created': int(time.time()),
+            'model': request.get('model', 'bench'), 'system_fingerprint': None,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'logprobs': None, 'finish_reason': finish_reason}],
+            'usage': usage,
+        })
+
+    def stream(self, request, content, usage, duration, finish_reason='stop'):
+        # Server-sent events like the real API: content deltas spread evenly over 'duration', then the usage chunk
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers() # HTTP/1.0, so closing the connection ends the stream
+        base = {'id': f"chatcmpl-bench-{time.monotonic_ns()}", 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                'model': request.get('model', 'bench'), 'system_fingerprint': None}
+        def send(choices, **extra):
+            self.wfile.write(f"data: {json.dumps(dict(base, choices=choices, **extra))}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        pieces = [content[i:i + stream_piece] for i in range(0, len(content), stream_piece)]
+        for piece in pieces:
+            send([{'index': 0, 'delta': {'role': 'assistant', 'content': piece}, 'logprobs': None, 'finish_reason': None}])
+            time.sleep(duration / len(pieces))
+        send([{'index': 0, 'delta': {}, 'logprobs': None, 'finish_reason': finish_reason}])
+        if (request.get('stream_options') or {}).get('include_usage'):
+            send([], usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+class FakeTTS:
+    # Shared by the fake gTTS and Cloud TTS modules in the child process
+    def __init__(self, latency=0.02, error_rate=0.0, rate_429=0.0, seed=42):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'bytes': 0}
+
+    def synthesize(self, text, error):
+        with self.lock:
+            self.stats['requests'] += 1
+            roll, jitter = self.rng.random(), self.rng.random()
+        time.sleep(self.latency * (0.5 + jitter))
+        if roll < self.rate_429:
+            with self.lock:
+                self.stats['rate_limited'] += 1
+            raise error("429 (Too Many Requests) from TTS API. Probable cause: Unknown")
+        if roll < self.rate_429 + self.error_rate:
+            with self.lock:
+                self.stats['errors'] += 1
+            raise error("500 (Internal Server Error) from TTS API (benchmark)")
+        audio = b'ID3' + hashlib.sha256(text.encode('utf-8')).digest() * 64 # ~2 KB, about one short spoken word
+        with self.lock:
+            self.stats['bytes'] += len(audio)
+        return audio
+
+def install_fake_tts(tts):
+    class gTTSError(Exception):
+        pass
+
+    class gTTS:
+        def __init__(self, text, lang='en', **kwargs):
+            self.text = text
+
+        def save(self, path):
+            audio = tts.synthesize(self.text, gTTSError)
+            with open(path, 'wb') as file:
+                file.write(audio)
+
+    gtts = types.ModuleType('gtts')
+    gtts.gTTS, gtts.gTTSError = gTTS, gTTSError
+
+    class ResourceExhausted(Exception):
+        pass
+
+    class TextToSpeechClient:
+        def synthesize_speech(self, input, voice, audio_config):
+            return types.SimpleNamespace(audio_content=tts.synthesize(input.text, ResourceExhausted))
+
+    texttospeech = types.ModuleType('google.cloud.texttospeech')
+    texttospeech.TextToSpeechClient = TextToSpeechClient
+    texttospeech.SynthesisInput = texttospeech.VoiceSelectionParams = texttospeech.AudioConfig = types.SimpleNamespace
+    texttospeech.AudioEncoding = types.SimpleNamespace(MP3=2, LINEAR16=1, OGG_OPUS=3)
+
+    try:
+        import google.cloud as cloud
+    except ImportError: # google-cloud-texttospeech isn't installed; make just enough of the namespace for the import
+        google = types.ModuleType('google')
+        cloud = types.ModuleType('google.cloud')
+        google.__path__, cloud.__path__, google.cloud = [], [], cloud
+        sys.modules.update({'google': google, 'google.cloud': cloud})
+    cloud.texttospeech = texttospeech
+    sys.modules.update({'gtts': gtts, 'google.cloud.texttospeech': texttospeech})
+
+def apply_overrides(tree, overrides):
+    # Replaces top-level 'name = value' assignments and keys of a top-level 'config = {...}' dict
+    found = set()
+    for node in tree.body:
+        if not (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)):
+            continue
+        name = node.targets[0].id
+        if name in overrides:
+            node.value = ast.copy_location(ast.Constant(overrides[name]), node.value)
+            found.add(name)
+        elif name == 'config' and isinstance(node.value, ast.Dict):
+            for index, key in enumerate(node.value.keys):
+                if isinstance(key, ast.Constant) and key.value in overrides:
+                    node.value.values[index] = ast.copy_location(ast.Constant(overrides[key.value]), node.value.values[index])
+                    found.add(key.value)
+    return found
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024 # Bytes on macOS, KB on Linux
+    except ImportError: # Windows
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 1024 ** 2
+        except ImportError:
+            return None
+
+def run_child(script_path, settings):
+    # Runs inside the child process: fake TTS, overridden settings, then the script as __main__
+    tts = FakeTTS(settings['tts_latency'], settings['tts_error_rate'], settings['tts_429_rate'], settings['seed'])
+    install_fake_tts(tts)
+    status = {'error': None}
+
+    def report():
+        with open(settings['stats_file'], 'w', encoding='utf-8') as file:
+            json.dump({'tts': tts.stats, 'peak_rss_mb': peak_rss_mb(), 'error': status['error']}, file)
+    atexit.register(report)
+
+    with open(script_path, 'r', encoding='utf-8') as file:
+        tree = ast.parse(file.read(), script_path)
+    found = apply_overrides(tree, settings['overrides'])
+    unknown = set(settings['overrides']) - found
+    if unknown:
+        print(f"Warning: {os.path.basename(script_path)} has no setting named {', '.join(sorted(unknown))}")
+
+    sys.argv = [script_path] + settings['argv']
+    try:
+        exec(compile(tree, script_path, 'exec'), {'__name__': '__main__', '__file__': script_path})
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status['error'] = f"exit {e.code}"
+    except BaseException as e:
+        status['error'] = f"{type(e).__name__}: {e}"
+        raise
+
+def first_entry_ms(stages):
+    # Mean time from sending a request to having its first parsed entry. Without streaming that is the whole request
+    stage = stages.get('llm_first_entry') or stages.get('openai_request')
+    return stage['seconds'] / stage['calls'] * 1000 if stage and stage['calls'] else None
+
+def worker_args(name, args, i):
+    # --shard / --claim arguments for worker i of a sharded run, like anki_gen.py --workers passes them
+    if args.claim:
+        return ['--claim'] if name == 'verbs' else ['--claim', str(args.workers)]
+    return ['--shard', f"{i}/{args.workers}"]
+
+def run_script(name, folder, server, args, overrides, argv=()):
+    workers = args.workers if args.workers > 1 and name in sharded_scripts else 1
+    stats_files = [os.path.join(folder, f"bench_stats-{i}.json") for i in range(1, workers + 1)]
+    metrics_log = os.path.join(folder, 'metrics.jsonl')
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def start_child(i, stats_file, log):
+        settings = {
+            'overrides': dict(script_overrides.get(name, {}), **overrides), 'argv': list(argv), 'stats_file': stats_file, 'seed': args.seed,
+            'tts_latency': args.tts_latency, 'tts_error_rate': args.tts_error_rate, 'tts_429_rate': args.tts_429_rate,
+        }
+        if workers > 1:
+            settings['argv'] += worker_args(name, args, i)
+        env = dict(os.environ,
+                   OPENAI_BASE_URL=f"http://127.0.0.1:{server.server_address[1]}/v1", OPENAI_API_KEY='bench',
+                   ANKI_AUDIO_CACHE=os.path.join(folder, '.audio_cache'), ANKI_LLM_CACHE=os.path.join(folder, 'llm_cache.sqlite'),
+                   ANKI_VOCAB_DB=os.path.join(folder, 'vocabulary.sqlite'), ANKI_METRICS_LOG=metrics_log, BENCH_SETTINGS=json.dumps(settings),
+                   PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get('PYTHONPATH')])), PYTHONIOENCODING='utf-8')
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child', os.path.join(here, f"{name}.py")],
+                                cwd=folder, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    server.reset()
+    start_time = time.time()
+    for stats_file in stats_files:
+        if os.path.exists(stats_file):
+            os.remove(stats_file)
+    for path in glob.glob(os.path.join(folder, '*.ledger.sqlite')) + glob.glob(os.path.join(folder, '*.part-*.csv')): # Each run is a fresh sharded run
+        os.remove(path)
+    start = time.perf_counter()
+    logs = [open(os.path.join(folder, f"{name}.log" if workers == 1 else f"{name}.worker-{i}.log"), 'a', encoding='utf-8')
+            for i in range(1, workers + 1)] # Script output goes to a log, not our memory
+    log_sizes = [log.tell() for log in logs] # Where this run's output starts
+    children = [start_child(i, stats_file, log) for i, (stats_file, log) in enumerate(zip(stats_files, logs), 1)]
+    returncodes = [child.wait() for child in children]
+    for log in logs:
+        log.close()
+    if workers > 1:
+        merge_outputs(name, folder)
+    wall = time.perf_counter() - start
+
+    tts, peaks, errors = {}, [], []
+    for stats_file in stats_files:
+        if os.path.exists(stats_file):
+            with open(stats_file, 'r', encoding='utf-8') as file:
+                child = json.load(file)
+            for key, value in child['tts'].items():
+                tts[key] = tts.get(key, 0) + value
+            peaks.append(child['peak_rss_mb'])
+            errors.append(child['error'])
+    counters, stages = {}, {} # The scripts' own counters and stage timings from the summary events metrics.finish() logged for this run
+    if os.path.exists(metrics_log):
+        with open(metrics_log, 'r', encoding='utf-8') as file:
+            for line in file:
+                event = json.loads(line)
+                if event['event'] == 'summary' and event['ts'] >= start_time: # One per worker
+                    for key, value in event['counters'].items():
+                        counters[key] = counters.get(key, 0) + value
+                    for stage, totals in event['stages'].items():
+                        entry = stages.setdefault(stage, {'calls': 0, 'seconds': 0.0})
+                        entry['calls'] += totals['calls']
+                        entry['seconds'] += totals['seconds']
+    llm = dict(server.stats, retries=server.stats['retries'] + counters.get('retries', 0)) # Client resends plus the script's re-asks
+    failed = next((code for code in returncodes if code), 0)
+    status = next(filter(None, errors), None) or (f"exit {failed}" if failed else None) or run_problem(logs, log_sizes, llm, counters, stages) or 'ok'
+    return {
+        'script': name, 'pairs': args.current_size, 'run': args.current_run, 'workers': workers, 'wall_s': round(wall, 2),
+        'llm': llm, 'tts': tts, 'counters': counters, 'first_entry_ms': first_entry_ms(stages),
+        'peak_rss_mb': max((peak for peak in peaks if peak is not None), default=None),
+        'status': status,
+    }
+
+def run_problem(logs, log_sizes, llm, counters, stages):
+    # Why a run that exited cleanly still failed, or None: error output in its log, API work that never reached the
+    # server (e.g. every call failing on a missing package), or work that wrote no cards
+    for log, size in zip(logs, log_sizes):
+        with open(log.name, 'r', encoding='utf-8', errors='replace') as file:
+            file.seek(size)
+            for line in file:
+                if any(marker in line for marker in error_markers):
+                    return f"error: {line.strip()[:60]}"
+    if counters.get('llm_cache_misses') and not llm['requests']:
+        return "failed: 0 LLM requests"
+    if counters.get('llm_cache_hits', 0) + counters.get('llm_cache_misses', 0) and not stages.get('csv_write', {}).get('calls'):
+        return "failed: no rows written"
+    return None
+
+def merge_outputs(name, folder):
+    # What anki_gen.py --workers does once its workers finish
+    if name == 'verbs':
+        for tense in ('present', 'past', 'future'):
+            shards.merge(os.path.join(folder, f"{tense}.csv"), append=True)
+    else:
+        shards.merge(os.path.join(folder, 'sentences.csv'))
+
+def print_table(results):
+    print(f"\n{'script':<10} {'pairs':>7} {'run':>3} {'wk':>3} {'wall s':>8} {'LLM req':>8} {'retries':>8} {'bad parse':>9} {'429s':>5} {'1st entry':>9} "
+          f"{'TTS req':>8} {'TTS err':>8} {'peak MB':>8}  status")
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.0f}" if r['peak_rss_mb'] is not None else 'n/a'
+        tts, counters = r['tts'], r['counters']
+        first = f"{r['first_entry_ms']:.0f}ms" if r['first_entry_ms'] is not None else '-'
+        bad_parse = f"{counters.get('parse_failures', 0) / counters['llm_responses'] * 100:.1f}%" if counters.get('llm_responses') else '-' # Share of responses
+        print(f"{r['script']:<10} {r['pairs']:>7} {r['run']:>3} {r['workers']:>3} {r['wall_s']:>8.1f} {r['llm']['requests']:>8} {r['llm']['retries']:>8} {bad_parse:>9} "
+              f"{r['llm']['rate_limited']:>5} {first:>9} {tts.get('requests', 0):>8} {tts.get('errors', 0) + tts.get('rate_limited', 0):>8} {rss:>8}  {r['status']}")
+
+def parse_value(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text # Plain strings don't need quotes
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the card generation scripts against local OpenAI and TTS stand-ins.")
+    parser.add_argument('--scripts', nargs='+', choices=scripts, default=scripts)
+    parser.add_argument('--sizes', nargs='+', type=int, default=sizes, help="Synthetic vocabulary sizes (pairs)")
+    parser.add_argument('--runs', type=int, default=1, help="Runs per script and size in the same folder; later runs start with warm caches")
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', help="Override a script setting, e.g. async_mode=True (repeatable)")
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="Mean seconds per chat completion")
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help="Share of requests answered with a 500")
+    parser.add_argument('--llm-429-rate', type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument('--llm-drop-rate', type=float, default=0.0, help="Share of requested items left out of an answer")
+    parser.add_argument('--llm-format-error-rate', type=float, default=0.0,
+                        help="Share of text-format entries with a mangled label (structured_output=True answers are never mangled)")
+    parser.add_argument('--tts-latency', type=float, default=0.02, help="Mean seconds per synthesized clip")
+    parser.add_argument('--tts-error-rate', type=float, default=0.0)
+    parser.add_argument('--tts-429-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=1, help="Run sentences.py and verbs.py as this many sharded worker processes")
+    parser.add_argument('--claim', action='store_true', help="With --workers, claim words from the work ledger instead of hash shards")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Also write the results to this file, for comparing runs")
+    parser.add_argument('--keep', action='store_true', help="Keep the scratch folders (logs, CSVs, audio)")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args.child, json.loads(os.environ['BENCH_SETTINGS']))
+
+    if importlib.util.find_spec('openai') is None: # The scripts need the real client; without it every LLM call fails and the runs would measure nothing
+        parser.error("the 'openai' package is not installed (pip install openai)")
+
+    overrides = dict(item.split('=', 1) for item in args.set)
+    overrides = {name.strip(): parse_value(value) for name, value in overrides.items()}
+    server = FakeOpenAI(args.llm_latency, args.llm_error_rate, args.llm_429_rate, args.llm_drop_rate, args.llm_format_error_rate, args.seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    root = tempfile.mkdtemp(prefix='anki-bench-')
+    print(f"Fake OpenAI server on port {server.server_address[1]}, scratch folder '{root}'")
+
+    results = []
+    try:
+        for size in args.sizes:
+            for name in args.scripts:
+                folder = os.path.join(root, f"{name}-{size}")
+                for subfolder in ('media', 'EN_', 'PT_'):
+                    os.makedirs(os.path.join(folder, subfolder), exist_ok=True)
+                write_vocabulary(folder, size, args.seed, name)
+                for run in range(1, args.runs + 1):
+                    args.current_size, args.current_run = size, run
+                    result = run_script(name, folder, server, args, overrides)
+                    results.append(result)
+                    print(f"{name} on {size} pairs, run {run}: {result['wall_s']:.1f}s, {result['llm']['requests']} LLM requests, "
+                          f"{result['tts'].get('requests', 0)} TTS requests, {result['status']}")
+                if not args.keep:
+                    shutil.rmtree(folder, ignore_errors=True)
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == "__main__":
+    main()
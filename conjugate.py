@@ -0,0 +1,128 @@
+import re
+
+# Local conjugation of Portuguese verbs for verbs.py. Regular -ar/-er/-ir verbs (plus the spelling changes of -car,
+# -gar, -çar, -cer, -ger, -gir and -ear) are conjugated by rule, common irregular verbs come from the table below,
+# and anything we can't be sure about returns None so verbs.py still sends it to the LLM.
+# Forms are in the order verbs.py uses: Eu, Você/Ele/Ela, Nós, Vocês/Eles/Elas.
+
+endings = {
+    'ar': {'present': ['o', 'a', 'amos', 'am'], 'past': ['ei', 'ou', 'amos', 'aram']},
+    'er': {'present': ['o', 'e', 'emos', 'em'], 'past': ['i', 'eu', 'emos', 'eram']},
+    'ir': {'present': ['o', 'e', 'imos', 'em'], 'past': ['i', 'iu', 'imos', 'iram']},
+}
+future_endings = ['ei', 'á', 'emos', 'ão'] # Added to the whole infinitive
+
+irregular = { # Only the tenses that differ from the regular pattern are listed
+    'ser': {'present': ['sou', 'é', 'somos', 'são'], 'past': ['fui', 'foi', 'fomos', 'foram']},
+    'estar': {'present': ['estou', 'está', 'estamos', 'estão'], 'past': ['estive', 'esteve', 'estivemos', 'estiveram']},
+    'ter': {'present': ['tenho', 'tem', 'temos', 'têm'], 'past': ['tive', 'teve', 'tivemos', 'tiveram']},
+    'manter': {'present': ['mantenho', 'mantém', 'mantemos', 'mantêm'], 'past': ['mantive', 'manteve', 'mantivemos', 'mantiveram']},
+    'obter': {'present': ['obtenho', 'obtém', 'obtemos', 'obtêm'], 'past': ['obtive', 'obteve', 'obtivemos', 'obtiveram']},
+    'conter': {'present': ['contenho', 'contém', 'contemos', 'contêm'], 'past': ['contive', 'conteve', 'contivemos', 'contiveram']},
+    'ir': {'present': ['vou', 'vai', 'vamos', 'vão'], 'past': ['fui', 'foi', 'fomos', 'foram']},
+    'fazer': {'present': ['faço', 'faz', 'fazemos', 'fazem'], 'past': ['fiz', 'fez', 'fizemos', 'fizeram'], 'future': ['farei', 'fará', 'faremos', 'farão']},
+    'dizer': {'present': ['digo', 'diz', 'dizemos', 'dizem'], 'past': ['disse', 'disse', 'dissemos', 'disseram'], 'future': ['direi', 'dirá', 'diremos', 'dirão']},
+    'trazer': {'present': ['trago', 'traz', 'trazemos', 'trazem'], 'past': ['trouxe', 'trouxe', 'trouxemos', 'trouxeram'], 'future': ['trarei', 'trará', 'traremos', 'trarão']},
+    'poder': {'present': ['posso', 'pode', 'podemos', 'podem'], 'past': ['pude', 'pôde', 'pudemos', 'puderam']},
+    'querer': {'present': ['quero', 'quer', 'queremos', 'querem'], 'past': ['quis', 'quis', 'quisemos', 'quiseram']},
+    'saber': {'present': ['sei', 'sabe', 'sabemos', 'sabem'], 'past': ['soube', 'soube', 'soubemos', 'souberam']},
+    'caber': {'present': ['caibo', 'cabe', 'cabemos', 'cabem'], 'past': ['coube', 'coube', 'coubemos', 'couberam']},
+    'haver': {'present': ['hei', 'há', 'havemos', 'hão'], 'past': ['houve', 'houve', 'houvemos', 'houveram']},
+    'ver': {'present': ['vejo', 'vê', 'vemos', 'veem'], 'past': ['vi', 'viu', 'vimos', 'viram']},
+    'vir': {'present': ['venho', 'vem', 'vimos', 'vêm'], 'past': ['vim', 'veio', 'viemos', 'vieram']},
+    'dar': {'present': ['dou', 'dá', 'damos', 'dão'], 'past': ['dei', 'deu', 'demos', 'deram']},
+    'pôr': {'present': ['ponho', 'põe', 'pomos', 'põem'], 'past': ['pus', 'pôs', 'pusemos', 'puseram'], 'future': ['porei', 'porá', 'poremos', 'porão']},
+    'ler': {'present': ['leio', 'lê', 'lemos', 'leem']},
+    'crer': {'present': ['creio', 'crê', 'cremos', 'creem']},
+    'valer': {'present': ['valho', 'vale', 'valemos', 'valem']},
+    'perder': {'present': ['perco', 'perde', 'perdemos', 'perdem']},
+    'ouvir': {'present': ['ouço', 'ouve', 'ouvimos', 'ouvem']},
+    'pedir': {'present': ['peço', 'pede', 'pedimos', 'pedem']},
+    'medir': {'present': ['meço', 'mede', 'medimos', 'medem']},
+    'dormir': {'present': ['durmo', 'dorme', 'dormimos', 'dormem']},
+    'cobrir': {'present': ['cubro', 'cobre', 'cobrimos', 'cobrem']},
+    'descobrir': {'present': ['descubro', 'descobre', 'descobrimos', 'descobrem']},
+    'tossir': {'present': ['tusso', 'tosse', 'tossimos', 'tossem']},
+    'sentir': {'present': ['sinto', 'sente', 'sentimos', 'sentem']},
+    'mentir': {'present': ['minto', 'mente', 'mentimos', 'mentem']},
+    'preferir': {'present': ['prefiro', 'prefere', 'preferimos', 'preferem']},
+    'sugerir': {'present': ['sugiro', 'sugere', 'sugerimos', 'sugerem']},
+    'repetir': {'present': ['repito', 'repete', 'repetimos', 'repetem']},
+    'competir': {'present': ['compito', 'compete', 'competimos', 'competem']},
+    'divertir': {'present': ['divirto', 'diverte', 'divertimos', 'divertem']},
+    'vestir': {'present': ['visto', 'veste', 'vestimos', 'vestem']},
+    'servir': {'present': ['sirvo', 'serve', 'servimos', 'servem']},
+    'seguir': {'present': ['sigo', 'segue', 'seguimos', 'seguem']},
+    'conseguir': {'present': ['consigo', 'consegue', 'conseguimos', 'conseguem']},
+    'subir': {'present': ['subo', 'sobe', 'subimos', 'sobem']},
+    'consumir': {'present': ['consumo', 'consome', 'consumimos', 'consomem']},
+    'fugir': {'present': ['fujo', 'foge', 'fugimos', 'fogem']},
+    'proibir': {'present': ['proíbo', 'proíbe', 'proibimos', 'proíbem']},
+    'reunir': {'present': ['reúno', 'reúne', 'reunimos', 'reúnem']},
+    'odiar': {'present': ['odeio', 'odeia', 'odiamos', 'odeiam']},
+    'rir': {'present': ['rio', 'ri', 'rimos', 'riem'], 'past': ['ri', 'riu', 'rimos', 'riram']},
+    'sorrir': {'present': ['sorrio', 'sorri', 'sorrimos', 'sorriem'], 'past': ['sorri', 'sorriu', 'sorrimos', 'sorriram']},
+    'sair': {'present': ['saio', 'sai', 'saímos', 'saem'], 'past': ['saí', 'saiu', 'saímos', 'saíram']},
+    'cair': {'present': ['caio', 'cai', 'caímos', 'caem'], 'past': ['caí', 'caiu', 'caímos', 'caíram']},
+    'construir': {'present': ['construo', 'constrói', 'construímos', 'constroem'], 'past': ['construí', 'construiu', 'construímos', 'construíram']},
+    'destruir': {'present': ['destruo', 'destrói', 'destruímos', 'destroem'], 'past': ['destruí', 'destruiu', 'destruímos', 'destruíram']},
+    'incluir': {'present': ['incluo', 'inclui', 'incluímos', 'incluem'], 'past': ['incluí', 'incluiu', 'incluímos', 'incluíram']},
+}
+
+# Endings and verbs whose patterns we don't model; these go to the LLM
+unknown_endings = ('zer', 'zir', 'uir', 'air', 'oer', 'guir', 'guer', 'guar', 'vir', 'cir', 'quir')
+unknown_verbs = {'deter', 'reter', 'entreter', 'abster', 'suster', 'ater', 'prever', 'rever', 'antever', 'requerer', 'prover',
+                 'ansiar', 'remediar', 'incendiar', 'mediar', 'intermediar', 'saudar', 'arruinar', 'enraizar', 'progredir',
+                 'agredir', 'transgredir', 'despir', 'ferir', 'aderir', 'advertir', 'convertir', 'inverter', 'investir',
+                 'refletir', 'digerir', 'conferir', 'referir', 'transferir', 'interferir', 'inserir', 'consentir', 'engolir',
+                 'acudir', 'sacudir', 'cuspir', 'sumir', 'entupir', 'bulir', 'polir', 'frigir', 'reler', 'equivaler'}
+regular_ir = {'assumir', 'resumir', 'presumir', 'cumprir', 'discutir', 'unir', 'curtir', 'punir', 'nutrir', 'surgir',
+              'iludir', 'aludir', 'incumbir', 'imergir', 'emergir', 'submergir', 'urgir', 'fundir', 'confundir', 'difundir'} # -ir verbs with e/o/u stems that are regular anyway
+word_pattern = re.compile(r'^[a-zçáéíóúâêôãõ]+$')
+
+def regular_forms(verb, tense):
+    stem, group = verb[:-2], verb[-2:]
+    if tense == 'future':
+        return [verb + ending for ending in future_endings]
+    forms = [stem + ending for ending in endings[group][tense]]
+
+    if tense == 'present':
+        if verb.endswith('ear'): # passear -> passeio, passeia, passeamos, passeiam
+            forms = [stem + 'io', stem + 'ia', stem + 'amos', stem + 'iam']
+        elif verb.endswith('cer'): # conhecer -> conheço
+            forms[0] = stem[:-1] + 'ço'
+        elif verb.endswith(('ger', 'gir')): # proteger -> protejo, dirigir -> dirijo
+            forms[0] = stem[:-1] + 'jo'
+    elif tense == 'past':
+        if verb.endswith('car'): # ficar -> fiquei
+            forms[0] = stem[:-1] + 'quei'
+        elif verb.endswith('gar'): # chegar -> cheguei
+            forms[0] = stem + 'uei'
+        elif verb.endswith('çar'): # começar -> comecei
+            forms[0] = stem[:-1] + 'cei'
+    return forms
+
+def stem_vowel(stem):
+    vowels = [c for c in stem if c in 'aeiou']
+    return vowels[-1] if vowels else ''
+
+def is_known(verb):
+    if verb in irregular:
+        return True
+    if not word_pattern.match(verb) or verb[-2:] not in endings or verb in unknown_verbs or verb.endswith(unknown_endings):
+        return False
+    if verb.endswith('ir') and stem_vowel(verb[:-2]) in 'eou' and verb not in regular_ir:
+        return False # Many -ir verbs with e/o/u stems change their vowel (sentir -> sinto, subir -> sobe)
+    return True
+
+def conjugate(verb, tenses=('present', 'past', 'future')):
+    # Returns {tense: {'html', 'gTTS'}} like verbs.parse_conjugations, or None if the verb isn't one we can do locally
+    verb = verb.strip().lower()
+    if not is_known(verb):
+        return None
+
+    conjugations = {}
+    for tense in tenses:
+        forms = irregular.get(verb, {}).get(tense) or regular_forms(verb, tense)
+        conjugations[tense] = {'html': "<br>".join(forms), 'gTTS': ", ".join(forms)} # Add <br> for Anki and , for gTTS
+    return conjugations
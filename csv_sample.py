@@ -0,0 +1,191 @@
+import argparse
+import csv
+import io
+import math
+import os
+import random
+import struct
+import tempfile
+import time
+import tracemalloc
+from itertools import islice
+
+# Sampling rows from vocabulary CSVs too big to load. RowStream reads a CSV one row at a time, reservoir() keeps a uniform
+# sample of k rows from any stream in one pass with O(k) memory, and RowIndex is an optional '<csv>.rows' file of row
+# byte offsets that lets a uniform sample seek straight to k rows without reading the rest of the file.
+#   python csv_sample.py index filtered.csv     build (or refresh) the row index
+#   python csv_sample.py bench --rows 1000000   compare list() + random.sample, the reservoir and the index
+
+header = struct.Struct('<8sQQQ') # magic, CSV size, CSV mtime_ns, row count; then one little-endian uint64 offset per row
+magic = b'ANKIROW1'
+offset_size = 8
+
+class RowStream:
+    # Iterates the non-empty rows of a CSV and counts them, so callers can report the total without keeping the rows
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+
+    def __iter__(self):
+        self.count = 0
+        with open(self.path, 'r', newline='', encoding='utf-8') as file:
+            for row in csv.reader(file):
+                if row:
+                    self.count += 1
+                    yield row
+
+def unit(rng): # Uniform on (0, 1); random() can return exactly 0.0, which log() can't take
+    return rng.random() or 0.5
+
+def reservoir(rows, k, rng=random):
+    # Li's Algorithm L: fill the reservoir with the first k rows, then jump straight to the next row that replaces one.
+    # Rows in between are only read past, so a large file costs one pass and a few hundred random numbers
+    rows = iter(rows)
+    sample = list(islice(rows, k))
+    if len(sample) < k or k <= 0:
+        rng.shuffle(sample)
+        return sample
+    w = math.exp(math.log(unit(rng)) / k)
+    while True:
+        skip = math.floor(math.log(unit(rng)) / math.log1p(-w)) if w < 1 else 0
+        row = next(islice(rows, skip, None), None)
+        if row is None:
+            rng.shuffle(sample) # The first k rows would otherwise keep their file order
+            return sample
+        sample[rng.randrange(k)] = row
+        w *= math.exp(math.log(unit(rng)) / k)
+
+def index_path(csv_path):
+    return f"{csv_path}.rows"
+
+def csv_stamp(csv_path):
+    stat = os.stat(csv_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def build_index(csv_path):
+    # One binary pass over the CSV. A record continues onto the next line while its quote count is odd (a quoted field
+    # with a line break in it); blank lines are skipped like RowStream skips them. Returns the number of rows
+    path = index_path(csv_path)
+    tmp = f"{path}.tmp"
+    count = offset = 0
+    pending = None # Start of a record that is still inside a quoted field
+    chunk = []
+    with open(csv_path, 'rb') as source, open(tmp, 'wb') as out:
+        out.write(header.pack(magic, 0, 0, 0))
+        for line in source:
+            if pending is None and line.strip(b'\r\n'):
+                if line.count(b'"') % 2:
+                    pending = offset
+                else:
+                    chunk.append(offset)
+            elif pending is not None and line.count(b'"') % 2:
+                chunk.append(pending)
+                pending = None
+            offset += len(line)
+            if len(chunk) >= 65536:
+                out.write(struct.pack(f'<{len(chunk)}Q', *chunk))
+                count += len(chunk)
+                chunk = []
+        if pending is not None: # Unterminated quote at the end of the file; csv.reader reads it as one last row
+            chunk.append(pending)
+        out.write(struct.pack(f'<{len(chunk)}Q', *chunk))
+        count += len(chunk)
+        out.seek(0)
+        out.write(header.pack(magic, *csv_stamp(csv_path), count))
+    os.replace(tmp, path) # Never leave a half-written index behind
+    return count
+
+class RowIndex:
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.index = open(index_path(csv_path), 'rb')
+        self.csv = open(csv_path, 'rb')
+        _, self.size, self.mtime_ns, self.count = header.unpack(self.index.read(header.size))
+
+    @classmethod
+    def load(cls, csv_path):
+        # The index for csv_path, or None if there isn't one or the CSV has changed since it was built
+        if not os.path.exists(index_path(csv_path)):
+            return None
+        with open(index_path(csv_path), 'rb') as file:
+            data = file.read(header.size)
+        if len(data) < header.size or header.unpack(data)[0] != magic or header.unpack(data)[1:3] != csv_stamp(csv_path):
+            print(f"Row index '{index_path(csv_path)}' is out of date; reading '{csv_path}' in full. Run 'python csv_sample.py index {csv_path}' to refresh it.")
+            return None
+        return cls(csv_path)
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def row(self, i):
+        self.index.seek(header.size + i * offset_size)
+        self.csv.seek(struct.unpack('<Q', self.index.read(offset_size))[0])
+        lines = [self.csv.readline()]
+        while sum(line.count(b'"') for line in lines) % 2 and lines[-1]:
+            lines.append(self.csv.readline())
+        return next(csv.reader(io.StringIO(b''.join(lines).decode('utf-8'), newline='')))
+
+    def sample(self, k, rng=random):
+        # k distinct rows, uniformly, with k seeks; the offsets are visited in file order
+        picked = rng.sample(range(self.count), min(k, self.count))
+        rows = {i: self.row(i) for i in sorted(picked)}
+        return [rows[i] for i in picked]
+
+    def close(self):
+        self.index.close()
+        self.csv.close()
+
+def measure(label, function):
+    # Timed on its own first, since tracemalloc slows allocation-heavy code down several times over
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<34} {elapsed:8.2f}s  {peak / 1024 / 1024:8.1f} MB peak")
+    return result
+
+def bench(rows=1000000, k=100):
+    rng = random.Random(3)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'filtered.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerows((f"word {i} (note)", f"palavra {i}") for i in range(rows))
+        print(f"{rows} rows, {os.path.getsize(path) / 1024 / 1024:.0f} MB, sampling {k}:")
+
+        def load_all():
+            with open(path, 'r', encoding='utf-8') as file:
+                return random.sample(list(csv.reader(file)), k)
+        measure("list(csv.reader) + random.sample", load_all)
+        measure("reservoir over RowStream", lambda: reservoir(RowStream(path), k, rng))
+        measure("build row index", lambda: build_index(path))
+        def indexed():
+            with RowIndex.load(path) as row_index:
+                return row_index.sample(k, rng)
+        measure("sample through row index", indexed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build row indexes for large CSVs and benchmark sampling from them.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('index', help="Build or refresh '<csv>.rows'").add_argument('csv', nargs='?', default='filtered.csv')
+    bench_parser = sub.add_parser('bench', help="Time and measure the sampling strategies on a synthetic CSV")
+    bench_parser.add_argument('--rows', type=int, default=1000000)
+    bench_parser.add_argument('-k', type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == 'index':
+        start = time.perf_counter()
+        print(f"Indexed {build_index(args.csv)} rows of '{args.csv}' in {time.perf_counter() - start:.1f}s.")
+    else:
+        bench(args.rows, args.k)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import asyncio
+import metrics
+import random
+import time
+from batcher import count_tokens
+
+# Concurrent batch dispatch for sentence.py and sentences.py. Instead of fixed sleeps between batches, up to
+# 'max_in_flight' batches run at once, paced by a requests-per-minute and tokens-per-minute limiter, and we only
+# back off when the API actually answers with a 429. openai is imported when a dispatch starts. Point OPENAI_BASE_URL at a local stub server to test it offline.
+# A request's token estimate comes from the same TokenBatcher that packed the batches (its prompt counts and per-item
+# completion estimate), so the limiter and the batch sizes agree.
+
+class Bucket:
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        self.refill()
+        amount = min(amount, self.capacity) # A single oversized request must still be able to go through
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+class RateLimiter:
+    # Shared by every in-flight batch. A request only starts once both buckets have room for it
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = Bucket(requests_per_minute)
+        self.tokens = Bucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens):
+        async with self.lock:
+            while True:
+                wait = max(self.paused_until - time.monotonic(), self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait <= 0:
+                    self.requests.level -= 1
+                    self.tokens.level -= min(tokens, self.tokens.capacity)
+                    return
+                await asyncio.sleep(wait)
+
+    def charge(self, extra_tokens): # Correct our estimate once the response reports its real usage
+        self.tokens.level -= extra_tokens
+
+    def pause(self, seconds): # After a 429, hold back every batch rather than just the one that was rejected
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+def retry_after(error):
+    try:
+        return float(error.response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+class Dispatcher:
+    def __init__(self, build_prompt, parse, model, batcher, max_in_flight=4, requests_per_minute=500, tokens_per_minute=30000,
+                 max_retries=2, max_429_retries=6, client=None, on_results=None, request_options=None):
+        self.build_prompt = build_prompt # words -> prompt string
+        self.parse = parse # (response text, words) -> (found_pairs, missing_words)
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.max_429_retries = max_429_retries
+        self.client = client
+        self.on_results = on_results # Optional callback that receives each finished batch instead of collecting them
+        self.batcher = batcher # The TokenBatcher that planned the batches: token estimates, and truncated responses go back to it
+        self.request_options = request_options or {} # Extra create() arguments, e.g. a structured output response_format
+        self.requests = 0
+        self.rate_limited = 0
+
+    async def complete(self, words):
+        # (found pairs, missing words, finish_reason)
+        prompt = self.build_prompt(words)
+        estimate = count_tokens(prompt, self.model) + int(self.batcher.completion_tokens_per_item * len(words))
+
+        for attempt in range(self.max_429_retries + 1):
+            await self.limiter.acquire(estimate)
+            try:
+                self.requests += 1
+                with metrics.timer('openai_request'):
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[{"role": "user", "content": prompt}],
+                        **self.request_options
+                    )
+            except self.rate_limit_error as e:
+                self.rate_limited += 1
+                metrics.count('rate_limited')
+                if attempt == self.max_429_retries:
+                    raise
+                delay = retry_after(e) or min(60.0, 2 ** attempt) + random.uniform(0, 1)
+                print(f"Rate limited (429), backing off {delay:.1f}s")
+                self.limiter.pause(delay)
+                continue
+
+            metrics.record_usage(response)
+            usage = getattr(response, 'usage', None)
+            if usage and usage.total_tokens:
+                self.limiter.charge(usage.total_tokens - estimate)
+            found, missing = self.parse((response.choices[0].message.content or "").strip(), words)
+            return found, missing, response.choices[0].finish_reason
+
+    async def run_batch(self, batch_num, num_batches, batch):
+        async with self.slots:
+            print(f"\n--- Starting Batch {batch_num} of {num_batches} ---")
+            results = []
+            try:
+                found, missing, finish_reason = await self.complete(batch)
+                print(f"DEBUG: API call for Batch {batch_num} returned {len(found)} successful pairs and {len(missing)} missing words.")
+                self.batcher.record(batch, missing, finish_reason)
+                results.extend(found)
+
+                retry_count = 0 # Retry missing words right away; pacing is the limiter's job
+                while missing and retry_count < self.max_retries:
+                    retry_count += 1
+                    metrics.count('retries')
+                    print(f"Retry {retry_count} for missing words: {missing}")
+                    found, missing, _ = await self.complete(missing)
+                    results.extend(found)
+                    if not missing:
+                        print("All words successfully processed after retry!")
+                    elif retry_count == self.max_retries:
+                        print(f"Failed to generate sentences for: {missing}")
+            except Exception as e:
+                print(f"Error processing batch: {e}")
+            if self.on_results:
+                self.on_results(results)
+                return []
+            return results
+
+    async def run(self, batches):
+        self.limiter = RateLimiter(self.requests_per_minute, self.tokens_per_minute)
+        self.slots = asyncio.Semaphore(self.max_in_flight)
+        import openai
+        self.rate_limit_error = openai.RateLimitError
+        if self.client is None:
+            self.client = openai.AsyncOpenAI()
+
+        start = time.monotonic()
+        batch_results = await asyncio.gather(*(
+            self.run_batch(num, len(batches), batch) for num, batch in enumerate(batches, 1)
+        ))
+        print(f"Async dispatch: {len(batches)} batches, {self.requests} requests, {self.rate_limited} rate limited, "
+              f"{time.monotonic() - start:.1f}s")
+
+        processed_results = [] # Flattened in batch order, exactly like the sequential loop builds it
+        for results in batch_results:
+            processed_results.extend(results)
+        return processed_results
+
+def dispatch(batches, build_prompt, parse, model, **options):
+    return asyncio.run(Dispatcher(build_prompt, parse, model, **options).run(batches))
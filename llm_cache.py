@@ -0,0 +1,105 @@
+import argparse
+import json
+import metrics
+import os
+import sqlite3
+import threading
+import time
+
+db_path = os.environ.get('ANKI_LLM_CACHE', 'llm_cache.sqlite') # Shared by sentence.py, sentences.py and verbs.py
+
+class ResponseCache:
+    # Parsed OpenAI answers stored per item (one word or one verb), not per batch, so a word that was already
+    # answered is served locally no matter which batch it lands in. Keyed by kind, item, model and prompt version.
+    def __init__(self, path=db_path):
+        self.path = path
+        self.db = None # Opened on first use
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                kind TEXT, item TEXT, model TEXT, prompt_version TEXT, value TEXT, created REAL,
+                PRIMARY KEY (kind, item, model, prompt_version))""")
+        return self.db
+
+    def get(self, kind, item, model, prompt_version, ttl_days=None):
+        with self.lock:
+            row = self.connect().execute(
+                "SELECT value, created FROM responses WHERE kind = ? AND item = ? AND model = ? AND prompt_version = ?",
+                (kind, item.lower(), model, str(prompt_version))).fetchone()
+            if row and (ttl_days is None or time.time() - row[1] < ttl_days * 86400):
+                self.hits += 1
+                return json.loads(row[0])
+            self.misses += 1
+            return None
+
+    def put(self, kind, item, model, prompt_version, value):
+        with self.lock:
+            db = self.connect()
+            db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                       (kind, item.lower(), model, str(prompt_version), json.dumps(value, ensure_ascii=False), time.time()))
+            db.commit() # Commit per answer so a crash never loses what we already paid for
+
+    def split(self, kind, items, model, prompt_version, ttl_days=None):
+        # Returns ({item: cached value}, [items that still need the API])
+        cached, missing = {}, []
+        for item in items:
+            value = self.get(kind, item, model, prompt_version, ttl_days)
+            if value is None:
+                missing.append(item)
+            else:
+                cached[item] = value
+        metrics.count('llm_cache_hits', len(cached))
+        metrics.count('llm_cache_misses', len(missing))
+        return cached, missing
+
+    def invalidate(self, kind=None, item=None, older_than_days=None):
+        query, params = "DELETE FROM responses WHERE 1 = 1", []
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        if item:
+            query += " AND item = ?"
+            params.append(item.lower())
+        if older_than_days is not None:
+            query += " AND created < ?"
+            params.append(time.time() - older_than_days * 86400)
+        with self.lock:
+            db = self.connect()
+            deleted = db.execute(query, params).rowcount
+            db.commit()
+        return deleted
+
+    def counts(self):
+        with self.lock:
+            return self.connect().execute("SELECT kind, model, prompt_version, COUNT(*) FROM responses GROUP BY 1, 2, 3").fetchall()
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return f"LLM cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate)"
+
+cache = ResponseCache()
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the OpenAI response cache.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats', help="Show how many answers are cached per kind/model/prompt version")
+    invalidate = sub.add_parser('invalidate', help="Delete cached answers")
+    invalidate.add_argument('--kind', help="Only this kind, e.g. 'sentences' or 'conjugation'")
+    invalidate.add_argument('--item', help="Only this word or verb")
+    invalidate.add_argument('--older-than', type=float, metavar='DAYS', help="Only answers older than this many days")
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        for kind, model, version, count in cache.counts():
+            print(f"{kind:<12} {model:<20} v{version:<4} {count}")
+    else:
+        print(f"Deleted {cache.invalidate(args.kind, args.item, args.older_than)} cached answers.")
+
+if __name__ == "__main__":
+    main()
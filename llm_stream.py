@@ -0,0 +1,50 @@
+import metrics
+import time
+
+# Streamed chat completions for the synchronous LLM loops. complete() asks for stream=True and feeds the text through
+# one of parsers' incremental parsers (SentenceStream, ConjugationStream, JsonEntryStream) as it arrives, handing each
+# finished entry to on_entries straight away, so the first cards' audio starts a few seconds into a long response
+# instead of after it. A stream that breaks off part way still returns the text it got, and every entry in it parsed.
+# The time from sending the request to the first parsed entry is recorded as the 'llm_first_entry' stage.
+
+def complete(client, stream, on_entries=None, **request):
+    # Returns (response text, finish_reason). Raises only if the request fails before any text arrived
+    start = time.perf_counter()
+    parts = []
+    first_entry = None
+    finish_reason = None # Stays None for a stream that broke off
+
+    def deliver(entries):
+        nonlocal first_entry
+        if not entries:
+            return
+        if first_entry is None:
+            first_entry = time.perf_counter() - start
+            metrics.recorder.add_time('llm_first_entry', first_entry)
+        if on_entries:
+            on_entries(entries)
+
+    chunks = iter(client.chat.completions.create(stream=True, stream_options={'include_usage': True}, **request))
+    while True:
+        try:
+            chunk = next(chunks, None)
+        except Exception as e: # Only the network read; errors from on_entries are the caller's
+            if not parts:
+                raise
+            print(f"Streamed response broke off after {sum(len(part) for part in parts)} characters: {e}")
+            metrics.count('broken_streams')
+            break
+        if chunk is None:
+            break
+        metrics.record_usage(chunk) # Only the last chunk carries usage
+        for choice in chunk.choices:
+            text = choice.delta.content if choice.delta else None
+            if text:
+                parts.append(text)
+                deliver(stream.feed(text))
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+            if choice.finish_reason == 'length':
+                metrics.count('truncated_streams')
+    deliver(stream.close())
+    return "".join(parts), finish_reason
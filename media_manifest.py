@@ -0,0 +1,252 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Persistent list of the files in the media folders (Anki's collection.media holds 100k+ clips), so a run doesn't have to
+# list the folder to know which clips exist. A folder is only rescanned when its mtime has changed, which happens
+# whenever a file is added, removed or renamed in it; one os.scandir pass then updates the stored names for every suffix.
+# Lookups are indexed SQLite reads (or a set, once a folder has been listed or looked up a lot):
+#   media = media_manifest.folder(en_folder)
+#   'cat_en.mp3' in media                   # does the clip exist?
+#   en_exists = media.with_suffix('_en.mp3') # 'cat' in en_exists, en_exists.add('cat') after writing cat_en.mp3
+# Files a run writes itself are recorded with add(), and the write itself is wrapped in 'with media.writing():', which
+# compares the folder's mtime just before and after it. If every change to the folder since the scan was one of ours,
+# close() stores the folder's current mtime as known without listing it again; if anything else changed it meanwhile
+# (an Anki sync, Check Media deleting clips) the old mtime stays, so the next run rescans.
+
+db_path = os.environ.get('ANKI_MEDIA_MANIFEST', 'media_manifest.sqlite')
+lookups_before_load = 2000 # After this many indexed lookups in one folder, load its names into a set instead
+
+class MediaFolder:
+    def __init__(self, manifest, path):
+        self.manifest = manifest
+        self.path = path
+        self.key = os.path.normcase(os.path.abspath(path))
+        self.added = set() # Written this run, stored by close()
+        self.scanned_mtime = None
+        self.expected_mtime = None # The folder's mtime after our last write, or None once something else changed it
+        self.write_lock = threading.RLock() # EN and PT clips may share one folder, so writing() can nest
+        self.loaded = None # Every stored name, once a rescan or many lookups made a set worthwhile
+        self.lookups = 0
+
+    def __contains__(self, name):
+        if name in self.added:
+            return True
+        if self.loaded is None:
+            self.lookups += 1
+            if self.lookups <= lookups_before_load: # A run with a few missing clips never reads the whole list
+                return self.manifest.lookup(self.key, name)
+            with self.manifest.lock:
+                if self.loaded is None:
+                    self.loaded = self.manifest.names(self.key)
+        return name in self.loaded
+
+    def add(self, name):
+        with self.manifest.lock:
+            self.added.add(name)
+
+    def writing(self):
+        return FolderWrite(self)
+
+    def names(self, suffix=''):
+        # Every stored name ending in suffix, as a set (for callers that want to scan rather than look up)
+        return self.manifest.names(self.key, suffix) | {name for name in self.added if name.endswith(suffix)}
+
+    def with_suffix(self, suffix):
+        return SuffixView(self, suffix)
+
+class FolderWrite:
+    # Wraps one change this run makes to the folder. Writes to a folder are serialized so their mtimes chain, but only
+    # the final link, copy or rename goes inside, not the synthesis
+    def __init__(self, media):
+        self.media = media
+
+    def __enter__(self):
+        self.media.write_lock.acquire()
+        try:
+            if os.stat(self.media.path).st_mtime_ns != self.media.expected_mtime:
+                self.media.expected_mtime = None # Changed since our last write by something that wasn't us
+        except Exception:
+            self.media.write_lock.release()
+            raise
+
+    def __exit__(self, *exc):
+        try:
+            if self.media.expected_mtime is not None:
+                self.media.expected_mtime = os.stat(self.media.path).st_mtime_ns
+        finally:
+            self.media.write_lock.release()
+
+class SuffixView:
+    # The folder as a set of stems: 'cat' in media.with_suffix('_en.mp3') checks for cat_en.mp3
+    def __init__(self, media, suffix):
+        self.media = media
+        self.suffix = suffix
+
+    def __contains__(self, stem):
+        return f"{stem}{self.suffix}" in self.media
+
+    def add(self, stem):
+        self.media.add(f"{stem}{self.suffix}")
+
+    def writing(self):
+        return self.media.writing()
+
+class MediaManifest:
+    def __init__(self, path=db_path):
+        self.path = path
+        self.db = None # Opened on first use
+        self.folders = {}
+        self.scans = 0
+        self.lock = threading.RLock()
+
+    def connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS folders (folder TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, scanned REAL);
+                CREATE TABLE IF NOT EXISTS files (folder TEXT NOT NULL, name TEXT NOT NULL, PRIMARY KEY (folder, name)) WITHOUT ROWID;""")
+        return self.db
+
+    def folder(self, path, force=False):
+        # The MediaFolder for path, rescanned first if the folder changed since the manifest last saw it
+        key = os.path.normcase(os.path.abspath(path))
+        with self.lock:
+            if key not in self.folders:
+                self.folders[key] = MediaFolder(self, path)
+                self.refresh(self.folders[key], force)
+            return self.folders[key]
+
+    def stored_mtime(self, key):
+        row = self.connect().execute("SELECT mtime_ns FROM folders WHERE folder = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def refresh(self, media, force=False):
+        mtime = os.stat(media.path).st_mtime_ns # Taken before listing, so a change during the scan shows up next time
+        media.scanned_mtime = media.expected_mtime = mtime
+        if not force and self.stored_mtime(media.key) == mtime:
+            return False
+        with os.scandir(media.path) as entries:
+            current = {entry.name for entry in entries if entry.is_file()}
+        stored = self.names(media.key)
+        db = self.connect()
+        with db:
+            db.executemany("DELETE FROM files WHERE folder = ? AND name = ?", ((media.key, name) for name in stored - current))
+            db.executemany("INSERT INTO files VALUES (?, ?)", ((media.key, name) for name in current - stored))
+            db.execute("INSERT OR REPLACE INTO folders VALUES (?, ?, ?)", (media.key, mtime, time.time()))
+        self.scans += 1
+        media.loaded = current # Just listed, so lookups this run needn't touch the database
+        print(f"Media manifest: scanned '{media.path}' ({len(current)} files, {len(current - stored)} new, {len(stored - current)} gone)")
+        return True
+
+    def lookup(self, key, name):
+        with self.lock:
+            return self.connect().execute("SELECT 1 FROM files WHERE folder = ? AND name = ?", (key, name)).fetchone() is not None
+
+    def names(self, key, suffix=''):
+        with self.lock:
+            rows = self.connect().execute("SELECT name FROM files WHERE folder = ?", (key,))
+            return {name for name, in rows if name.endswith(suffix)}
+
+    def close(self):
+        # Stores the files written this run. If the folder only changed because of them, its new mtime becomes the known one
+        with self.lock:
+            if self.db is None:
+                return
+            with self.db:
+                for media in self.folders.values():
+                    if not media.added:
+                        continue
+                    self.db.executemany("INSERT OR IGNORE INTO files VALUES (?, ?)", ((media.key, name) for name in media.added))
+                    if self.stored_mtime(media.key) == media.scanned_mtime:
+                        mtime = os.stat(media.path).st_mtime_ns
+                        if media.expected_mtime is not None and mtime == media.expected_mtime:
+                            self.db.execute("UPDATE folders SET mtime_ns = ? WHERE folder = ?", (mtime, media.key))
+                        else:
+                            print(f"Media manifest: '{media.path}' was changed by something else during the run; it is rescanned next time")
+                    media.added = set()
+            self.db.close()
+            self.db = None
+            self.folders = {}
+
+    def summary(self):
+        return f"Media manifest: {len(self.folders)} folders, {self.scans} rescanned"
+
+manifest = MediaManifest()
+
+def folder(path, force=False):
+    return manifest.folder(path, force)
+
+def peek(path, suffix):
+    # Read-only: the stems of path's '<stem><suffix>' files if the manifest is current for it, else None. For dry runs
+    if not os.path.exists(manifest.path) or not os.path.isdir(path):
+        return None
+    key = os.path.normcase(os.path.abspath(path))
+    with manifest.lock:
+        if manifest.stored_mtime(key) != os.stat(path).st_mtime_ns:
+            return None
+        return {name[:-len(suffix)] for name in manifest.names(key, suffix)}
+
+def bench(count=100000):
+    # Two os.listdir passes with string splits (what words.py did) against a warm manifest on a synthetic media folder
+    with tempfile.TemporaryDirectory() as scratch:
+        media_path = os.path.join(scratch, 'collection.media')
+        os.makedirs(media_path)
+        for i in range(count):
+            open(os.path.join(media_path, f"word{i}_{'en' if i % 2 else 'pt'}.mp3"), 'wb').close()
+        start = time.perf_counter()
+        en_exists = {f.rsplit("_en.mp3", 1)[0] for f in os.listdir(media_path) if f.endswith("_en.mp3")}
+        pt_exists = {f.rsplit("_pt.mp3", 1)[0] for f in os.listdir(media_path) if f.endswith("_pt.mp3")}
+        print(f"2 x os.listdir of {count} files: {(time.perf_counter() - start) * 1000:.1f}ms")
+        bench_manifest = MediaManifest(os.path.join(scratch, 'manifest.sqlite'))
+        start = time.perf_counter()
+        bench_manifest.folder(media_path)
+        print(f"First run (full scan into the manifest): {(time.perf_counter() - start) * 1000:.1f}ms")
+        bench_manifest.close()
+        start = time.perf_counter()
+        media = bench_manifest.folder(media_path)
+        en_media = media.with_suffix('_en.mp3')
+        print(f"Later run (unchanged folder): {(time.perf_counter() - start) * 1000:.1f}ms")
+        start = time.perf_counter()
+        found = sum(f"word{i}" in en_media for i in range(1000))
+        print(f"1000 lookups: {(time.perf_counter() - start) * 1000:.1f}ms ({found} found, {len(en_exists)} EN / {len(pt_exists)} PT files)")
+        start = time.perf_counter()
+        for i in range(1000):
+            with media.writing():
+                open(os.path.join(media_path, f"new{i}_en.mp3"), 'wb').close()
+            en_media.add(f"new{i}")
+        print(f"1000 tracked writes: {(time.perf_counter() - start) * 1000:.1f}ms")
+        start = time.perf_counter()
+        bench_manifest.close()
+        print(f"Closing after them: {(time.perf_counter() - start) * 1000:.1f}ms")
+        start = time.perf_counter()
+        bench_manifest.folder(media_path)
+        print(f"Next run: {(time.perf_counter() - start) * 1000:.1f}ms ({bench_manifest.scans - 1} rescans)")
+        bench_manifest.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or refresh the media folder manifest.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    refresh = sub.add_parser('refresh', help="Rescan a folder if it changed (always with --force)")
+    refresh.add_argument('folder')
+    refresh.add_argument('--force', action='store_true')
+    check = sub.add_parser('check', help="Show whether a file is in a folder's manifest")
+    check.add_argument('folder')
+    check.add_argument('name')
+    sub.add_parser('bench', help="Compare os.listdir with the manifest on 100k synthetic files").add_argument('--files', type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.command == 'refresh':
+        media = folder(args.folder, args.force)
+        print(f"'{args.folder}': {len(media.names())} files in the manifest.")
+    elif args.command == 'check':
+        print('yes' if args.name in folder(args.folder) else 'no')
+    else:
+        bench(args.files)
+    manifest.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+# Shared instrumentation for words.py, sentence.py, sentences.py and verbs.py. Stage timers (a context manager or a
+# decorator) and counters (tokens, retries, TTS bytes, cache hits) are collected per run; every timed call is appended
+# to a JSON-lines event log, finish() prints a summary table and can write a Prometheus textfile for node_exporter.
+#
+#   with metrics.timer('csv_read'): ...
+#   @metrics.timed('fetch_conjugations')
+#   metrics.count('retries')
+
+log_file = os.environ.get('ANKI_METRICS_LOG', 'metrics.jsonl') # Empty string disables the event log
+prometheus_file = os.environ.get('ANKI_METRICS_PROM') # e.g. /var/lib/node_exporter/textfile/anki.prom
+
+class Metrics:
+    def __init__(self, log_path=log_file, prometheus_path=prometheus_file):
+        self.log_path = log_path
+        self.prometheus_path = prometheus_path
+        self.script = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.stages = {} # stage -> [calls, total seconds, max seconds]
+        self.counters = {}
+        self.log = None
+        self.lock = threading.Lock()
+
+    def event(self, kind, **fields):
+        if not self.log_path:
+            return
+        line = json.dumps({'ts': round(time.time(), 3), 'run': self.run_id, 'script': self.script, 'event': kind, **fields}, ensure_ascii=False)
+        with self.lock:
+            if self.log is None:
+                self.log = open(self.log_path, 'a', encoding='utf-8', buffering=1) # Line buffered, so a crash keeps what was logged
+            self.log.write(line + "\n")
+
+    def add_time(self, stage, seconds, ok=True):
+        with self.lock:
+            entry = self.stages.setdefault(stage, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+        self.event('stage', stage=stage, seconds=round(seconds, 4), ok=ok)
+
+    def timer(self, stage):
+        return Timer(self, stage)
+
+    def timed(self, stage=None):
+        def decorate(fn):
+            name = stage or fn.__name__
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_usage(self, response): # Token counts from an OpenAI chat completion
+        usage = getattr(response, 'usage', None)
+        if usage:
+            self.count('prompt_tokens', getattr(usage, 'prompt_tokens', 0) or 0)
+            self.count('completion_tokens', getattr(usage, 'completion_tokens', 0) or 0)
+
+    def record_parse(self, requested, missing):
+        # One parsed LLM response: how many items were asked for and how many couldn't be read out of it. Together with
+        # 'retries' this gives the parse-failure and extra-round-trip rates of the text and structured output modes
+        self.count('llm_responses')
+        self.count('llm_items', requested)
+        if missing:
+            self.count('parse_failures')
+            self.count('missing_items', missing)
+
+    def sleep(self, seconds): # time.sleep that shows up as its own stage
+        with self.timer('sleep'):
+            time.sleep(seconds)
+
+    def summary(self):
+        with self.lock:
+            stages = sorted(self.stages.items(), key=lambda item: -item[1][1])
+            counters = sorted(self.counters.items())
+        lines = [f"Run {self.run_id} ({self.script}): {time.time() - self.started:.1f}s wall",
+                 f"{'stage':<30} {'calls':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10}"]
+        for stage, (calls, total, longest) in stages:
+            lines.append(f"{stage:<30} {calls:>8} {total:>10.2f} {total / calls * 1000:>10.1f} {longest * 1000:>10.1f}")
+        for name, value in counters:
+            lines.append(f"{name:<30} {value:>8}")
+        counters = dict(counters)
+        if counters.get('llm_responses'):
+            responses = counters['llm_responses']
+            lines.append(f"Parse failures: {counters.get('parse_failures', 0) / responses * 100:.1f}% of responses, "
+                         f"{counters.get('missing_items', 0) / max(1, counters.get('llm_items', 0)) * 100:.1f}% of items; "
+                         f"{counters.get('retries', 0) / responses:.2f} retries per response")
+        return "\n".join(lines)
+
+    def write_prometheus(self, path):
+        def metric(name):
+            return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+        label = f'script="{self.script}"'
+        lines = [f"anki_run_seconds{{{label}}} {time.time() - self.started:.3f}"]
+        with self.lock:
+            for stage, (calls, total, _) in sorted(self.stages.items()):
+                lines.append(f'anki_stage_seconds_total{{{label},stage="{stage}"}} {total:.4f}')
+                lines.append(f'anki_stage_calls_total{{{label},stage="{stage}"}} {calls}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"anki_{metric(name)}_total{{{label}}} {value}")
+        tmp = f"{path}.tmp" # node_exporter must never read a half-written file
+        with open(tmp, 'w', encoding='utf-8') as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+    def finish(self):
+        with self.lock:
+            stages = {stage: {'calls': calls, 'seconds': round(total, 4)} for stage, (calls, total, _) in self.stages.items()}
+            counters = dict(self.counters)
+        self.event('summary', wall_seconds=round(time.time() - self.started, 3), stages=stages, counters=counters)
+        print(self.summary())
+        if self.prometheus_path:
+            try:
+                self.write_prometheus(self.prometheus_path)
+            except Exception as e:
+                print(f"Could not write Prometheus metrics to {self.prometheus_path}: {e}")
+        with self.lock:
+            if self.log:
+                self.log.close()
+                self.log = None
+
+class Timer:
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.metrics.add_time(self.stage, time.perf_counter() - self.start, ok=exc_type is None)
+
+recorder = Metrics()
+
+def timer(stage):
+    return recorder.timer(stage)
+
+def timed(stage=None):
+    return recorder.timed(stage)
+
+def count(name, amount=1):
+    recorder.count(name, amount)
+
+def record_usage(response):
+    recorder.record_usage(response)
+
+def record_parse(requested, missing):
+    recorder.record_parse(requested, missing)
+
+def sleep(seconds):
+    recorder.sleep(seconds)
+
+def finish():
+    recorder.finish()
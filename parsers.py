@@ -0,0 +1,274 @@
+import json
+import re
+
+# Line-oriented parsers for both OpenAI response formats, shared by sentence.py, sentences.py and verbs.py.
+# Every pattern is compiled once here and each response is read in a single pass.
+# With structured output the model answers JSON that matches a strict schema (sentence_schema, conjugation_schema)
+# instead; the *_json parsers validate it and return exactly what the text parsers return.
+# Each format also has an incremental parser (SentenceStream, ConjugationStream, JsonEntryStream) for streamed responses:
+# feed() it the text as it arrives and it returns each entry once the entry is complete. The whole-response parsers
+# are those same classes fed everything at once.
+# 'python bench_parsers.py' checks these against the old per-script parsers and times both.
+
+entry_start = re.compile(r'\s*\d+\.\s*(.*)') # "1. WORD: cat"
+word_line = re.compile(r'WORD:\s*(.*)', re.IGNORECASE)
+sentence_line = re.compile(r'(EN|PT)\s*:(.*)', re.IGNORECASE)
+verb_line = re.compile(r'.*?VERB:\s*(.+)', re.IGNORECASE)
+tense_line = re.compile(r'(\w+)\s*:(.*)')
+word_token = re.compile(r'\w+')
+
+class SentenceStream:
+    # parse_sentence_response one chunk at a time, for streamed responses: feed() returns the entries finished so far as
+    # (word.lower(), (en_sentence, pt_sentence)). An entry is finished when the next "N." line starts, or at close(), so
+    # each entry comes out as soon as the one after it begins and a cut-off stream keeps every entry before the cut
+    def __init__(self):
+        self.buffer = '' # The last, still incomplete line
+        self.pairs = {} # Every finished entry, as parse_sentence_response returns them
+        self.lines, self.word, self.en_sentence, self.pt_sentence = 0, None, None, None
+
+    def feed(self, chunk):
+        *complete, self.buffer = (self.buffer + chunk).split('\n')
+        finished = []
+        for raw in complete:
+            self.line(raw.strip(), finished)
+        return finished
+
+    def close(self):
+        finished = []
+        self.line(self.buffer.strip(), finished)
+        self.buffer = ''
+        self.finish(finished)
+        return finished
+
+    def finish(self, finished):
+        if self.lines >= 3 and self.word and self.en_sentence and self.pt_sentence:
+            self.pairs[self.word.lower()] = (self.en_sentence, self.pt_sentence)
+            finished.append((self.word.lower(), self.pairs[self.word.lower()]))
+        self.lines, self.word, self.en_sentence, self.pt_sentence = 0, None, None, None
+
+    def line(self, line, finished):
+        if not line:
+            return
+        start = entry_start.match(line)
+        if start: # A new numbered entry; the text after "N." is its first line
+            self.finish(finished)
+            line = start.group(1)
+            if not line:
+                return
+
+        self.lines += 1
+        if self.lines == 1:
+            match = word_line.match(line)
+            self.word = match.group(1).strip() if match else None
+        elif self.word:
+            match = sentence_line.match(line)
+            if match and match.group(1).upper() == 'EN':
+                self.en_sentence = match.group(2).strip()
+            elif match:
+                self.pt_sentence = match.group(2).strip()
+
+def parse_sentence_response(text):
+    # "N. WORD: w / EN: ... / PT: ..." entries -> {word.lower(): (en_sentence, pt_sentence)}
+    stream = SentenceStream()
+    stream.feed(text)
+    stream.close()
+    return stream.pairs
+
+def match_words(words, word_sentence_pairs, fallback=False):
+    # Splits the requested words into (found_pairs, missing_words). With fallback, a word the model didn't label is
+    # matched to the first English sentence containing it as a whole word, using a token index built once per response.
+    found_pairs, missing_words = [], []
+    token_index = None
+
+    for word in words:
+        word_lower = word.lower()
+        if word_lower in word_sentence_pairs:
+            found_pairs.append((word, word_sentence_pairs[word_lower]))
+            continue
+        if fallback:
+            if token_index is None:
+                token_index = {}
+                for pair in word_sentence_pairs.values():
+                    for token in word_token.findall(pair[0].lower()):
+                        token_index.setdefault(token, pair)
+            pair = find_in_sentences(word_lower.strip(), word_sentence_pairs, token_index)
+            if pair:
+                found_pairs.append((word, pair))
+                continue
+        missing_words.append(word)
+
+    return found_pairs, missing_words
+
+def find_in_sentences(word, word_sentence_pairs, token_index):
+    if word_token.fullmatch(word): # A single \w+ token is a whole-word match exactly when it is one of the sentence's tokens
+        return token_index.get(word)
+    pattern = re.compile(r'\b' + re.escape(word) + r'\b') # Multi-word or punctuated words: one compile per word, not per sentence
+    for pair in word_sentence_pairs.values():
+        if pattern.search(pair[0].lower()):
+            return pair
+    return None
+
+def process_tense_lines(lines):
+    forms = [line.split(' ', 1)[1] for line in lines if ' ' in line] # Drop the "Eu", "Você/Ele/Ela", ... prefix
+    return {'html': "<br>".join(forms), 'gTTS': ", ".join(forms)} # Add <br> for Anki and , for gTTS
+
+class ConjugationStream:
+    # parse_conjugation_response one chunk at a time: feed() returns the verb blocks finished so far as (verb, {tense: ...}).
+    # A block is finished at its '---' (or the next VERB line, or close()); a block cut off early comes out with the
+    # tenses it got, so callers check for every tense like they do with the full parse
+    def __init__(self, tenses):
+        self.buffer = ''
+        self.parsed_verbs = {}
+        self.tense_names = {tense.upper(): tense for tense in tenses}
+        self.verb, self.tense, self.lines = None, None, []
+
+    def feed(self, chunk):
+        *complete, self.buffer = (self.buffer + chunk).split('\n')
+        finished = []
+        for raw in complete:
+            self.line(raw.strip(), finished)
+        return finished
+
+    def close(self):
+        finished = []
+        self.line(self.buffer.strip(), finished)
+        self.buffer = ''
+        self.finish_verb(finished)
+        return finished
+
+    def finish_tense(self):
+        if self.verb and self.tense:
+            self.parsed_verbs[self.verb][self.tense] = process_tense_lines(self.lines)
+
+    def finish_verb(self, finished):
+        self.finish_tense()
+        if self.verb:
+            finished.append((self.verb, self.parsed_verbs[self.verb]))
+        self.verb, self.tense, self.lines = None, None, []
+
+    def line(self, line, finished):
+        if '---' in line: # End of a verb block
+            self.finish_verb(finished)
+            return
+        if ':' in line: # Only VERB and tense header lines have a colon, so conjugation lines skip the regexes
+            match = verb_line.match(line)
+            if match: # A VERB line also starts a new block, so a dropped '---' doesn't lose the next verb
+                self.finish_verb(finished)
+                self.verb = match.group(1).lower().strip()
+                self.parsed_verbs[self.verb] = {}
+                return
+            match = tense_line.match(line)
+            if self.verb and match and match.group(1).upper() in self.tense_names:
+                self.finish_tense()
+                self.tense, self.lines = self.tense_names[match.group(1).upper()], []
+                line = match.group(2).strip()
+        if self.tense and line:
+            self.lines.append(line)
+
+def parse_conjugation_response(raw_data, tenses):
+    # "VERB: x / PRESENT: ... / PAST: ... / FUTURE: ... / ---" blocks -> {verb: {tense: {'html', 'gTTS'}}}
+    stream = ConjugationStream(tenses)
+    stream.feed(raw_data)
+    stream.close()
+    return stream.parsed_verbs
+
+persons = ('eu', 'voce_ele_ela', 'nos', 'voces_eles_elas') # Eu, Você/Ele/Ela, Nós, Vocês/Eles/Elas - the order the cards list them in
+
+def strict_object(properties): # Strict mode wants every property required and nothing else allowed
+    return {'type': 'object', 'properties': properties, 'required': list(properties), 'additionalProperties': False}
+
+sentence_schema = strict_object({'sentences': {'type': 'array', 'items': strict_object({
+    'word': {'type': 'string'}, 'en': {'type': 'string'}, 'pt': {'type': 'string'}})}})
+
+def conjugation_schema(tenses):
+    forms = strict_object({person: {'type': 'string'} for person in persons})
+    return strict_object({'verbs': {'type': 'array', 'items': strict_object({'verb': {'type': 'string'}, **{tense: forms for tense in tenses}})}})
+
+def response_format(name, schema): # The chat.completions.create argument that asks for schema-valid JSON
+    return {'type': 'json_schema', 'json_schema': {'name': name, 'strict': True, 'schema': schema}}
+
+def text_field(entry, key):
+    value = entry.get(key) if isinstance(entry, dict) else None
+    return value.strip() if isinstance(value, str) and value.strip() and '\n' not in value.strip() else None
+
+class JsonEntryStream:
+    # The structured output counterpart of SentenceStream / ConjugationStream: decodes each object of the response's
+    # {"<key>": [...]} array as soon as its closing brace arrives. convert(entry) returns (name, value), or None for an
+    # entry that fails validation. A response cut off at max_tokens keeps every entry before the cut
+    decoder = json.JSONDecoder()
+
+    def __init__(self, key, convert):
+        self.array_start = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+        self.convert = convert
+        self.buffer = ''
+        self.started = self.ended = False
+        self.results = {}
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        finished = []
+        if not self.started:
+            match = self.array_start.search(self.buffer)
+            if not match:
+                return finished
+            self.buffer = self.buffer[match.end():]
+            self.started = True
+        while not self.ended:
+            self.buffer = self.buffer.lstrip(' \t\r\n,')
+            if self.buffer.startswith(']'):
+                self.ended = True
+            if not self.buffer or self.ended:
+                break
+            try:
+                entry, end = self.decoder.raw_decode(self.buffer)
+            except ValueError: # Not all there yet
+                break
+            self.buffer = self.buffer[end:]
+            item = self.convert(entry)
+            if item:
+                self.results[item[0]] = item[1]
+                finished.append(item)
+        return finished
+
+    def close(self):
+        self.buffer = ''
+        return []
+
+def sentence_entry(entry):
+    # {"word", "en", "pt"} -> (word.lower(), (en_sentence, pt_sentence)). Entries with a missing or empty field are left
+    # out, so their words come back as missing, like an unparseable text entry
+    word, en_sentence, pt_sentence = (text_field(entry, key) for key in ('word', 'en', 'pt'))
+    if word and en_sentence and pt_sentence:
+        return word.lower(), (en_sentence, pt_sentence)
+    return None
+
+def conjugation_entry(entry, tenses):
+    # {"verb", <tense>: {<person>: form}} -> (verb, {tense: {'html', 'gTTS'}}). A tense with a missing or empty form is
+    # left out, so the verb counts as incomplete, like a text block with a lost tense
+    verb = text_field(entry, 'verb')
+    if not verb:
+        return None
+    data = {}
+    for tense in tenses:
+        forms = [text_field(entry.get(tense), person) for person in persons]
+        if all(forms):
+            data[tense] = {'html': "<br>".join(forms), 'gTTS': ", ".join(forms)}
+    return verb.lower(), data
+
+def sentence_json_stream():
+    return JsonEntryStream('sentences', sentence_entry)
+
+def conjugation_json_stream(tenses):
+    return JsonEntryStream('verbs', lambda entry: conjugation_entry(entry, tenses))
+
+def parse_sentence_json(text):
+    # {"sentences": [{"word", "en", "pt"}]} -> {word.lower(): (en_sentence, pt_sentence)}
+    stream = sentence_json_stream()
+    stream.feed(text)
+    return stream.results
+
+def parse_conjugation_json(raw_data, tenses):
+    # {"verbs": [{"verb", <tense>: {<person>: form}}]} -> {verb: {tense: {'html', 'gTTS'}}}
+    stream = conjugation_json_stream(tenses)
+    stream.feed(raw_data)
+    return stream.results
@@ -0,0 +1,104 @@
+import metrics
+import queue
+import threading
+import time
+
+# Staged producer/consumer pipeline for the card scripts: the LLM loop (the producer, in the main thread) puts each parsed
+# card in as soon as its batch is parsed, a pool of TTS worker threads makes the card's audio, and one writer thread
+# writes the card once its audio is done. Both hand-offs are bounded queues, so a producer that runs ahead of the TTS
+# workers blocks in put() instead of piling up cards in memory, and a slow writer holds the workers back the same way.
+# With LLM batches and audio overlapping, a run takes about as long as the slower of the two instead of their sum.
+#   with Pipeline(make_audio, write_row, workers=8, max_pending=32) as cards:
+#       for card in parsed_batch:
+#           cards.put(card)
+# make_audio(card) runs in the workers; an exception there is reported and the card is still written. write_row(card)
+# runs only in the writer thread, so it can use the CSV writer without a lock. idle(), if given, is called by the writer
+# whenever it has caught up with the workers (a good time to flush and fsync).
+
+done = object() # Queue sentinel
+
+class Pipeline:
+    def __init__(self, synthesize, write, workers=8, max_pending=32, idle=None, label="Pipeline"):
+        self.synthesize = synthesize
+        self.write = write
+        self.idle = idle
+        self.label = label
+        self.pending = queue.Queue(max(1, max_pending)) # Cards waiting for a TTS worker
+        self.finished = queue.Queue(max(1, max_pending)) # Cards with audio, waiting for the writer
+        self.written = 0
+        self.audio_errors = 0
+        self.blocked = 0.0 # Seconds put() spent waiting for room, i.e. how far the producer was ahead of the audio
+        self.error = None # First exception raised by write() or idle(); re-raised to the producer
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.workers = [threading.Thread(target=self.work, daemon=True) for _ in range(max(1, workers))]
+        self.writer = threading.Thread(target=self.write_all, daemon=True)
+        for thread in self.workers + [self.writer]:
+            thread.start()
+
+    def put(self, card):
+        if self.error:
+            raise self.error
+        start = time.perf_counter()
+        self.pending.put(card) # Blocks while max_pending cards are already waiting
+        self.blocked += time.perf_counter() - start
+
+    def work(self):
+        while True:
+            card = self.pending.get()
+            if card is done:
+                return
+            try:
+                self.synthesize(card)
+            except Exception as e:
+                print(f"Error generating audio for {card}: {e}")
+                with self.lock:
+                    self.audio_errors += 1
+            self.finished.put(card)
+
+    def write_all(self):
+        while True:
+            try:
+                card = self.finished.get_nowait()
+            except queue.Empty:
+                self.call(self.idle)
+                card = self.finished.get()
+            if card is done:
+                self.call(self.idle)
+                return
+            if self.call(self.write, card): # After a failure the cards are still taken, so the workers never block on a full queue
+                self.written += 1
+
+    def call(self, fn, *args):
+        if fn is None or self.error:
+            return False
+        try:
+            fn(*args)
+            return True
+        except Exception as e:
+            print(f"{self.label}: writing failed: {e}")
+            self.error = e
+            return False
+
+    def close(self):
+        for _ in self.workers:
+            self.pending.put(done)
+        for thread in self.workers:
+            thread.join()
+        self.finished.put(done)
+        self.writer.join()
+        metrics.recorder.add_time('pipeline_backpressure', self.blocked)
+        print(self.summary())
+        if self.error:
+            raise self.error
+
+    def summary(self):
+        elapsed = time.monotonic() - self.start
+        return (f"{self.label}: {self.written} cards written in {elapsed:.1f}s, {self.audio_errors} audio errors, "
+                f"producer waited {self.blocked:.1f}s for the TTS workers")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,19 +1,56 @@
+import apkg_export
+import audio_cache
+import audio_post
 import csv
-import openai
+import llm_async
+import llm_cache
+import llm_stream
+import metrics
 import os
-import random
+import parsers
+import pipeline
 import re
-import time
-from gtts import gTTS
+import sentence_index
+import tts_engines
+import word_coverage
+from batcher import TokenBatcher, count_tokens
+from collections import deque
 
-batch_size = 10
+batch_size = 40 # Upper bound on words per request; TokenBatcher packs fewer if the token limits require it
+completion_tokens_per_word = 40 # Starting estimate for one "N. WORD/EN/PT" entry
 list_size = 100
 csv_in = 'filtered.csv'
 csv_out = 'sentences.csv'
 en_folder = 'EN_'
 pt_folder = 'PT_'
+apkg_out = None # Also build an importable Anki package from csv_out, e.g. 'sentences.apkg' (see apkg_export.py)
+deck_name = 'Portuguese::Sentences'
+post_process_audio = False # Trim silence, normalize loudness and re-encode new mp3s at a low bitrate with ffmpeg (see audio_post.py)
+tts_engine = {'en': 'gtts', 'pt': 'gtts'} # TTS engine per language: 'gtts', 'cloud', or offline 'espeak' / 'piper' (see tts_engines.py)
+tts_workers = 8 # Cards having their audio made at once while the next LLM batch runs (see pipeline.py)
+pipeline_queue_size = 32 # Parsed cards allowed to wait for a TTS worker before the LLM loop pauses
+model = "gpt-3.5-turbo-1106"
+async_mode = False # Keep several batches in flight at once instead of sleeping between them (see llm_async.py)
+max_in_flight = 4 # Async mode: number of concurrent batch requests
+requests_per_minute = 500 # Async mode: OpenAI rate limits for this model/tier
+tokens_per_minute = 30000
+cache_kind = 'sentence' # Cached answers are per word, model and prompt version (see llm_cache.py)
+prompt_version = 1 # Bump whenever the prompt changes so answers to the old prompt are not reused
+llm_cache_ttl_days = 7 # Keep cached sentences this long; None keeps them forever. A hit is only used if it passes sentence_index, so a rerun never repeats its cards
+reject_near_duplicates = True # Ask again for words whose sentence repeats an earlier card (see sentence_index.py)
+structured_output = False # Ask for JSON matching a strict schema (parsers.sentence_schema) instead of WORD/EN/PT text
+stream_responses = False # Stream each response and start on an entry's audio as soon as it is parsed (see llm_stream.py); not used by async_mode
+sampling = 'least' # How the list_size words are picked: 'least' covered first, 'weighted' or 'uniform' random (see word_coverage.py)
+sampling_power = 2.0 # 'weighted' only: how strongly words that already have sentences are passed over
 
-client = openai.OpenAI()
+client = None # Created on first use, so a dry run or an all-cached run needs no API key
+
+def get_client():
+    global client
+    if client is None:
+        import openai
+        client = openai.OpenAI()
+    return client
 
 def clean_word(word):
     # Removing parenthesis and any text within. Remove the 'to ' prefix from verbs. Stripping any excess whitespace.
@@ -28,14 +65,27 @@ def clean_word(word):
     
     return word_no_parens
 
+@metrics.timed()
 def generate_audio(text, file, lang="pt"):
-    tts = gTTS(text, lang=lang)
-    tts.save(file)
+    tts_engines.fetch(file, text, lang, tts_engine[lang]) # Only calls the engine on a cache miss
+    generated_audio.append(file)
+
+generated_audio = [] # mp3s written this run, for the optional post-processing step
 
-def generate_and_parse_sentences(words):
+def build_prompt(words):
     cleaned_words = [w.strip() for w in words] # Ensure all words are cleaned before sending to API
     join_words = ", ".join(cleaned_words)
     
+    if structured_output: # The response format takes care of the layout, so only the content rules are left
+        return f"""You are a helpful assistant that generates language-learning sentences.
+    Your task is to generate one very simple sentence for each of the following words: {join_words}.
+
+    Follow these rules precisely:
+    1. Return one entry per word, with the word exactly as given in "word".
+    2. The "en" sentence must use the given word.
+    3. The "pt" sentence must be a direct translation of the "en" sentence.
+    4. All sentences must end with a period."""
+
     prompt = f"""You are a helpful assistant that generates language-learning sentences.
     Your task is to generate one very simple sentence for each of the following words: {join_words}.
 
@@ -55,156 +105,210 @@ def generate_and_parse_sentences(words):
     EN: The cat is sleeping.
     PT: O gato está dormindo."""
 
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo-1106",
-        messages=[{"role": "user", "content": prompt}]
-    )
+    return prompt
 
-    text = response.choices[0].message.content.strip()
-    word_sentence_pairs = {} # Process the text to extract word-sentence pairs
-    
-    entries = re.split(r'\n\s*\d+\.\s*', '\n' + text) # Split by numbered entries (1., 2., etc.)
-    if entries and not entries[0].strip():  # Remove empty first entry if present
-        entries = entries[1:]
-    
-    for entry in entries:
-        lines = entry.strip().split('\n')
-        if len(lines) >= 3:
-            word_match = re.match(r'WORD:\s*(.*)', lines[0]) # Extract the original word
-            if word_match:
-                original_word = word_match.group(1).strip()
-                # Find the English and Portuguese sentences
-                en_sentence = None
-                pt_sentence = None
-                
-                for line in lines[1:]:
-                    if line.startswith('EN:'):
-                        en_sentence = line[3:].strip()
-                    elif line.startswith('PT:'):
-                        pt_sentence = line[3:].strip()
-                
-                if original_word and en_sentence and pt_sentence:
-                    word_sentence_pairs[original_word.lower()] = (en_sentence, pt_sentence)
-    
-    # Check which words were successfully processed
-    found_pairs = []
-    missing_words = []
-    
-    for word in cleaned_words:
-        word_lower = word.lower()
-        if word_lower in word_sentence_pairs:
-            found_pairs.append((word, word_sentence_pairs[word_lower]))
-        else:
-            # Check if the word appears in any sentence even if not explicitly labeled
-            found = False
-            for _, (en_sent, pt_sent) in word_sentence_pairs.items():
-                if word_in_sentence(word, en_sent):
-                    found_pairs.append((word, (en_sent, pt_sent)))
-                    found = True
-                    break
-            
-            if not found:
-                missing_words.append(word)
-    
-    return found_pairs, missing_words
+def request_format(): # Extra chat.completions.create arguments
+    return {'response_format': parsers.response_format('sentences', parsers.sentence_schema)} if structured_output else {}
 
-def word_in_sentence(word, sentence):
-    # Clean the word and ensure it's treated as a whole word in the sentence
-    word = word.strip().lower()
-    word_pattern = r'\b' + re.escape(word) + r'\b'
-    return bool(re.search(word_pattern, sentence.lower()))
+def response_stream(): # Incremental parser for the response format in use
+    return parsers.sentence_json_stream() if structured_output else parsers.SentenceStream()
 
-with open(csv_in, "r", encoding="utf-8") as infile:
-    reader = list(csv.reader(infile))
+@metrics.timed('generate_and_parse_sentences')
+def generate_and_parse_sentences(words, batcher, on_results=None):
+    # With stream_responses, entries labelled with one of the words are accepted while the response is still coming in
+    # and passed to on_results right away. Returns (accepted pairs, missing words, finish_reason); the pairs are all of them either way
+    request = {'model': model, 'messages': [{"role": "user", "content": build_prompt(words)}], **request_format()}
+    if not stream_responses:
+        with metrics.timer('openai_request'):
+            response = get_client().chat.completions.create(**request)
+        metrics.record_usage(response)
+        accepted, missing = parse_and_cache((response.choices[0].message.content or "").strip(), words, batcher) # content is None on a refusal
+        return accepted, missing, response.choices[0].finish_reason
 
-    print(f"DEBUG: Successfully loaded {len(reader)} words from '{csv_in}'.")
+    pending = {word.lower(): word for word in words}
+    streamed, rejected = [], []
+    def on_entries(entries):
+        accepted, rejected_words = accept_pairs([(pending.pop(key), pair) for key, pair in entries if key in pending], batcher)
+        streamed.extend(accepted)
+        rejected.extend(rejected_words)
+        if on_results and accepted:
+            on_results(accepted)
+    with metrics.timer('openai_request'):
+        text, finish_reason = llm_stream.complete(get_client(), response_stream(), on_entries, **request)
+    found_pairs, missing_words = parse_sentences(text.strip(), [word for word in words if word.lower() in pending]) # Unlabelled entries, and the fallback scan
+    metrics.record_parse(len(words), len(missing_words))
+    accepted, rejected_words = accept_pairs(found_pairs, batcher)
+    return streamed + accepted, missing_words + rejected + rejected_words, finish_reason
 
-    random_words = random.sample(reader, min(list_size, len(reader))) # Randomly select X words
+def parse_and_cache(text, words, batcher):
+    found_pairs, missing_words = parse_sentences(text, words)
+    metrics.record_parse(len(words), len(missing_words)) # Before near-duplicate rejection, which isn't a parse failure
+    accepted_pairs, rejected_words = accept_pairs(found_pairs, batcher)
+    return accepted_pairs, missing_words + rejected_words
+
+def accept_pairs(found_pairs, batcher):
+    # (accepted pairs, rejected words): a repeat goes back to the missing list before any audio is made. Rejected words
+    # are reported to the run's TokenBatcher
+    accepted_pairs, rejected_words = [], []
+    for word, sentence_pair in found_pairs:
+        if reject_near_duplicates and not sentence_index.index.accept(word, *sentence_pair):
+            rejected_words.append(word)
+            batcher.rejected.add(word) # Answered, just not usable, so not a sign of truncation
+            metrics.count('near_duplicates')
+            continue
+        llm_cache.cache.put(cache_kind, word, model, prompt_version, list(sentence_pair)) # Save each answer as soon as we have it
+        accepted_pairs.append((word, sentence_pair))
+    return accepted_pairs, rejected_words
+
+def accept_cached(cached, reuse=False):
+    # (accepted pairs, words to ask again) for cache hits. A hit is an answer the index has seen, so outside crash recovery
+    # (reuse) it only becomes a card if it doesn't repeat an existing one; without the index, hits aren't used at all
+    if not reject_near_duplicates and not reuse:
+        return [], list(cached)
+    accepted_pairs, rejected_words = [], []
+    for word, sentence_pair in cached.items():
+        if reject_near_duplicates and not sentence_index.index.accept(word, *sentence_pair, reuse=reuse):
+            rejected_words.append(word)
+            metrics.count('near_duplicates')
+            continue
+        accepted_pairs.append((word, tuple(sentence_pair)))
+    return accepted_pairs, rejected_words
+
+def parse_sentences(text, words):
+    cleaned_words = [w.strip() for w in words]
+    if structured_output:
+        word_sentence_pairs = parsers.parse_sentence_json(text)
+    else:
+        word_sentence_pairs = parsers.parse_sentence_response(text) # Process the text to extract word-sentence pairs
+    # Check which words were successfully processed, matching unlabelled words against the sentences they appear in
+    return parsers.match_words(cleaned_words, word_sentence_pairs, fallback=True)
+
+def make_audio(card): # Runs in the pipeline's TTS workers
+    word_en, word_pt, en_sentence, pt_sentence, en_audio, pt_audio = card
+    print(f"Making EN audio for '{word_en}': '{en_sentence}' -> {en_audio}")
+    print(f"Making PT audio for '{word_pt}': '{pt_sentence}' -> {pt_audio}")
+    generate_audio(en_sentence, en_audio, lang="en")
+    generate_audio(pt_sentence, pt_audio, lang="pt")
+
+def main():
+    with metrics.timer('csv_read'): # Streams csv_in keeping only list_size rows (see csv_sample.py)
+        random_words, total_rows = word_coverage.coverage.sample_csv(csv_in, list_size, sampling, sampling_power) # Select X words, least-covered first by default
+
+    print(f"DEBUG: Successfully read {total_rows} words from '{csv_in}'.")
 
     print(f"DEBUG: Created a random sample of {len(random_words)} words to process.")
-    
+
     word_to_row_map = {} # Map cleaned words to original rows
 
     for row in random_words:
         clean_en_word = clean_word(row[0].strip())
         word_to_row_map[clean_en_word] = row
-    
+
     words_to_process = list(word_to_row_map.keys()) # Get the list of cleaned words
-    
-    processed_results = []
+
+    submitted = set() # Words handed to the pipeline; a streamed word comes back again with its batch's results
+    written_words = []
+
+    def submit_results(results):
+        # Hands each batch's cards to the pipeline as soon as it is parsed, so their audio is made while the next batch runs
+        for word, sentence_pair in results:
+            if word in word_to_row_map and word not in submitted and len(submitted) < list_size: # Stop after processing X words
+                original_row = word_to_row_map[word]
+                en_sentence, pt_sentence = sentence_pair
+                word_en = original_row[0].strip()
+                word_pt = original_row[1].strip()
+                en_audio = os.path.join(en_folder, f"{word_en}__en.mp3")
+                pt_audio = os.path.join(pt_folder, f"{word_pt}__pt.mp3")
+                submitted.add(word)
+                card_pipeline.put((word_en, word_pt, en_sentence, pt_sentence, en_audio, pt_audio))
+
+    @metrics.timed('csv_write')
+    def write_card(card): # Runs in the pipeline's writer thread, once the card's audio is done
+        word_en, word_pt, en_sentence, pt_sentence, en_audio, pt_audio = card
+        front = f"{en_sentence}<br>[sound:{os.path.basename(en_audio)}]"
+        back = f"{pt_sentence}<br>[sound:{os.path.basename(pt_audio)}]"
+        writer.writerow([front, back])
+        written_words.append(word_en)
+
+    outfile = open(csv_out, "w", encoding="utf-8", newline="")
+    writer = csv.writer(outfile)
+    card_pipeline = pipeline.Pipeline(make_audio, write_card, workers=tts_workers, max_pending=pipeline_queue_size, idle=outfile.flush, label="Cards")
+
+    cached, words_to_process = llm_cache.cache.split(cache_kind, words_to_process, model, prompt_version, llm_cache_ttl_days) # Only cache misses go to the API
+    accepted, rejected = accept_cached(cached)
+    submit_results(accepted)
+    words_to_process += rejected # A cached answer that would repeat a card is asked for again
+    print(f"DEBUG: {len(accepted)} words answered from the LLM cache, {len(rejected)} cached answers would repeat a card.")
 
     total_words = len(words_to_process)
-    num_batches = (total_words + batch_size - 1) // batch_size
+    batcher = TokenBatcher(model, count_tokens(build_prompt([]), model), completion_tokens_per_word, max_items=batch_size)
+    num_batches = len(batcher.plan(words_to_process)) # Estimate; the batch size adapts if responses get truncated
     print(f"\nDEBUG: Setup complete. Processing {total_words} words in {num_batches} batches...")
-    
-    # Process words in smaller batches
-    for i in range(0, len(words_to_process), batch_size):
-        batch_num = (i // batch_size) + 1
-        batch = words_to_process[i:i + batch_size]
-        print(f"\n--- Starting Batch {batch_num} of {num_batches} ---")
-        
-        try:
-            results, missing = generate_and_parse_sentences(batch)
-
-            print(f"DEBUG: API call for Batch {batch_num} returned {len(results)} successful pairs and {len(missing)} missing words.")
-                      
-            processed_results.extend(results) # Add successful results
-            
-            # Retry for missing words (up to 2 attempts)
-            retry_count = 0
-            while missing and retry_count < 2:
-                retry_count += 1
-                print(f"Retry {retry_count} for missing words: {missing}")
-                time.sleep(5)  # Wait before retrying
-                
-                retry_results, still_missing = generate_and_parse_sentences(missing)
-                              
-                processed_results.extend(retry_results) # Add successful retries to our results
-                
-                missing = still_missing
-                if not missing:
-                    print("All words successfully processed after retry!")
-                elif retry_count == 2:
-                    print(f"Failed to generate sentences for: {missing}")
-            
-        except Exception as e:
-            print(f"Error processing batch: {e}")
-        
-        time.sleep(2) # Reduce risk of hitting API limits
-    
-    count = 0
 
+    with outfile, card_pipeline: # The pipeline finishes (its last audio and rows) before the file closes
+        if async_mode:
+            llm_async.dispatch(
+                batcher.plan(words_to_process), build_prompt, lambda text, words: parse_and_cache(text, words, batcher), model, on_results=submit_results,
+                max_in_flight=max_in_flight, requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute, batcher=batcher,
+                request_options=request_format()
+            )
+        else:
+            # Process words in smaller batches
+            queue = deque(words_to_process)
+            batch_num = 0
+            while queue:
+                batch_num += 1
+                batch = batcher.next_batch(queue) # As many words as fit the model's token limits
+                print(f"\n--- Starting Batch {batch_num} of {num_batches} ---")
+
+                try:
+                    results, missing, finish_reason = generate_and_parse_sentences(batch, batcher, submit_results)
+                    batcher.record(batch, missing, finish_reason) # Shrinks later batches if this response was cut off
 
-print(f"\nWriting {len(processed_results)} results to {csv_out}...") # This entire block runs only AFTER all API calls are complete. Writes all results to sentences.csv
+                    print(f"DEBUG: API call for Batch {batch_num} returned {len(results)} successful pairs and {len(missing)} missing words.")
 
-with open(csv_out, "w", encoding="utf-8", newline="") as outfile:
-    writer = csv.writer(outfile)
-    
-    count = 0
-    for word, sentence_pair in processed_results:
-        if word in word_to_row_map:
-            original_row = word_to_row_map[word]
-            en_sentence, pt_sentence = sentence_pair
-            word_en = original_row[0].strip()
-            word_pt = original_row[1].strip()
-            en_audio = os.path.join(en_folder, f"{word_en}__en.mp3")
-            pt_audio = os.path.join(pt_folder, f"{word_pt}__pt.mp3")
-
-            print(f"Making EN audio for '{word_en}': '{en_sentence}' -> {en_audio}")
-            print(f"Making PT audio for '{word_pt}': '{pt_sentence}' -> {pt_audio}")
-        
-            generate_audio(en_sentence, en_audio, lang="en")
-            generate_audio(pt_sentence, pt_audio, lang="pt")
-
-            front = f"{en_sentence}<br>[sound:{os.path.basename(en_audio)}]"
-            back = f"{pt_sentence}<br>[sound:{os.path.basename(pt_audio)}]"
-            writer.writerow([front, back])
-            
-            count += 1
-
-            # Stop after processing X words
-            if count >= list_size:
-                break
-
-print("\n" + "="*25 + " SCRIPT FINISHED " + "="*25)
-print(f"Successfully wrote {count} sentence pairs to the output file '{csv_out}'.")
\ No newline at end of file
+                    submit_results(results) # Audio for this batch starts now, while the next request runs
+
+                    # Retry for missing words (up to 2 attempts)
+                    retry_count = 0
+                    while missing and retry_count < 2:
+                        retry_count += 1
+                        metrics.count('retries')
+                        print(f"Retry {retry_count} for missing words: {missing}")
+                        metrics.sleep(5)  # Wait before retrying
+
+                        retry_results, still_missing, _ = generate_and_parse_sentences(missing, batcher, submit_results)
+
+                        submit_results(retry_results) # Add successful retries to our results
+
+                        missing = still_missing
+                        if not missing:
+                            print("All words successfully processed after retry!")
+                        elif retry_count == 2:
+                            print(f"Failed to generate sentences for: {missing}")
+
+                except Exception as e:
+                    print(f"Error processing batch: {e}")
+
+                metrics.sleep(2) # Reduce risk of hitting API limits
+
+    count = len(written_words)
+    word_coverage.coverage.record(written_words)
+
+    if post_process_audio:
+        audio_post.post_process(generated_audio)
+
+    if apkg_out:
+        apkg_export.export_csv([(csv_out, deck_name)], apkg_out, [en_folder, pt_folder], apkg_export.sentence_key)
+
+    print(llm_cache.cache.summary())
+    print(sentence_index.index.summary())
+    print(word_coverage.coverage.summary())
+    tts_engines.close()
+    print(audio_cache.cache.summary())
+    metrics.finish()
+    print("\n" + "="*25 + " SCRIPT FINISHED " + "="*25)
+    print(f"Successfully wrote {count} sentence pairs to the output file '{csv_out}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import argparse
+import csv
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+
+# Persistent near-duplicate index of every EN/PT sentence sentence.py and sentences.py have accepted. Sentences are
+# reduced to character 4-gram shingles and a 32-bin one-permutation MinHash signature, split into 8 LSH bands of 4 values. Only
+# sentences sharing a band bucket are compared, so a lookup is a handful of indexed SQLite reads no matter how many
+# sentences are stored. 'python sentence_index.py bench' times lookups against 100k synthetic sentences.
+
+db_path = os.environ.get('ANKI_SENTENCE_INDEX', 'sentence_index.sqlite')
+shingle_size = 4 # Characters; short flashcard sentences have too few words for word n-grams
+num_perm = 32
+bands = 8 # 8 bands x 4 values: pairs above roughly 0.6 similarity end up as candidates
+threshold = 0.7 # Jaccard similarity of the shingle sets at which a candidate counts as a repeat
+
+rows_per_band = num_perm // bands
+non_word = re.compile(r'[^\w ]+')
+spaces = re.compile(r'\s+')
+sound_tag = re.compile(r'<[^>]+>|\[sound:[^\]]*\]')
+
+def normalize(text):
+    return spaces.sub(' ', non_word.sub(' ', text.lower())).strip()
+
+def shingles(text):
+    text = normalize(text)
+    if len(text) <= shingle_size:
+        return {text}
+    return {text[i:i + shingle_size] for i in range(len(text) - shingle_size + 1)}
+
+def signature(shingle_set):
+    # One-permutation MinHash: each shingle is hashed once, the low bits pick one of the 32 bins and the rest is that
+    # bin's candidate minimum. Empty bins borrow the next filled bin's value, offset by the distance (rotation
+    # densification). One hash per shingle instead of 32 keeps a signature well under 0.1ms.
+    # Changing any of this would orphan every stored bucket.
+    sig = [None] * num_perm
+    for shingle in shingle_set:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+        slot, value = h % num_perm, (h // num_perm) & 0xFFFFFFFF
+        if sig[slot] is None or value < sig[slot]:
+            sig[slot] = value
+    filled = {i for i in range(num_perm) if sig[i] is not None}
+    if len(filled) < num_perm:
+        for i in range(num_perm):
+            if sig[i] is None:
+                distance = next((d for d in range(1, num_perm) if (i + d) % num_perm in filled), 0)
+                sig[i] = sig[(i + distance) % num_perm] + (distance << 32)
+    return sig
+
+def band_buckets(lang, sig):
+    # One 63-bit bucket id per band; the language and band number are part of the hash, so one indexed column will do
+    buckets = []
+    for band in range(bands):
+        values = sig[band * rows_per_band:(band + 1) * rows_per_band]
+        digest = hashlib.blake2b(struct.pack(f'<{rows_per_band}Q', *values), digest_size=8, person=f"{lang}:{band}".encode()[:16]).digest()
+        buckets.append(int.from_bytes(digest, 'little') >> 1)
+    return buckets
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+class SentenceIndex:
+    def __init__(self, path=db_path):
+        self.path = path
+        self.db = None # Opened on first use
+        self.checked = 0
+        self.rejected = 0
+        self.lookup_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS sentences (id INTEGER PRIMARY KEY, lang TEXT NOT NULL, word TEXT, text TEXT NOT NULL, added REAL);
+                CREATE TABLE IF NOT EXISTS buckets (bucket INTEGER NOT NULL, sentence_id INTEGER NOT NULL);
+                CREATE INDEX IF NOT EXISTS buckets_bucket ON buckets (bucket);""")
+        return self.db
+
+    def __len__(self):
+        with self.lock:
+            return self.connect().execute("SELECT COUNT(*) FROM sentences").fetchone()[0]
+
+    def find(self, text, lang, word=None, buckets=None, shingle_set=None, reuse=False):
+        # Returns the stored sentence 'text' repeats, or None. A word's earlier sentences count like any other. With reuse
+        # (an answer re-served on purpose, e.g. a cached one after a crash) only the identical entry stored for it is skipped
+        shingle_set = shingle_set or shingles(text)
+        buckets = buckets or band_buckets(lang, signature(shingle_set))
+        rows = self.connect().execute(
+            f"SELECT DISTINCT s.id, s.word, s.text FROM buckets b JOIN sentences s ON s.id = b.sentence_id "
+            f"WHERE b.bucket IN ({', '.join('?' * len(buckets))})", buckets).fetchall()
+        for _, stored_word, stored_text in rows:
+            if reuse and word is not None and stored_word == word.lower() and stored_text == text:
+                continue
+            if jaccard(shingle_set, shingles(stored_text)) >= threshold:
+                return stored_text
+        return None
+
+    def insert(self, text, lang, word, buckets):
+        cursor = self.db.execute("INSERT INTO sentences (lang, word, text, added) VALUES (?, ?, ?, ?)",
+                                 (lang, word.lower() if word else None, text, time.time()))
+        self.db.executemany("INSERT INTO buckets VALUES (?, ?)", ((bucket, cursor.lastrowid) for bucket in buckets))
+
+    def accept(self, word, en_sentence, pt_sentence, reuse=False):
+        # Stores the pair and returns True, or returns False if either sentence repeats an earlier card.
+        # reuse=True re-serves an answer that was accepted (and stored) before, so it is checked but not stored again
+        with self.lock:
+            self.connect()
+            start = time.perf_counter()
+            prepared = []
+            duplicate = None
+            for lang, text in (('en', en_sentence), ('pt', pt_sentence)):
+                shingle_set = shingles(text)
+                buckets = band_buckets(lang, signature(shingle_set))
+                duplicate = self.find(text, lang, word, buckets, shingle_set, reuse)
+                if duplicate:
+                    break
+                prepared.append((text, lang, buckets))
+            self.lookup_seconds += time.perf_counter() - start # The commit below is the same per-answer write llm_cache does
+            self.checked += 1
+            self.rejected += bool(duplicate)
+            if not duplicate and not reuse:
+                with self.db:
+                    for text, lang, buckets in prepared:
+                        self.insert(text, lang, word, buckets)
+        if duplicate:
+            print(f"Near-duplicate sentence for '{word}': '{text}' repeats '{duplicate}'")
+        return not duplicate
+
+    def import_csv(self, path):
+        # Seeds the index from an existing sentences.csv (front/back with <br> and [sound:] tags); words are unknown
+        added = 0
+        with self.lock, open(path, 'r', newline='', encoding='utf-8') as file:
+            self.connect()
+            with self.db:
+                for row in csv.reader(file):
+                    if len(row) < 2:
+                        continue
+                    for lang, text in (('en', row[0]), ('pt', row[1])):
+                        text = sound_tag.sub(' ', text).strip()
+                        if text:
+                            self.insert(text, lang, None, band_buckets(lang, signature(shingles(text))))
+                            added += 1
+        return added
+
+    def summary(self):
+        per_lookup = self.lookup_seconds / self.checked * 1000 if self.checked else 0.0
+        return f"Sentence index: {self.checked} pairs checked, {self.rejected} near-duplicates rejected, {per_lookup:.2f}ms per lookup"
+
+index = SentenceIndex()
+
+def bench(count=100000, lookups=1000):
+    # Fills a scratch index with 'count' synthetic sentences in one transaction, then times lookups against it
+    import tempfile
+    rng = random.Random(7)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 9))) for _ in range(5000)]
+    sentence = lambda: ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(4, 9))).capitalize() + '.'
+    with tempfile.TemporaryDirectory() as folder:
+        bench_index = SentenceIndex(os.path.join(folder, 'bench.sqlite'))
+        start = time.perf_counter()
+        with bench_index.connect():
+            for i in range(count):
+                text = sentence()
+                bench_index.insert(text, 'en', f"w{i}", band_buckets('en', signature(shingles(text))))
+        print(f"Indexed {count} sentences in {time.perf_counter() - start:.1f}s")
+        queries = [sentence() for _ in range(lookups)]
+        start = time.perf_counter()
+        for text in queries:
+            bench_index.find(text, 'en')
+        print(f"{lookups} lookups (signature + buckets + candidate check): {(time.perf_counter() - start) / lookups * 1000:.3f}ms each")
+        bench_index.db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or seed the near-duplicate sentence index.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats', help="Show how many sentences are indexed")
+    seed = sub.add_parser('import', help="Index the sentences in an existing sentences.csv")
+    seed.add_argument('csv')
+    check = sub.add_parser('check', help="Show the stored sentence a new one would repeat, if any")
+    check.add_argument('text')
+    check.add_argument('--lang', default='en')
+    sub.add_parser('bench', help="Time lookups against 100k synthetic sentence pairs")
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        print(f"{len(index)} sentences indexed in '{index.path}'.")
+    elif args.command == 'import':
+        print(f"Indexed {index.import_csv(args.csv)} sentences from '{args.csv}'.")
+    elif args.command == 'check':
+        duplicate = index.find(args.text, args.lang)
+        print(f"Repeats: {duplicate}" if duplicate else "No near-duplicate found.")
+    else:
+        bench()
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,62 @@
+import apkg_export
+import argparse
+import audio_cache
+import audio_post
 import csv
-import openai
+import json
+import llm_async
+import llm_cache
+import llm_stream
+import metrics
 import os
-import random
+import parsers
+import pipeline
 import re
-import time
-from google.cloud import texttospeech
-from gtts import gTTS
+import sentence_index
+import shards
+import tts_engines
+import word_coverage
+from batcher import TokenBatcher, count_tokens
+from collections import deque
 
-batch_size = 10
+batch_size = 40 # Upper bound on words per request; TokenBatcher packs fewer if the token limits require it
+completion_tokens_per_word = 40 # Starting estimate for one "N. WORD/EN/PT" entry
 list_size = 100
 csv_in = 'filtered.csv'
 csv_out = 'sentences.csv'
+journal_file = 'sentences.journal.jsonl' # Append-only record of finished words, used by --resume
+shard_ledger = 'sentences.ledger.sqlite' # Shared word list and progress of a --shard / --claim run (see shards.py)
 en_folder = 'EN_'
 pt_folder = 'PT_'
+apkg_out = None # Also build an importable Anki package from csv_out, e.g. 'sentences.apkg' (see apkg_export.py)
+deck_name = 'Portuguese::Sentences'
+post_process_audio = False # Trim silence, normalize loudness and re-encode new mp3s at a low bitrate with ffmpeg (see audio_post.py)
+tts_max_in_flight = 8 # Max number of TTS requests (gTTS and Cloud TTS) outstanding at once; each pipeline TTS worker has one
+pipeline_queue_size = 32 # Parsed cards allowed to wait for a TTS worker before the LLM loop pauses (see pipeline.py)
+tts_engine = {'en': 'gtts', 'pt': 'cloud'} # TTS engine per language: 'gtts', 'cloud', or offline 'espeak' / 'piper' (see tts_engines.py)
+tts_voices = {'cloud': {'voice_name': 'pt-BR-Chirp3-HD-Achernar', 'pitch': 0, 'speaking_rate': 0.95}} # PT voice settings per engine
+model = "gpt-4o"
+async_mode = False # Keep several batches in flight at once instead of sleeping between them (see llm_async.py)
+max_in_flight = 4 # Async mode: number of concurrent batch requests
+requests_per_minute = 500 # Async mode: OpenAI rate limits for this model/tier
+tokens_per_minute = 30000
+cache_kind = 'sentences' # Cached answers are per word, model and prompt version (see llm_cache.py)
+prompt_version = 1 # Bump whenever the prompt changes so answers to the old prompt are not reused
+llm_cache_ttl_days = 7 # Keep cached sentences this long; None keeps them forever. Reused as-is only to recover an unfinished run (--resume, a sharded run); otherwise a hit must pass sentence_index
+reject_near_duplicates = True # Ask again for words whose sentence repeats an earlier card (see sentence_index.py)
+structured_output = False # Ask for JSON matching a strict schema (parsers.sentence_schema) instead of WORD/EN/PT text
+stream_responses = False # Stream each response and start on an entry's audio as soon as it is parsed (see llm_stream.py); not used by async_mode
+sampling = 'least' # How the list_size words are picked: 'least' covered first, 'weighted' or 'uniform' random (see word_coverage.py)
+sampling_power = 2.0 # 'weighted' only: how strongly words that already have sentences are passed over
 
-client = openai.OpenAI()
+client = None # Created on first use, so a dry run or an all-cached run needs no API key
+
+def get_client():
+    global client
+    if client is None:
+        import openai
+        client = openai.OpenAI()
+    return client
 
 def clean_word(word):
     word = word.strip() # Strip any excess whitespace (including whitespace left after removing parentheses)
@@ -26,35 +68,34 @@ def clean_word(word):
     
     return word_no_parens
 
-def generate_audio(text, file, lang, voice_name = None, pitch = 0, speaking_rate = 1.0): # Generates audio using gTTS for English and Google Cloud TTS for Portuguese
-    if lang == 'en': # Use gTTS for English
-        print(f"Generating EN audio with gTTS for: '{text}'")
-        try:
-            tts = gTTS(text = text, lang='en')
-            tts.save(file)
-        except Exception as e:
-            print(f"Error generating gTTS audio for {file}: {e}")
-
-    else: # Use Google Cloud TTS for Portuguese
-        print(f"Generating PT audio with Google Cloud TTS for: '{text}'")
-        try:
-            client = texttospeech.TextToSpeechClient()
-            synthesis_input = texttospeech.SynthesisInput(text = text)
-            lang_code_map = {'pt': 'pt-BR'} # Determine language code for Google Cloud TTS
-            language_code = lang_code_map.get(lang, lang) # Default to lang if not in map
-            voice = texttospeech.VoiceSelectionParams(language_code = language_code, name = voice_name)
-            audio_config = texttospeech.AudioConfig(audio_encoding = texttospeech.AudioEncoding.MP3, pitch = pitch, speaking_rate = speaking_rate)
-            response = client.synthesize_speech(input = synthesis_input, voice = voice, audio_config = audio_config)
-
-            with open(file, "wb") as out:
-                out.write(response.audio_content)
-        except Exception as e:
-            print(f"Error generating Google Cloud TTS audio for {file}: {e}")
-
-def generate_and_parse_sentences(words):
+generated_audio = [] # mp3s written this run, for the optional post-processing step
+
+@metrics.timed()
+def generate_audio(text, file, lang, voice_name = None, pitch = 0, speaking_rate = 1.0): # Uses the engine tts_engine names for the language
+    engine = tts_engine[lang]
+    print(f"Generating {lang.upper()} audio with {engine} for: '{text}'")
+    try:
+        tts_engines.fetch(file, text, lang, engine, voice_name, pitch, speaking_rate) # The engine is only called on a cache miss
+        generated_audio.append(file)
+    except Exception as e:
+        print(f"Error generating {engine} audio for {file}: {e}")
+
+def build_prompt(words):
     cleaned_words = [w.strip() for w in words]
     join_words = ", ".join(cleaned_words)
     
+    if structured_output: # The response format takes care of the layout, so only the content rules are left
+        return f"""
+    You are a helpful assistant that generates language-learning sentences.
+    Your task is to generate one simple sentence for each of the following words: {join_words}.
+
+    Follow these rules precisely:
+    1. Return one entry per word, with the word exactly as given in "word".
+    2. The "en" sentence must use the given word.
+    3. The "pt" sentence must be a direct translation of the "en" sentence.
+    4. All sentences must end with a period.
+    5. Be creative. In the past, you have been prone to providing me repeat sentences for the same words."""
+
     prompt = f"""
     You are a helpful assistant that generates language-learning sentences.
     Your task is to generate one simple sentence for each of the following words: {join_words}.
@@ -76,59 +117,140 @@ def generate_and_parse_sentences(words):
     EN: The cat is sleeping.
     PT: O gato está dormindo."""
     
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}]
-    )
-    text = response.choices[0].message.content.strip()
-    word_sentence_pairs = {}
-    
-    # Split into entries
-    entries = re.split(r'\n\s*\d+\.\s*', '\n' + text)
-    if entries and not entries[0].strip():
-        entries = entries[1:]
-    
-    for entry in entries:
-        lines = [line.strip() for line in entry.strip().split('\n') if line.strip()]
-        if len(lines) >= 3:
-            word_match = re.match(r'WORD:\s*(.*)', lines[0], re.IGNORECASE)
-            if word_match:
-                original_word = word_match.group(1).strip()
-                en_sentence = None
-                pt_sentence = None
-                
-                for line in lines[1:]:
-                    if re.match(r'^\s*EN\s*:', line, re.IGNORECASE):
-                        en_sentence = line.split(":", 1)[1].strip()
-                    elif re.match(r'^\s*PT\s*:', line, re.IGNORECASE):
-                        pt_sentence = line.split(":", 1)[1].strip()
-                
-                if original_word and en_sentence and pt_sentence:
-                    word_sentence_pairs[original_word.lower()] = (en_sentence, pt_sentence)
-    
-    found_pairs = []
-    missing_words = []
-    
-    for word in cleaned_words:
-        word_lower = word.lower()
-        if word_lower in word_sentence_pairs:
-            found_pairs.append((word, word_sentence_pairs[word_lower]))
-        else:
-            missing_words.append(word)
-    
-    return found_pairs, missing_words
-
-def word_in_sentence(word, sentence):
-    # Clean the word and ensure it's treated as a whole word in the sentence
-    word = word.strip().lower()
-    word_pattern = r'\b' + re.escape(word) + r'\b'
-    return bool(re.search(word_pattern, sentence.lower()))
-
-with open(csv_in, "r", encoding="utf-8") as infile:
-    reader = list(csv.reader(infile))
-    print(f"DEBUG: Successfully loaded {len(reader)} words from '{csv_in}'.")
-    random_words = random.sample(reader, min(list_size, len(reader))) # Randomly select X words
-    print(f"DEBUG: Created a random sample of {len(random_words)} words to process.")
+    return prompt
+
+def request_format(): # Extra chat.completions.create arguments
+    return {'response_format': parsers.response_format('sentences', parsers.sentence_schema)} if structured_output else {}
+
+def response_stream(): # Incremental parser for the response format in use
+    return parsers.sentence_json_stream() if structured_output else parsers.SentenceStream()
+
+@metrics.timed('generate_and_parse_sentences')
+def generate_and_parse_sentences(words, batcher, on_results=None):
+    # With stream_responses, entries labelled with one of the words are accepted while the response is still coming in
+    # and passed to on_results right away. Returns (accepted pairs, missing words, finish_reason); the pairs are all of them either way
+    request = {'model': model, 'messages': [{"role": "user", "content": build_prompt(words)}], **request_format()}
+    if not stream_responses:
+        with metrics.timer('openai_request'):
+            response = get_client().chat.completions.create(**request)
+        metrics.record_usage(response)
+        accepted, missing = parse_and_cache((response.choices[0].message.content or "").strip(), words, batcher) # content is None on a refusal
+        return accepted, missing, response.choices[0].finish_reason
+
+    pending = {word.lower(): word for word in words}
+    streamed, rejected = [], []
+    def on_entries(entries):
+        accepted, rejected_words = accept_pairs([(pending.pop(key), pair) for key, pair in entries if key in pending], batcher)
+        streamed.extend(accepted)
+        rejected.extend(rejected_words)
+        if on_results and accepted:
+            on_results(accepted)
+    with metrics.timer('openai_request'):
+        text, finish_reason = llm_stream.complete(get_client(), response_stream(), on_entries, **request)
+    found_pairs, missing_words = parse_sentences(text.strip(), [word for word in words if word.lower() in pending]) # Unlabelled entries, and the fallback scan
+    metrics.record_parse(len(words), len(missing_words))
+    accepted, rejected_words = accept_pairs(found_pairs, batcher)
+    return streamed + accepted, missing_words + rejected + rejected_words, finish_reason
+
+def parse_and_cache(text, words, batcher):
+    found_pairs, missing_words = parse_sentences(text, words)
+    metrics.record_parse(len(words), len(missing_words)) # Before near-duplicate rejection, which isn't a parse failure
+    accepted_pairs, rejected_words = accept_pairs(found_pairs, batcher)
+    return accepted_pairs, missing_words + rejected_words
+
+def accept_pairs(found_pairs, batcher):
+    # (accepted pairs, rejected words): a repeat goes back to the missing list before any audio is made. Rejected words
+    # are reported to the run's TokenBatcher
+    accepted_pairs, rejected_words = [], []
+    for word, sentence_pair in found_pairs:
+        if reject_near_duplicates and not sentence_index.index.accept(word, *sentence_pair):
+            rejected_words.append(word)
+            batcher.rejected.add(word) # Answered, just not usable, so not a sign of truncation
+            metrics.count('near_duplicates')
+            continue
+        llm_cache.cache.put(cache_kind, word, model, prompt_version, list(sentence_pair)) # Save each answer as soon as we have it
+        accepted_pairs.append((word, sentence_pair))
+    return accepted_pairs, rejected_words
+
+def accept_cached(cached, reuse=False):
+    # (accepted pairs, words to ask again) for cache hits. A hit is an answer the index has seen, so outside crash recovery
+    # (reuse) it only becomes a card if it doesn't repeat an existing one; without the index, hits aren't used at all
+    if not reject_near_duplicates and not reuse:
+        return [], list(cached)
+    accepted_pairs, rejected_words = [], []
+    for word, sentence_pair in cached.items():
+        if reject_near_duplicates and not sentence_index.index.accept(word, *sentence_pair, reuse=reuse):
+            rejected_words.append(word)
+            metrics.count('near_duplicates')
+            continue
+        accepted_pairs.append((word, tuple(sentence_pair)))
+    return accepted_pairs, rejected_words
+
+def parse_sentences(text, words):
+    cleaned_words = [w.strip() for w in words]
+    if structured_output:
+        word_sentence_pairs = parsers.parse_sentence_json(text)
+    else:
+        word_sentence_pairs = parsers.parse_sentence_response(text)
+    return parsers.match_words(cleaned_words, word_sentence_pairs)
+
+def read_plan(path): # The first journal line holds the sampled rows, so --resume works on exactly the same words
+    with open(path, encoding="utf-8") as journal:
+        return json.loads(journal.readline())['plan']
+
+def journal_entries(path): # Streams the finished words back one at a time
+    with open(path, encoding="utf-8") as journal:
+        next(journal)
+        for line in journal:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError: # A torn last line from a crash; everything before it is intact
+                break
+
+def make_audio(entry): # Runs in the pipeline's TTS workers
+    generate_audio(entry['en'], entry['en_audio'], lang = 'en') # gTTS by default
+    generate_audio(entry['pt'], entry['pt_audio'], lang = 'pt', **tts_voices.get(tts_engine['pt'], {})) # Cloud TTS by default
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate example sentence cards with audio.")
+    parser.add_argument('--resume', action='store_true', help=f"Continue the last run recorded in '{journal_file}' instead of sampling new words")
+    parser.add_argument('--shard', type=shards.parse_shard, metavar='I/N', help=f"Be worker I of N on the run in '{shard_ledger}', taking the words that hash to shard I")
+    parser.add_argument('--claim', type=int, nargs='?', const=1, metavar='N', help=f"Claim words from '{shard_ledger}' batch by batch; N workers share the rate limits")
+    args = parser.parse_args()
+    ledger = shards.WorkLedger(shard_ledger) if args.shard or args.claim else None # The ledger replaces the journal for --resume
+    worker = shards.worker_id()
+
+    out_csv, journal_path = csv_out, journal_file
+    rpm, tpm = requests_per_minute, tokens_per_minute
+    if ledger:
+        part = args.shard[0] if args.shard else worker
+        workers = args.shard[1] if args.shard else args.claim
+        out_csv, journal_path = shards.part_path(csv_out, part), shards.part_path(journal_file, part) # Merged by shards.merge()
+        rpm, tpm = requests_per_minute // workers, tokens_per_minute // workers
+    resume = args.resume and os.path.exists(journal_path) and not ledger
+
+    if ledger:
+        def sample_plan(): # Only the first worker samples; the rest get its words from the ledger
+            with metrics.timer('csv_read'):
+                rows, total_rows = word_coverage.coverage.sample_csv(csv_in, list_size, sampling, sampling_power)
+            print(f"DEBUG: Sampled {len(rows)} of {total_rows} words from '{csv_in}' for the sharded run.")
+            return [(clean_word(row[0].strip()), row) for row in rows]
+        random_words = [row for _, row in ledger.plan(sample_plan)]
+        print(f"DEBUG: {ledger.summary()}")
+        with open(journal_path, "w", encoding="utf-8") as journal:
+            journal.write(json.dumps({'plan': random_words}, ensure_ascii=False) + "\n")
+    elif resume:
+        random_words = read_plan(journal_path)
+        print(f"DEBUG: Resuming the run recorded in '{journal_path}' ({len(random_words)} words).")
+    else:
+        with metrics.timer('csv_read'): # Streams csv_in keeping only list_size rows (see csv_sample.py)
+            random_words, total_rows = word_coverage.coverage.sample_csv(csv_in, list_size, sampling, sampling_power) # Select X words, least-covered first by default
+        print(f"DEBUG: Successfully read {total_rows} words from '{csv_in}'.")
+        print(f"DEBUG: Created a random sample of {len(random_words)} words to process.")
+
+        with open(journal_path, "w", encoding="utf-8") as journal: # Start a fresh journal for this run
+            journal.write(json.dumps({'plan': random_words}, ensure_ascii=False) + "\n")
+
     word_to_row_map = {} # Map cleaned words to original rows
 
     for row in random_words:
@@ -137,78 +259,175 @@ with open(csv_in, "r", encoding="utf-8") as infile:
         original = row[0].strip()
         cleaned = clean_word(original)
         print(f"Original: '{original}' → Cleaned: '{cleaned}'")
-    
-    words_to_process = list(word_to_row_map.keys()) # Get the list of cleaned words
-    processed_results = []
 
-    total_words = len(words_to_process)
-    num_batches = (total_words + batch_size - 1) // batch_size
-    print(f"\nDEBUG: Setup complete. Processing {total_words} words in {num_batches} batches...")
-    
-    # Process words in smaller batches
-    for i in range(0, len(words_to_process), batch_size):
-        batch_num = (i // batch_size) + 1
-        batch = words_to_process[i:i + batch_size]
-        print(f"\n--- Starting Batch {batch_num} of {num_batches} ---")
-        
-        try:
-            results, missing = generate_and_parse_sentences(batch)
-
-            print(f"DEBUG: API call for Batch {batch_num} returned {len(results)} successful pairs and {len(missing)} missing words.")
-                      
-            processed_results.extend(results) # Add successful results
-            
-            # Retry for missing words (up to 2 attempts)
-            retry_count = 0
-            while missing and retry_count < 2:
-                retry_count += 1
-                print(f"Retry {retry_count} for missing words: {missing}")
-                time.sleep(5)  # Wait before retrying
-                
-                retry_results, still_missing = generate_and_parse_sentences(missing)
-                              
-                processed_results.extend(retry_results) # Add successful retries to our results
-                
-                missing = still_missing
-                if not missing:
-                    print("All words successfully processed after retry!")
-                elif retry_count == 2:
-                    print(f"Failed to generate sentences for: {missing}")
-            
-        except Exception as e:
-            print(f"Error processing batch: {e}")
-        
-        time.sleep(2) # Reduce risk of hitting API limits
-    
     count = 0
+    unsynced = [] # Words written since the last sync()
+    done = set()
+    submitted = set()
+    outfile = open(out_csv, "a" if resume or ledger else "w", encoding="utf-8", newline="") # A worker's part file keeps its earlier runs' cards
+    journal = open(journal_path, "a", encoding="utf-8")
+    writer = csv.writer(outfile) # Only the pipeline's writer thread touches outfile, journal and writer
 
-print(f"\nWriting {len(processed_results)} results to {csv_out}...") # This entire block runs only AFTER all API calls are complete. Writes all results to sentences.csv
+    @metrics.timed('csv_write')
+    def write_card(entry):
+        # Runs in the pipeline's writer thread once the card's audio has been attempted. A TTS error is only reported, so a
+        # journaled card can lack a clip; --resume puts every journaled entry whose mp3s are missing through the audio again
+        nonlocal count
+        if entry.get('journaled'): # Audio redone on --resume; the row is already in the CSV and the journal
+            return
+        front = f"{entry['en']}<br>[sound:{os.path.basename(entry['en_audio'])}]"
+        back = f"{entry['pt']}<br>[sound:{os.path.basename(entry['pt_audio'])}]"
+        writer.writerow([front, back])
+        journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        unsynced.append(entry)
+        count += 1
 
-with open(csv_out, "w", encoding="utf-8", newline="") as outfile:
-    writer = csv.writer(outfile)
-    
-    count = 0
-    for word, sentence_pair in processed_results:
-        if word in word_to_row_map:
-            original_row = word_to_row_map[word]
-            en_sentence, pt_sentence = sentence_pair
-            word_en = original_row[0].strip()
-            cleaned_word_en = clean_word(word_en) # Fix this
-            word_pt = original_row[1].strip()
-            en_audio = os.path.join(en_folder, f"{cleaned_word_en}__en.mp3") # Fix this
-            pt_audio = os.path.join(pt_folder, f"{word_pt}__pt.mp3")
-
-            print(f"'{cleaned_word_en}': '{en_sentence}' -> {en_audio}")
-            generate_audio(en_sentence, en_audio, lang = 'en') # Use gTTS for English
-            print(f"'{word_pt}': '{pt_sentence}' -> {pt_audio}")
-            generate_audio(pt_sentence, pt_audio, lang = "pt-BR", voice_name = "pt-BR-Chirp3-HD-Achernar", pitch = 0, speaking_rate = 0.95) # Use Google Cloud TTS for Portuguese
-            front = f"{en_sentence}<br>[sound:{os.path.basename(en_audio)}]"
-            back = f"{pt_sentence}<br>[sound:{os.path.basename(pt_audio)}]"
-            writer.writerow([front, back])
-            
-            count += 1
-
-            if count >= list_size: # Stop after processing X words
-                break
+    def sync():
+        # Called whenever the writer has caught up: a crash now costs at most the cards still having their audio made
+        if unsynced:
+            outfile.flush()
+            journal.flush()
+            os.fsync(journal.fileno())
+            word_coverage.coverage.record([entry['word_en'] for entry in unsynced])
+            if ledger: # The part file is the only copy of these cards, so it is on disk before the ledger calls them done
+                os.fsync(outfile.fileno())
+                ledger.finish([entry['word'] for entry in unsynced])
+            unsynced.clear()
+
+    def submit_results(results, cards):
+        # Hands one finished batch to the pipeline; put() blocks while the TTS workers are pipeline_queue_size cards behind.
+        # A word already streamed in comes back with its batch's results and is skipped
+        for word, sentence_pair in results:
+            if word in word_to_row_map and word not in submitted:
+                submitted.add(word)
+                original_row = word_to_row_map[word]
+                en_sentence, pt_sentence = sentence_pair
+                word_en = original_row[0].strip()
+                cleaned_word_en = clean_word(word_en) # Fix this
+                word_pt = original_row[1].strip()
+                en_audio = os.path.join(en_folder, f"{cleaned_word_en}__en.mp3") # Fix this
+                pt_audio = os.path.join(pt_folder, f"{word_pt}__pt.mp3")
+                entry = {'word': word, 'word_en': word_en, 'en': en_sentence, 'pt': pt_sentence, 'en_audio': en_audio, 'pt_audio': pt_audio}
+
+                print(f"'{cleaned_word_en}': '{en_sentence}' -> {en_audio}")
+                print(f"'{word_pt}': '{pt_sentence}' -> {pt_audio}")
+                cards.put(entry)
+
+    with outfile, journal, pipeline.Pipeline(make_audio, write_card, workers=tts_max_in_flight, max_pending=pipeline_queue_size,
+                                             idle=sync, label="Cards") as cards:
+        if resume:
+            for entry in journal_entries(journal_path):
+                done.add(entry['word'])
+                if not (os.path.exists(entry['en_audio']) and os.path.exists(entry['pt_audio'])): # Audio that was still in flight when we stopped
+                    cards.put(dict(entry, journaled=True))
+            count = len(done)
+            print(f"DEBUG: {count} words already journaled, skipping them.")
+
+        def split_cached(words):
+            # Cached words go straight to the pipeline; returns the cache misses, which go to the API
+            cached, words = llm_cache.cache.split(cache_kind, words, model, prompt_version, llm_cache_ttl_days)
+            accepted, rejected = accept_cached(cached, reuse=resume or ledger is not None) # Recovering: the cards were never written
+            submit_results(accepted, cards)
+            print(f"DEBUG: {len(accepted)} words answered from the LLM cache, {len(rejected)} cached answers would repeat a card.")
+            return words + rejected
+
+        def claim_words(): # --claim: the next batch's worth of words nobody else has, or [] once the ledger runs dry
+            while True:
+                claimed = ledger.claim(worker, batch_size)
+                words = split_cached(claimed)
+                if words or not claimed:
+                    return words
+
+        words_to_process = [word for word in word_to_row_map if word not in done] # Get the list of cleaned words
+        if ledger:
+            pending = ledger.pending() # Words finished by any worker, on any run, are left alone
+            words_to_process = [word for word in words_to_process if word in pending and (args.claim or shards.in_shard(word, args.shard))]
+        if args.claim:
+            total_words = len(words_to_process) # Shared with the other workers
+            words_to_process = []
+        else:
+            words_to_process = split_cached(words_to_process) # Only cache misses go to the API
+            total_words = len(words_to_process)
+
+        batcher = TokenBatcher(model, count_tokens(build_prompt([]), model), completion_tokens_per_word, max_items=batch_size)
+        num_batches = len(batcher.plan(words_to_process)) or '?' # Estimate; the batch size adapts if responses get truncated
+        print(f"\nDEBUG: Setup complete. Processing {total_words} words in {num_batches} batches...")
+
+        def on_results(results): # In async mode, blocking here pauses the event loop too, which is the backpressure we want
+            submit_results(results, cards)
+
+        if async_mode and not args.claim: # Claiming goes batch by batch, so it always uses the loop below
+            llm_async.dispatch(
+                batcher.plan(words_to_process), build_prompt, lambda text, words: parse_and_cache(text, words, batcher), model, on_results=on_results,
+                max_in_flight=max_in_flight, requests_per_minute=rpm, tokens_per_minute=tpm, batcher=batcher,
+                request_options=request_format()
+            )
+        else:
+            # Process words in smaller batches
+            queue = deque(words_to_process)
+            batch_num = 0
+            while True:
+                if not queue and args.claim:
+                    queue.extend(claim_words())
+                if not queue:
+                    break
+                batch_num += 1
+                batch = batcher.next_batch(queue) # As many words as fit the model's token limits
+                print(f"\n--- Starting Batch {batch_num} of {num_batches} ---")
+
+                try:
+                    results, missing, finish_reason = generate_and_parse_sentences(batch, batcher, on_results)
+                    batcher.record(batch, missing, finish_reason) # Shrinks later batches if this response was cut off
+
+                    print(f"DEBUG: API call for Batch {batch_num} returned {len(results)} successful pairs and {len(missing)} missing words.")
+
+                    submit_results(results, cards) # Audio and rows for this batch are made while the next request runs
+
+                    # Retry for missing words (up to 2 attempts)
+                    retry_count = 0
+                    while missing and retry_count < 2:
+                        retry_count += 1
+                        metrics.count('retries')
+                        print(f"Retry {retry_count} for missing words: {missing}")
+                        metrics.sleep(5)  # Wait before retrying
+
+                        retry_results, still_missing, _ = generate_and_parse_sentences(missing, batcher, on_results)
+
+                        submit_results(retry_results, cards) # Write successful retries right away
+
+                        missing = still_missing
+                        if not missing:
+                            print("All words successfully processed after retry!")
+                        elif retry_count == 2:
+                            print(f"Failed to generate sentences for: {missing}")
+                            if ledger:
+                                ledger.finish(missing, ok=False) # No other worker should try them again either
+
+                except Exception as e:
+                    print(f"Error processing batch: {e}")
+
+                metrics.sleep(2) # Reduce risk of hitting API limits
+
+    if ledger:
+        ledger.release(worker) # Words from a batch that failed outright go back to the other workers
+        print(ledger.summary())
+        print(f"Once every worker is done, combine the part files with 'python shards.py merge {csv_out}'.")
+
+    print(tts_engines.summary())
+    tts_engines.close()
+
+    if post_process_audio:
+        audio_post.post_process(generated_audio)
+
+    if apkg_out and not ledger: # A worker only has its part of the deck; build the package from the merged CSV
+        apkg_export.export_csv([(out_csv, deck_name)], apkg_out, [en_folder, pt_folder], apkg_export.sentence_key)
+
+    print(llm_cache.cache.summary())
+    print(sentence_index.index.summary())
+    print(word_coverage.coverage.summary())
+    print(audio_cache.cache.summary())
+    metrics.finish()
+    print(f"Successfully wrote {count} sentence pairs to the output file '{out_csv}'.")
 
-print(f"Successfully wrote {count} sentence pairs to the output file '{csv_out}'.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
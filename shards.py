@@ -0,0 +1,171 @@
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+# Sharded runs of sentences.py and verbs.py: several worker processes (on one machine, or on several sharing a folder)
+# split one run's words without any word going to the API or through TTS twice.
+#   --shard I/N   worker I of N takes the words whose stable hash falls in shard I; no coordination needed
+#   --claim [N]   workers claim small batches of words from the ledger as they go, so a fast worker takes more
+# Either way the run's word list is fixed once, in a work ledger (an SQLite file, so every claim is made under its lock),
+# and a word is marked done there once its card is written. Running a worker again only does what is left, and words
+# claimed by a worker that died are claimed again once their lease runs out. N also splits the API rate limits.
+# Each worker writes its cards to its own part file ('sentences.part-2.csv') and merge() combines the parts into the
+# real output in sorted order, so the result is the same whatever the number of workers or the order they finished in.
+#   python anki_gen.py sentences --workers 4 [--claim]   start 4 local workers, wait for them, merge
+#   python shards.py merge sentences.csv                  merge by hand after running workers on several machines
+#   python shards.py status sentences.ledger.sqlite
+
+lease_seconds = 900 # A claim not finished within this long is handed to another worker
+lock_timeout = 300 # Seconds to wait for another worker's ledger transaction (the first one samples the plan under the lock)
+
+def shard_of(key, count): # Stable across processes, machines and Python versions, unlike hash()
+    return int.from_bytes(hashlib.blake2b(key.lower().encode('utf-8'), digest_size=8).digest(), 'little') % count
+
+def parse_shard(text):
+    # '2/4' -> (2, 4); shards are numbered from 1
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError(f"Expected a shard like 2/4, got '{text}'")
+    if not 1 <= index <= count:
+        raise ValueError(f"Shard {index} of {count} is out of range")
+    return index, count
+
+def in_shard(key, shard):
+    index, count = shard
+    return shard_of(key, count) == index - 1
+
+def worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def part_path(path, part): # 'sentences.csv', 2 -> 'sentences.part-2.csv'
+    root, ext = os.path.splitext(path)
+    return f"{root}.part-{part}{ext}"
+
+def part_paths(path):
+    root, ext = os.path.splitext(path)
+    return sorted(glob.glob(f"{glob.escape(root)}.part-*{glob.escape(ext)}"))
+
+class WorkLedger:
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=lock_timeout, isolation_level=None, check_same_thread=False) # Transactions are explicit
+        self.lock = threading.Lock() # The card pipeline's writer thread marks words done while the main thread claims
+        self.db.execute("""CREATE TABLE IF NOT EXISTS items (seq INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE, payload TEXT,
+                           worker TEXT, claimed REAL, done REAL, ok INTEGER)""")
+
+    def transaction(self):
+        return Transaction(self)
+
+    def plan(self, make_items):
+        # The run's (key, payload) items. The first worker to get here calls make_items() and stores its result;
+        # every later one (and every rerun) gets the stored list, so all workers agree on the words
+        with self.transaction():
+            if not self.db.execute("SELECT COUNT(*) FROM items").fetchone()[0]:
+                self.db.executemany("INSERT OR IGNORE INTO items (key, payload) VALUES (?, ?)",
+                                    ((key, json.dumps(payload, ensure_ascii=False)) for key, payload in make_items()))
+            return [(key, json.loads(payload)) for key, payload in self.db.execute("SELECT key, payload FROM items ORDER BY seq")]
+
+    def pending(self):
+        with self.lock:
+            return {key for key, in self.db.execute("SELECT key FROM items WHERE done IS NULL")}
+
+    def claim(self, worker, count):
+        # Up to count unfinished keys nobody holds (or whose lease ran out), now held by worker
+        with self.transaction():
+            keys = [key for key, in self.db.execute(
+                "SELECT key FROM items WHERE done IS NULL AND (worker IS NULL OR claimed < ?) ORDER BY seq LIMIT ?",
+                (time.time() - lease_seconds, count))]
+            self.db.executemany("UPDATE items SET worker = ?, claimed = ? WHERE key = ?", ((worker, time.time(), key) for key in keys))
+        return keys
+
+    def finish(self, keys, ok=True):
+        # ok=False for words given up on (retries used up), so no other worker tries them again this run
+        with self.transaction():
+            self.db.executemany("UPDATE items SET done = ?, ok = ? WHERE key = ?", ((time.time(), int(ok), key) for key in keys))
+
+    def release(self, worker): # Hands back whatever worker claimed and didn't finish, e.g. a batch whose request failed
+        with self.transaction():
+            self.db.execute("UPDATE items SET worker = NULL, claimed = NULL WHERE worker = ? AND done IS NULL", (worker,))
+
+    def summary(self):
+        with self.lock:
+            total, done, failed, held = self.db.execute(
+                "SELECT COUNT(*), COUNT(done), COALESCE(SUM(ok = 0), 0), COALESCE(SUM(worker IS NOT NULL AND done IS NULL), 0) FROM items").fetchone()
+        return f"Work ledger '{self.path}': {done} of {total} words done ({failed} given up on), {held} claimed by running workers"
+
+    def close(self):
+        self.db.close()
+
+class Transaction:
+    # BEGIN IMMEDIATE takes SQLite's write lock up front, so two workers can never read the same unclaimed keys
+    def __init__(self, ledger):
+        self.ledger = ledger
+
+    def __enter__(self):
+        self.ledger.lock.acquire()
+        try:
+            self.ledger.db.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self.ledger.lock.release()
+            raise
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            self.ledger.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.ledger.lock.release()
+
+def read_rows(path):
+    with open(path, 'r', newline='', encoding='utf-8') as file:
+        return [tuple(row) for row in csv.reader(file) if row]
+
+def merge(target, append=False):
+    # Combines target's part files into target: every distinct row, sorted. With append, rows are added after target's
+    # current rows and rows it already has are skipped, so merging twice changes nothing. Returns (parts, rows added)
+    parts = part_paths(target)
+    rows = set()
+    for path in parts:
+        rows.update(read_rows(path))
+    if append and os.path.exists(target):
+        rows -= set(read_rows(target))
+    rows = sorted(rows)
+    if append:
+        with open(target, 'a', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerows(rows)
+    else:
+        tmp = f"{target}.tmp"
+        with open(tmp, 'w', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerows(rows)
+        os.replace(tmp, target) # Never leave a half-merged output behind
+    return parts, len(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the part files of a sharded run, or show a work ledger's progress.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    merge_parser = sub.add_parser('merge', help="Combine '<csv>.part-*' files into the CSV")
+    merge_parser.add_argument('csv', nargs='+')
+    merge_parser.add_argument('--append', action='store_true', help="Add to the CSV's rows instead of replacing them (verbs.py's decks)")
+    sub.add_parser('status', help="Show how far a sharded run has got").add_argument('ledger')
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        for target in args.csv:
+            parts, added = merge(target, args.append)
+            print(f"'{target}': {added} rows from {len(parts)} part files.")
+    elif not os.path.exists(args.ledger):
+        print(f"No work ledger at '{args.ledger}'.")
+    else:
+        ledger = WorkLedger(args.ledger)
+        print(ledger.summary())
+        ledger.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import csv
+import sqlite3
+import zipfile
+
+import apkg_export
+
+def note_guids(package, folder):
+    collection = folder / 'collection.anki2'
+    with zipfile.ZipFile(package) as archive:
+        collection.write_bytes(archive.read('collection.anki2'))
+    db = sqlite3.connect(collection)
+    try:
+        return [guid for guid, in db.execute("SELECT guid FROM notes ORDER BY id")]
+    finally:
+        db.close()
+
+def export_rows(tmp_path, rows, key):
+    source = tmp_path / 'cards.csv'
+    with open(source, 'w', newline='', encoding='utf-8') as file:
+        csv.writer(file).writerows(rows)
+    package = tmp_path / 'cards.apkg'
+    apkg_export.export_csv([(str(source), 'Test')], str(package), key=key)
+    return note_guids(package, tmp_path)
+
+def test_english_pairs_sharing_a_verb_get_their_own_notes(tmp_path):
+    back = '<b>sair</b><br>Eu saio<br>[sound:sair_present_verb.mp3]'
+    guids = export_rows(tmp_path, [['to leave<br>[sound:to leave_en.mp3]', back], ['to go out<br>[sound:to go out_en.mp3]', back]],
+                        apkg_export.verb_key)
+    assert len(guids) == 2
+    assert guids[0] != guids[1]
+
+def test_reconjugated_verb_keeps_its_note():
+    front = 'to leave<br>[sound:to leave_en.mp3]'
+    old = apkg_export.verb_key(front, '<b>sair</b><br>Eu saio<br>[sound:sair_present_verb.mp3]')
+    new = apkg_export.verb_key(front, '<b>sair</b><br>Eu saio!<br>[sound:sair_present_verb.mp3]')
+    assert apkg_export.note_guid(old) == apkg_export.note_guid(new)
+
+def test_new_sentence_for_a_word_is_a_new_note(tmp_path):
+    guids = export_rows(tmp_path, [['The cat sleeps.<br>[sound:cat__en.mp3]', 'O gato dorme.<br>[sound:gato__pt.mp3]'],
+                                   ['The cat eats.<br>[sound:cat__en.mp3]', 'O gato come.<br>[sound:gato__pt.mp3]']],
+                        apkg_export.sentence_key)
+    assert len(set(guids)) == 2
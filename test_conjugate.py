@@ -0,0 +1,46 @@
+import pytest
+
+from conjugate import conjugate
+
+known_conjugations = { # Reference forms conjugate() must reproduce
+    'falar': {'present': 'falo, fala, falamos, falam', 'past': 'falei, falou, falamos, falaram', 'future': 'falarei, falará, falaremos, falarão'},
+    'comer': {'present': 'como, come, comemos, comem', 'past': 'comi, comeu, comemos, comeram', 'future': 'comerei, comerá, comeremos, comerão'},
+    'partir': {'present': 'parto, parte, partimos, partem', 'past': 'parti, partiu, partimos, partiram', 'future': 'partirei, partirá, partiremos, partirão'},
+    'ficar': {'present': 'fico, fica, ficamos, ficam', 'past': 'fiquei, ficou, ficamos, ficaram'},
+    'chegar': {'present': 'chego, chega, chegamos, chegam', 'past': 'cheguei, chegou, chegamos, chegaram'},
+    'começar': {'present': 'começo, começa, começamos, começam', 'past': 'comecei, começou, começamos, começaram'},
+    'conhecer': {'present': 'conheço, conhece, conhecemos, conhecem', 'past': 'conheci, conheceu, conhecemos, conheceram'},
+    'proteger': {'present': 'protejo, protege, protegemos, protegem', 'past': 'protegi, protegeu, protegemos, protegeram'},
+    'dirigir': {'present': 'dirijo, dirige, dirigimos, dirigem', 'past': 'dirigi, dirigiu, dirigimos, dirigiram'},
+    'passear': {'present': 'passeio, passeia, passeamos, passeiam', 'past': 'passeei, passeou, passeamos, passearam'},
+    'estudar': {'present': 'estudo, estuda, estudamos, estudam', 'future': 'estudarei, estudará, estudaremos, estudarão'},
+    'beber': {'present': 'bebo, bebe, bebemos, bebem', 'past': 'bebi, bebeu, bebemos, beberam'},
+    'abrir': {'present': 'abro, abre, abrimos, abrem', 'past': 'abri, abriu, abrimos, abriram'},
+    'decidir': {'present': 'decido, decide, decidimos, decidem'},
+    'continuar': {'present': 'continuo, continua, continuamos, continuam'},
+    'ser': {'present': 'sou, é, somos, são', 'past': 'fui, foi, fomos, foram', 'future': 'serei, será, seremos, serão'},
+    'ir': {'present': 'vou, vai, vamos, vão', 'past': 'fui, foi, fomos, foram', 'future': 'irei, irá, iremos, irão'},
+    'ter': {'present': 'tenho, tem, temos, têm', 'past': 'tive, teve, tivemos, tiveram', 'future': 'terei, terá, teremos, terão'},
+    'fazer': {'present': 'faço, faz, fazemos, fazem', 'past': 'fiz, fez, fizemos, fizeram', 'future': 'farei, fará, faremos, farão'},
+    'dizer': {'future': 'direi, dirá, diremos, dirão'},
+    'poder': {'past': 'pude, pôde, pudemos, puderam', 'future': 'poderei, poderá, poderemos, poderão'},
+    'ver': {'present': 'vejo, vê, vemos, veem', 'past': 'vi, viu, vimos, viram'},
+    'vir': {'present': 'venho, vem, vimos, vêm', 'past': 'vim, veio, viemos, vieram', 'future': 'virei, virá, viremos, virão'},
+    'pedir': {'present': 'peço, pede, pedimos, pedem', 'past': 'pedi, pediu, pedimos, pediram'},
+    'dormir': {'present': 'durmo, dorme, dormimos, dormem', 'past': 'dormi, dormiu, dormimos, dormiram'},
+    'sair': {'present': 'saio, sai, saímos, saem', 'future': 'sairei, sairá, sairemos, sairão'},
+    'pôr': {'present': 'ponho, põe, pomos, põem', 'future': 'porei, porá, poremos, porão'},
+}
+unknown_examples = ['produzir', 'possuir', 'doer', 'advertir', 'lembrar-se', 'ter que', 'prever', 'averiguar']
+
+@pytest.mark.parametrize('verb, tense, expected', [
+    (verb, tense, expected) for verb, tenses in known_conjugations.items() for tense, expected in tenses.items()])
+def test_known_conjugation(verb, tense, expected):
+    result = conjugate(verb)
+    assert result is not None, f"{verb} should be conjugated locally"
+    assert result[tense]['gTTS'] == expected
+    assert result[tense]['html'] == expected.replace(', ', '<br>')
+
+@pytest.mark.parametrize('verb', unknown_examples)
+def test_unknown_verb_left_to_llm(verb):
+    assert conjugate(verb) is None
@@ -0,0 +1,220 @@
+import audio_cache
+import json
+import os
+import subprocess
+import threading
+import time
+from tts_pool import Latency
+
+# Interchangeable TTS engines behind one call, so each script picks an engine per language in its settings:
+#   tts_engines.fetch(mp3_path, text, 'pt', 'gtts')
+#   'gtts'   - Google Translate TTS over the network (the scripts' original engine)
+#   'cloud'  - Google Cloud Text-to-Speech; one shared client, voice/pitch/speaking rate per call
+#   'espeak' - espeak-ng, offline. One short-lived process per clip
+#   'piper'  - Piper neural voices, offline. Long-lived piper processes that load their model once and take one clip at a time
+# Clips still go through audio_cache, keyed by engine and voice, so switching engines never serves the other engine's audio.
+# The offline engines write WAV and ffmpeg encodes it to mp3. They run as separate OS processes, at most local_workers at a
+# time, driven from the callers' threads: a multiprocessing pool would re-import the top-level scripts on Windows.
+
+local_workers = os.cpu_count() or 4 # Offline syntheses running at once; they are CPU bound, so one per core
+mp3_bitrate = '64k'
+espeak_command = os.environ.get('ANKI_ESPEAK', 'espeak-ng')
+espeak_voices = {'en': 'en-us', 'pt': 'pt-br'}
+espeak_words_per_minute = 160 # At speaking_rate 1.0
+piper_command = os.environ.get('ANKI_PIPER', 'piper')
+piper_voices = { # Downloaded .onnx voices (each with its .onnx.json next to it), see https://github.com/rhasspy/piper
+    'en': os.environ.get('ANKI_PIPER_EN', 'voices/en_US-lessac-medium.onnx'),
+    'pt': os.environ.get('ANKI_PIPER_PT', 'voices/pt_BR-faber-medium.onnx'),
+}
+
+def base_lang(lang): # 'pt-BR' -> 'pt'
+    return lang.split('-')[0].lower()
+
+def encode_mp3(wav, path):
+    result = subprocess.run(['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', wav, '-ac', '1', '-codec:a', 'libmp3lame',
+                             '-b:a', mp3_bitrate, '-f', 'mp3', path], capture_output=True, text=True) # path ends in .tmp, hence -f
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"ffmpeg exited with {result.returncode}")
+
+class GTTSEngine:
+    name = 'gtts'
+    network = True # Subject to the scripts' request rate limits
+
+    def voice(self, lang, voice_name=None, pitch=0, speaking_rate=1.0):
+        # (language, voice_name, pitch, speaking_rate) as they go into the cache key; gTTS has one voice per language
+        return lang, None, 0, 1.0
+
+    def synthesize(self, text, path, lang, voice_name, pitch, speaking_rate):
+        audio_cache.gtts_synthesizer(text, lang)(path)
+
+class CloudEngine:
+    name = 'cloud'
+    network = True
+    lang_codes = {'pt': 'pt-BR', 'en': 'en-US'}
+
+    def __init__(self):
+        self.client = None # Created once on first use and shared by every worker
+        self.texttospeech = None # google.cloud.texttospeech, imported with the first client
+        self.lock = threading.Lock()
+        self.latency = Latency("Cloud TTS synthesize_speech")
+
+    def get_client(self): # One long-lived client (one gRPC channel, one credential lookup) instead of one per clip
+        with self.lock:
+            if self.client is None:
+                from google.cloud import texttospeech
+                self.texttospeech = texttospeech
+                self.client = texttospeech.TextToSpeechClient()
+        return self.client
+
+    def voice(self, lang, voice_name=None, pitch=0, speaking_rate=1.0):
+        return self.lang_codes.get(lang, lang), voice_name, pitch, speaking_rate
+
+    def synthesize(self, text, path, lang, voice_name, pitch, speaking_rate):
+        client = self.get_client() # Also imports texttospeech
+        texttospeech = self.texttospeech
+        synthesis_input = texttospeech.SynthesisInput(text = text)
+        voice = texttospeech.VoiceSelectionParams(language_code = lang, name = voice_name)
+        audio_config = texttospeech.AudioConfig(audio_encoding = texttospeech.AudioEncoding.MP3, pitch = pitch, speaking_rate = speaking_rate)
+        start = time.perf_counter()
+        response = client.synthesize_speech(input = synthesis_input, voice = voice, audio_config = audio_config)
+        self.latency.add(time.perf_counter() - start)
+        with open(path, "wb") as out:
+            out.write(response.audio_content)
+
+class EspeakEngine:
+    name = 'espeak'
+    network = False
+
+    def __init__(self, workers=local_workers):
+        self.slots = threading.BoundedSemaphore(workers)
+
+    def voice(self, lang, voice_name=None, pitch=0, speaking_rate=1.0):
+        return lang, voice_name or espeak_voices.get(base_lang(lang), base_lang(lang)), pitch, speaking_rate
+
+    def synthesize(self, text, path, lang, voice_name, pitch, speaking_rate):
+        wav = f"{path}.wav"
+        try:
+            with self.slots:
+                result = subprocess.run([espeak_command, '-v', voice_name, '-s', str(round(espeak_words_per_minute * (speaking_rate or 1.0))),
+                                         '-p', str(max(0, min(99, 50 + round(pitch or 0)))), '-w', wav, '--stdin'],
+                                        input=text, capture_output=True, text=True, encoding='utf-8')
+                if result.returncode != 0:
+                    raise RuntimeError(result.stderr.strip() or f"{espeak_command} exited with {result.returncode}")
+                encode_mp3(wav, path)
+        finally:
+            if os.path.exists(wav):
+                os.remove(wav)
+
+class PiperEngine:
+    name = 'piper'
+    network = False
+
+    def __init__(self, workers=local_workers):
+        self.workers = workers
+        self.idle = {} # (model, speaking_rate) -> idle piper processes for that voice
+        self.running = 0 # Processes started and not yet stopped, idle or busy
+        self.changed = threading.Condition()
+
+    def voice(self, lang, voice_name=None, pitch=0, speaking_rate=1.0):
+        return lang, voice_name or piper_voices[base_lang(lang)], 0, speaking_rate # Piper voices have no pitch control
+
+    def take(self, key):
+        # An idle process for this voice, or a new one while fewer than 'workers' run. When every process is
+        # idle for another voice, one of those makes room; otherwise wait for a busy one to come back
+        spare = None
+        with self.changed:
+            while True:
+                if self.idle.get(key):
+                    return self.idle[key].pop()
+                if self.running < self.workers:
+                    self.running += 1
+                    break
+                other = next((procs for procs in self.idle.values() if procs), None)
+                if other:
+                    spare = other.pop()
+                    break
+                self.changed.wait()
+        if spare:
+            self.stop(spare)
+        try:
+            model, speaking_rate = key
+            return subprocess.Popen([piper_command, '--model', model, '--json-input', '--length_scale', str(1 / (speaking_rate or 1.0))],
+                                    stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, encoding='utf-8')
+        except Exception:
+            self.retire()
+            raise
+
+    def give_back(self, key, process):
+        with self.changed:
+            self.idle.setdefault(key, []).append(process)
+            self.changed.notify()
+
+    def retire(self):
+        with self.changed:
+            self.running -= 1
+            self.changed.notify()
+
+    def stop(self, process):
+        try:
+            process.stdin.close()
+            process.wait(timeout=5)
+        except Exception:
+            process.kill()
+
+    def synthesize(self, text, path, lang, voice_name, pitch, speaking_rate):
+        wav = f"{path}.wav"
+        key = (voice_name, speaking_rate)
+        process = self.take(key)
+        try:
+            process.stdin.write(json.dumps({'text': text, 'output_file': os.path.abspath(wav)}, ensure_ascii=False) + "\n")
+            process.stdin.flush()
+            if not process.stdout.readline(): # Piper prints the output path once the clip is written
+                raise RuntimeError(f"{piper_command} exited with {process.wait()}")
+        except Exception:
+            process.kill()
+            self.retire()
+            if os.path.exists(wav):
+                os.remove(wav)
+            raise
+        self.give_back(key, process) # Free for the next clip before the mp3 encode, which doesn't need it
+        try:
+            encode_mp3(wav, path)
+        finally:
+            os.remove(wav)
+
+    def close(self):
+        with self.changed:
+            idle, self.idle = self.idle, {}
+            self.running -= sum(len(procs) for procs in idle.values())
+        for procs in idle.values():
+            for process in procs:
+                self.stop(process)
+
+engine_types = {'gtts': GTTSEngine, 'cloud': CloudEngine, 'espeak': EspeakEngine, 'piper': PiperEngine}
+engines = {} # One shared instance per engine, created on first use
+engines_lock = threading.Lock()
+
+def get(name):
+    with engines_lock:
+        if name not in engines:
+            if name not in engine_types:
+                raise ValueError(f"Unknown TTS engine '{name}', expected one of {', '.join(engine_types)}")
+            engines[name] = engine_types[name]()
+        return engines[name]
+
+def fetch(dest, text, lang, engine='gtts', voice_name=None, pitch=0, speaking_rate=1.0, guard=None):
+    # Writes the clip for 'text' to dest, from the audio cache or the engine. Returns True on a cache hit
+    tts = get(engine)
+    lang, voice_name, pitch, speaking_rate = tts.voice(lang, voice_name, pitch, speaking_rate)
+    synthesize = lambda path: tts.synthesize(text, path, lang, voice_name, pitch, speaking_rate)
+    return audio_cache.fetch(dest, synthesize, text, lang, tts.name, voice_name, pitch, speaking_rate, guard)
+
+def summary():
+    lines = [f"TTS engines used: {', '.join(engines) or 'none'}"]
+    lines += [engine.latency.summary() for engine in engines.values() if hasattr(engine, 'latency')]
+    return "\n".join(lines)
+
+def close(): # Stops any idle Piper processes
+    for engine in list(engines.values()):
+        if hasattr(engine, 'close'):
+            engine.close()
@@ -0,0 +1,134 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class TokenBucket:
+    # Classic token bucket: 'rate' tokens are added per second, up to 'capacity'. acquire() blocks until a token is free
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        if self.rate <= 0: # A rate of 0 disables limiting
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+class Throughput:
+    # Counts finished files and reports files/sec since the first one was started
+    def __init__(self, label="TTS", report_every=25):
+        self.label = label
+        self.report_every = report_every
+        self.count = 0
+        self.errors = 0
+        self.start = None # Set by started() when the first file is submitted, so setup before it doesn't count
+        self.lock = threading.Lock()
+
+    def started(self):
+        with self.lock:
+            if self.start is None:
+                self.start = time.monotonic()
+
+    def add(self, ok=True):
+        with self.lock:
+            if ok:
+                self.count += 1
+            else:
+                self.errors += 1
+            done = self.count + self.errors
+        if self.report_every and done % self.report_every == 0:
+            print(self.summary())
+
+    def elapsed(self):
+        return time.monotonic() - self.start if self.start is not None else 0.0
+
+    def rate(self):
+        elapsed = self.elapsed()
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        elapsed = self.elapsed()
+        return f"{self.label}: {self.count} files in {elapsed:.1f}s ({self.rate():.2f} files/sec), {self.errors} errors"
+
+class TTSExecutor:
+    # Bounded worker pool for TTS jobs. Each job has a key (e.g. ('en', cleaned word)); a key is only ever run once,
+    # so a word that is already queued or being synthesized by another worker is never synthesized twice.
+    def __init__(self, workers=8, rate=10.0, burst=None, label="TTS"):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.bucket = TokenBucket(rate, burst)
+        self.stats = Throughput(label)
+        self.claimed = set()
+        self.futures = []
+        self.failed = []
+        self.lock = threading.Lock()
+
+    def submit(self, key, fn, *args, limited=True, **kwargs):
+        # limited=False skips the token bucket, for jobs that don't call a rate-limited API (an offline TTS engine)
+        with self.lock:
+            if key in self.claimed: # Already queued, running or done
+                return False
+            self.claimed.add(key)
+        self.stats.started()
+        self.futures.append(self.pool.submit(self._run, key, fn, args, kwargs, limited))
+        return True
+
+    def _run(self, key, fn, args, kwargs, limited=True):
+        if limited:
+            self.bucket.acquire()
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Error generating audio for {key}: {e}")
+            with self.lock:
+                self.failed.append(key)
+            self.stats.add(ok=False)
+            return False
+        self.stats.add()
+        return True
+
+    def wait(self):
+        for future in self.futures:
+            future.result()
+        self.pool.shutdown()
+        print(self.stats.summary())
+        return self.failed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.wait()
+
+class Latency:
+    # Collects per-request latencies. The first request is reported separately since it pays for channel setup
+    def __init__(self, label="TTS request"):
+        self.label = label
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def summary(self):
+        with self.lock:
+            samples = list(self.samples)
+        if not samples:
+            return f"{self.label}: no requests"
+        rest = sorted(samples[1:]) or samples
+        mean = sum(rest) / len(rest)
+        p50 = rest[len(rest) // 2]
+        p95 = rest[min(len(rest) - 1, int(len(rest) * 0.95))]
+        return (f"{self.label}: {len(samples)} requests, first {samples[0] * 1000:.0f}ms, "
+                f"then mean {mean * 1000:.0f}ms / p50 {p50 * 1000:.0f}ms / p95 {p95 * 1000:.0f}ms")
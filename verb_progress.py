@@ -0,0 +1,148 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+# Indexed per-verb, per-tense progress for verbs.py: whether the verb's card row for each tense has been written to the
+# tense's CSV, and the byte size of its mp3 (NULL until a non-empty clip is known to exist). verbs.py asks it which verbs
+# are new instead of regex-scanning present.csv, and --repair asks it which tense rows and clips are missing; the partial
+# index on incomplete rows keeps that an index lookup however many verbs are done. A store that doesn't exist yet is
+# seeded once from the three tense CSVs and the audio folders.
+#   python verb_progress.py stats
+#   python verb_progress.py missing
+
+db_path = os.environ.get('ANKI_VERB_PROGRESS', 'verb_progress.sqlite')
+
+class VerbProgress:
+    def __init__(self, path=db_path):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False) # Sharded workers share the file
+        self.lock = threading.Lock() # The pipeline's TTS workers record clips while the writer records rows
+        self.pending = [] # Updates not yet committed, see flush()
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS progress (
+                verb TEXT NOT NULL, tense TEXT NOT NULL, en TEXT NOT NULL, pt TEXT NOT NULL,
+                card_written REAL, audio_bytes INTEGER, updated REAL,
+                PRIMARY KEY (verb, tense)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS progress_incomplete ON progress (verb) WHERE card_written IS NULL OR audio_bytes IS NULL;""")
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(DISTINCT verb) FROM progress").fetchone()[0]
+
+    def verbs(self): # Every verb with at least one tense planned, complete or not
+        with self.lock:
+            return {verb for verb, in self.db.execute("SELECT DISTINCT verb FROM progress")}
+
+    def plan(self, en, pt, tenses):
+        # A row per tense for a verb about to be written, so a tense that never gets written shows up as missing
+        with self.lock:
+            self.pending += [("INSERT OR IGNORE INTO progress (verb, tense, en, pt, updated) VALUES (?, ?, ?, ?, ?)",
+                              (pt.lower(), tense, en, pt, time.time())) for tense in tenses]
+
+    def card_written(self, verb, tense):
+        with self.lock:
+            self.pending.append(("UPDATE progress SET card_written = ?, updated = ? WHERE verb = ? AND tense = ?",
+                                 (time.time(), time.time(), verb.lower(), tense)))
+
+    def audio_written(self, verb, tense, path):
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        with self.lock:
+            self.pending.append(("UPDATE progress SET audio_bytes = ?, updated = ? WHERE verb = ? AND tense = ?",
+                                 (size or None, time.time(), verb.lower(), tense))) # An empty clip counts as missing
+
+    def flush(self):
+        # Commits everything recorded since the last flush in one transaction. verbs.py calls it once the CSV rows are
+        # flushed, so the store never calls a card written that isn't on disk
+        with self.lock:
+            pending, self.pending = self.pending, []
+            if pending:
+                with self.db:
+                    for sql, params in pending:
+                        self.db.execute(sql, params)
+
+    def missing(self):
+        # {verb: (en, pt, {tense: (card missing, audio missing)})} for every verb with an incomplete tense
+        missing = {}
+        with self.lock:
+            rows = self.db.execute("""SELECT verb, tense, en, pt, card_written IS NULL, audio_bytes IS NULL FROM progress INDEXED BY progress_incomplete
+                                      WHERE card_written IS NULL OR audio_bytes IS NULL ORDER BY verb""").fetchall()
+        for verb, tense, en, pt, no_card, no_audio in rows:
+            missing.setdefault(verb, (en, pt, {}))[2][tense] = (bool(no_card), bool(no_audio))
+        return missing
+
+    def verify(self, audio_path):
+        # Re-measures every clip the store thinks exists, for mp3s deleted or emptied by hand. Returns how many went missing
+        with self.lock:
+            rows = self.db.execute("SELECT verb, tense, pt, audio_bytes FROM progress WHERE audio_bytes IS NOT NULL").fetchall()
+        changed = []
+        for verb, tense, pt, size in rows:
+            path = audio_path(pt, tense)
+            current = (os.path.getsize(path) if os.path.exists(path) else 0) or None
+            if current != size:
+                changed.append((current, time.time(), verb, tense))
+        with self.lock, self.db:
+            self.db.executemany("UPDATE progress SET audio_bytes = ?, updated = ? WHERE verb = ? AND tense = ?", changed)
+        return sum(1 for current, *_ in changed if current is None)
+
+    def import_cards(self, cards, tenses, audio_path):
+        # One-time migration: cards is {tense: {verb: (en, pt)}} as found in the tense CSVs. Each verb gets a row for every
+        # tense, marked written where its CSV has the card and with the size of any clip already on disk
+        seen = {}
+        for tense_cards in cards.values():
+            for verb, pair in tense_cards.items():
+                seen.setdefault(verb, pair)
+        rows = []
+        now = time.time()
+        for verb, (en, pt) in seen.items():
+            for tense in tenses:
+                path = audio_path(pt, tense)
+                size = (os.path.getsize(path) if os.path.exists(path) else 0) or None
+                rows.append((verb, tense, en, pt, now if verb in cards.get(tense, {}) else None, size, now))
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR IGNORE INTO progress VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(seen)
+
+    def summary(self):
+        with self.lock:
+            verbs, rows, no_card, no_audio = self.db.execute(
+                "SELECT COUNT(DISTINCT verb), COUNT(*), COALESCE(SUM(card_written IS NULL), 0), COALESCE(SUM(audio_bytes IS NULL), 0) FROM progress").fetchone()
+        return f"Verb progress: {verbs} verbs, {rows} tense cards, {no_card} card rows and {no_audio} clips missing"
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+def peek(path=db_path):
+    # Read-only: the stored verbs, or None if there is no store yet. For dry runs
+    if not os.path.exists(path):
+        return None
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return {verb for verb, in db.execute("SELECT DISTINCT verb FROM progress")}
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Show verbs.py's per-tense progress.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats', help="Show verb, card and clip counts")
+    sub.add_parser('missing', help="List the verbs with a missing tense card or clip ('python verbs.py --repair' fixes them)")
+    args = parser.parse_args()
+
+    if not os.path.exists(db_path):
+        print(f"No verb progress store at '{db_path}' yet; verbs.py creates it on its next run.")
+        return
+    store = VerbProgress()
+    if args.command == 'stats':
+        print(store.summary())
+    else:
+        for verb, (en, pt, tenses) in store.missing().items():
+            gaps = ', '.join(f"{tense}{' card' if no_card else ''}{' audio' if no_audio else ''}" for tense, (no_card, no_audio) in tenses.items())
+            print(f"{pt} ({en}): {gaps}")
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,44 @@
+import apkg_export
+import argparse
+import audio_cache
+import audio_post
 import csv
-import openai
+import llm_cache
+import llm_stream
+import metrics
 import os
+import parsers
+import pipeline
 import re
-import time
-from gtts import gTTS
+import shards
+import tts_engines
+import verb_progress
+from batcher import TokenBatcher, count_tokens
+from collections import deque
+from conjugate import conjugate
 
 # Group all settings into a dictionary
 config = {
-    'api_client': openai.OpenAI(),
+    'api_client': None, # Created on first use (get_client), so a dry run or an all-local run needs no API key
     'base_folder': 'Verbs',
+    'apkg_out': None, # Also build an importable Anki package with one subdeck per tense, e.g. 'verbs.apkg' (see apkg_export.py)
+    'deck_name': 'Portuguese::Verbs',
+    'tts_engine': {'pt': 'gtts'}, # TTS engine for the conjugation audio: 'gtts', 'cloud', or offline 'espeak' / 'piper' (see tts_engines.py)
+    'tts_workers': 8, # Verbs having their audio made at once while the next LLM batch runs (see pipeline.py)
+    'pipeline_queue_size': 32, # Conjugated verbs allowed to wait for a TTS worker before the LLM loop pauses
+    'post_process_audio': False, # Trim silence, normalize loudness and re-encode new mp3s at a low bitrate with ffmpeg (see audio_post.py)
     'input_csv': 'filtered.csv',
-    'batch_size': 10,
+    'model': 'gpt-4o',
+    'prompt_version': 1, # Bump whenever the prompt changes so cached conjugations from the old prompt are not reused
+    'batch_size': 30, # Upper bound on verbs per request; TokenBatcher packs fewer if they would not fit in max_tokens
+    'max_tokens': 4096,
+    'completion_tokens_per_verb': 150, # Starting estimate for one VERB block with three tenses
     'max_batches': 100,
+    'local_conjugation': True, # Conjugate regular and known irregular verbs locally (conjugate.py); only the rest go to the API
+    'structured_output': False, # Ask for JSON matching a strict schema (parsers.conjugation_schema) instead of VERB/--- blocks
+    'progress_db': 'verb_progress.sqlite', # Which tense cards and clips each verb has (see verb_progress.py); seeded from the CSVs once
+    'shard_ledger': 'verbs.ledger.sqlite', # Shared verb list and progress of a --shard / --claim run (see shards.py)
+    'stream_responses': False, # Stream each response and start on a verb's audio as soon as its block is parsed (see llm_stream.py)
     'tenses': {
         'present': {'folder': 'Present', 'csv': 'present.csv'},
         'past': {'folder': 'Past', 'csv': 'past.csv'},
@@ -19,6 +46,7 @@ config = {
     }
 }
 
+@metrics.timed('csv_read')
 def filter_verbs(filename):
     print(f"Filtering verbs from '{filename}'...")
     with open(filename, mode='r', encoding='utf-8') as infile:
@@ -27,11 +55,18 @@ def filter_verbs(filename):
     print(f"Found {len(verbs)} verbs to process.")
     return verbs
 
-def fetch_conjugations(pt_verbs_batch):
-    if not pt_verbs_batch:
-        return ""
-    
+def build_prompt(pt_verbs_batch):
     joined_verbs = ", ".join(pt_verbs_batch)
+    if config['structured_output']: # The response format takes care of the layout; one entry per verb, one object per tense
+        return f"""
+    You are a precise Portuguese language expert. Your task is to generate verb conjugations.
+    For each of the following Portuguese verbs, provide the simple present, simple past (pretérito perfeito), and simple future conjugations.
+
+    Verbs to conjugate: {joined_verbs}
+
+    Return one entry per verb, with the infinitive exactly as given in "verb". Each tense holds the conjugated form alone,
+    without the pronoun, for eu, você/ele/ela, nós and vocês/eles/elas.
+    """
     prompt = f"""
     You are a precise Portuguese language expert. Your task is to generate verb conjugations.
     For each of the following Portuguese verbs, provide the simple present, simple past (pretérito perfeito), and simple future conjugations.
@@ -58,50 +93,57 @@ def fetch_conjugations(pt_verbs_batch):
     Vocês/Eles/Elas [conjugation]
     ---
     """ # Don't remove '---'. It's a delimiter here.
+    return prompt
+
+def get_client():
+    if config['api_client'] is None:
+        import openai
+        config['api_client'] = openai.OpenAI()
+    return config['api_client']
+
+def request_format(): # Extra chat.completions.create arguments
+    if not config['structured_output']:
+        return {}
+    return {'response_format': parsers.response_format('conjugations', parsers.conjugation_schema(config['tenses']))}
+
+def response_stream(): # Incremental parser for the response format in use
+    if config['structured_output']:
+        return parsers.conjugation_json_stream(config['tenses'])
+    return parsers.ConjugationStream(config['tenses'])
+
+@metrics.timed()
+def fetch_conjugations(pt_verbs_batch, on_verbs=None):
+    # Returns (response text, finish_reason). With stream_responses, on_verbs gets {verb: {tense: ...}} for each block
+    # as soon as it has been streamed in
+    if not pt_verbs_batch:
+        return "", None
     
-    print(f"Sending {len(pt_verbs_batch)} verbs to the API: {joined_verbs}")
+    print(f"Sending {len(pt_verbs_batch)} verbs to the API: {', '.join(pt_verbs_batch)}")
+    request = {'model': config['model'], 'messages': [{"role": "user", "content": build_prompt(pt_verbs_batch)}],
+               'max_tokens': config['max_tokens'], **request_format()}
+    on_entries = (lambda entries: on_verbs(dict(entries))) if on_verbs else None
     try:
-        response = config['api_client'].chat.completions.create(
-            model = "gpt-4o",
-            messages = [{"role": "user", "content": prompt}],
-            max_tokens = 4096
-        )
-        return response.choices[0].message.content.strip()
+        with metrics.timer('openai_request'):
+            if config['stream_responses']:
+                text, finish_reason = llm_stream.complete(get_client(), response_stream(), on_entries, **request)
+                return text.strip(), finish_reason
+            response = get_client().chat.completions.create(**request)
+        metrics.record_usage(response)
+        return (response.choices[0].message.content or "").strip(), response.choices[0].finish_reason # content is None on a refusal
     except Exception as e:
         print(f"An error occurred during the API call: {e}")
-        return ""
+        return "", None
 
+@metrics.timed()
 def parse_conjugations(raw_data):
-    parsed_verbs = {} # Define empty dictionary to later add processed verbs to
-    verb_blocks = raw_data.strip().split('---') # Separate API response by '---'
-
-    def process_tense_block(text_block):
-        lines = [line.strip().split(' ', 1)[1] for line in text_block.strip().split('\n') if ' ' in line.strip()]
-        return {'html': "<br>".join(lines), 'gTTS': ", ".join(lines)} # Add <br> for Anki and , for gTTS
-
-    for block in filter(None, verb_blocks):
-        verb_match = re.search(r'VERB:\s*(.+)', block, re.IGNORECASE) # ID the infinitive
-        if not verb_match: continue # Skip this block if no infinitive is found
-        
-        verb_infinitive = verb_match.group(1).lower().strip() # Clean infinitive
-        parsed_verbs[verb_infinitive] = {} # Store in table
-
-        tense_keys = list(config['tenses'].keys())
-        for i, tense in enumerate(tense_keys):
-            if i + 1 == len(tense_keys):
-                pattern = re.compile(rf'{tense.upper()}:(.*)', re.DOTALL | re.IGNORECASE)
-            else:
-                next_tense = tense_keys[i + 1].upper()
-                pattern = re.compile(rf'{tense.upper()}:(.*?){next_tense}', re.DOTALL | re.IGNORECASE)
-            
-            match = pattern.search(block)
-            if match:
-                parsed_verbs[verb_infinitive][tense] = process_tense_block(match.group(1))
-    
-    return parsed_verbs
+    if config['structured_output']:
+        return parsers.parse_conjugation_json(raw_data, config['tenses'])
+    return parsers.parse_conjugation_response(raw_data, config['tenses']) # {verb: {tense: {'html', 'gTTS'}}}
 
-def get_existing_verbs(file):
-    existing_verbs = set()
+@metrics.timed('csv_read')
+def read_cards(file):
+    # {verb: (en, pt)} for the cards in one tense CSV. Only needed to seed the progress store
+    cards = {}
     try:
         with open(file, mode='r', encoding='utf-8') as infile:
             reader = csv.reader(infile)
@@ -109,76 +151,237 @@ def get_existing_verbs(file):
                 if len(row) >= 2:
                     match = re.search(r'<b>(.*?)</b>', row[1]) # Find the verb within the <b>...</b> tags on the back of the card
                     if match:
-                        existing_verbs.add(match.group(1).lower())
+                        cards.setdefault(match.group(1).lower(), (row[0].split('<br>')[0], match.group(1)))
     except FileNotFoundError:
-        print("Output file not found. Starting from scratch.")
-    return existing_verbs
+        print(f"'{file}' not found. Starting from scratch.")
+    return cards
+
+def open_progress():
+    # The progress store, seeded from the tense CSVs and audio folders on its first use
+    progress = verb_progress.VerbProgress(config['progress_db'])
+    if not len(progress):
+        cards = {tense: read_cards(details['csv']) for tense, details in config['tenses'].items()}
+        if any(cards.values()):
+            print(f"Seeding '{config['progress_db']}' from the existing decks...")
+            print(f"Imported {progress.import_cards(cards, config['tenses'], audio_path)} verbs.")
+    return progress
+
+generated_audio = [] # mp3s written this run, for the optional post-processing step
+progress = None # The VerbProgress store, opened in main()
 
+@metrics.timed()
 def generate_audio(text, output_path):
+    # Returns True once the clip is on disk
     if not text or not text.strip(): # Skip if all_conjugations is empty
         print(f"Skipping audio generation for {output_path} due to empty input.")
-        return
+        return False
     try:
-        gTTS(text=text, lang='pt').save(output_path)
+        tts_engines.fetch(output_path, text, 'pt', config['tts_engine']['pt']) # Identical conjugations come from the cache
+        generated_audio.append(output_path)
+        return True
     except Exception as e:
         print(f"Error generating audio for {output_path}: {e}")
+        return False
+
+def audio_path(pt_verb, tense):
+    tense_folder = os.path.join(config['base_folder'], config['tenses'][tense]['folder']) # Determine the correct folder for each tense
+    return os.path.join(tense_folder, f"{pt_verb}_{tense}_verb.mp3") # Uniquely name each file with the correct verb and tense
+
+def make_audio(card): # Runs in the pipeline's TTS workers
+    en_verb, pt_verb, conjugations, repair = card
+    for tense, data in conjugations.items():
+        if repair is not None and not repair.get(tense, (False, False))[1]: # --repair: this tense's clip is already there
+            continue
+        path = audio_path(pt_verb, tense)
+        os.makedirs(os.path.dirname(path), exist_ok=True) # Create folder if it does not exist
+        if generate_audio(data['gTTS'], path):
+            progress.audio_written(pt_verb, tense, path)
 
 def main():
-    existing_verbs = get_existing_verbs(config['tenses']['present']['csv']) # Find existing verbs
-    print(f"Found {len(existing_verbs)} existing verbs in the output files.")
+    parser = argparse.ArgumentParser(description="Conjugate new verbs into present/past/future cards with audio.")
+    parser.add_argument('--shard', type=shards.parse_shard, metavar='I/N', help=f"Be worker I of N on the run in '{config['shard_ledger']}', taking the verbs that hash to shard I")
+    parser.add_argument('--claim', action='store_true', help=f"Claim verbs from '{config['shard_ledger']}' batch by batch")
+    parser.add_argument('--repair', action='store_true', help="Only write the tense cards and clips earlier runs left missing")
+    parser.add_argument('--verify', action='store_true', help="With --repair, first check every recorded clip is still on disk")
+    args = parser.parse_args()
+    if args.repair and (args.shard or args.claim):
+        parser.error("--repair runs on its own, not as a sharded worker")
+    ledger = shards.WorkLedger(config['shard_ledger']) if args.shard or args.claim else None
+    worker = shards.worker_id()
+    global progress
+    progress = open_progress()
+    print(progress.summary())
 
-    verb_pairs = filter_verbs(config['input_csv']) # Read 'filtered.csv' and make a list of verb pairs
+    repairs = {} # --repair: verb -> {tense: (card missing, audio missing)}
+    if args.repair:
+        if args.verify:
+            print(f"{progress.verify(audio_path)} recorded clips are gone or empty.")
+        missing = progress.missing()
+        new_verb_pairs = [(en, pt) for en, pt, _ in missing.values()]
+        repairs = {verb: tenses for verb, (_, _, tenses) in missing.items()}
+    else:
+        existing_verbs = progress.verbs() # Find existing verbs
+        print(f"Found {len(existing_verbs)} existing verbs in the progress store.")
 
-    # Create a new list with ONLY the new verbs
-    new_verb_pairs = [ 
-        (en, pt) for en, pt in verb_pairs if pt.lower() not in existing_verbs
-    ]
+        verb_pairs = filter_verbs(config['input_csv']) # Read 'filtered.csv' and make a list of verb pairs
+
+        # Create a new list with ONLY the new verbs
+        new_verb_pairs = [ 
+            (en, pt) for en, pt in verb_pairs if pt.lower() not in existing_verbs
+        ]
+    pairs = {} # pt.lower() -> the (en, pt) pairs asking for that verb
+    for en_verb, pt_verb in new_verb_pairs:
+        pairs.setdefault(pt_verb.lower(), []).append((en_verb, pt_verb))
+
+    csv_paths = {tense: details['csv'] for tense, details in config['tenses'].items()}
+    if ledger: # Every worker works from the first one's verb list, and writes its cards to its own part files
+        pairs = {verb: [tuple(pair) for pair in verb_pairs] for verb, verb_pairs in ledger.plan(lambda: pairs.items())}
+        pending = ledger.pending()
+        pairs_to_do = {verb: pairs[verb] for verb in pairs if verb in pending and (args.claim or shards.in_shard(verb, args.shard))}
+        new_verb_pairs = [pair for verb_pairs in pairs_to_do.values() for pair in verb_pairs]
+        part = args.shard[0] if args.shard else worker
+        csv_paths = {tense: shards.part_path(path, part) for tense, path in csv_paths.items()}
+        print(ledger.summary())
 
     if not new_verb_pairs:
-        print("No new verbs to process. Exiting.")
+        print("Nothing to repair. Exiting." if args.repair else "No new verbs to process. Exiting.")
+        progress.close()
         return # Stop if there's nothing new to add
     
-    print(f"Processing {len(new_verb_pairs)} new verbs.")
+    if args.repair:
+        print(f"Repairing {len(new_verb_pairs)} verbs: {sum(no_card for tenses in repairs.values() for no_card, _ in tenses.values())} tense cards "
+              f"and {sum(no_audio for tenses in repairs.values() for _, no_audio in tenses.values())} clips missing.")
+    else:
+        print(f"Processing {len(new_verb_pairs)} new verbs" + (", shared with the other workers." if args.claim else "."))
     all_conjugations = {} # Define empty dictionary for saving results later
-    pt_verbs = [pt for _, pt in new_verb_pairs] # Make a simple list of only Portuguese verbs
-    
-    for i in range(0, len(pt_verbs), config['batch_size']): # Loop through the Portuguese verbs in batches
-        batch_num = (i // config['batch_size']) + 1
-        if 0 < config['max_batches'] < batch_num:
-            print(f"Reached the testing limit of {config['max_batches']} batches. Stopping.")
-            break
+    files = {tense: open(path, 'a', newline='', encoding='utf-8') for tense, path in csv_paths.items()}
+    writers = {tense: csv.writer(file) for tense, file in files.items()} # Create a dictionary for each tense
+    queued = set()
+    unsynced = [] # Verbs written since the last sync()
+
+    @metrics.timed('csv_write')
+    def write_card(card): # Runs in the pipeline's writer thread, once the verb's audio is done
+        en_verb, pt_verb, conjugations, repair = card
+        en_verb_clean = re.sub(r'\s*\(.*\)\s*', '', en_verb).strip() # Clean the English infinitive for gTTS by removing text within parenthesis
+        for tense, data in conjugations.items(): # Loop through each Portuguese verb tense
+            if repair is not None and not repair.get(tense, (False, False))[0]: # --repair: the deck already has this tense's card
+                continue
+            front = f"{en_verb}<br>[sound:{en_verb_clean}_en.mp3]"
+            back  = f"<b>{pt_verb}</b><br>{data['html']}<br>[sound:{os.path.basename(audio_path(pt_verb, tense))}]"
+            writers[tense].writerow([front, back]) # Write front and back for each tense
+            progress.card_written(pt_verb, tense)
+        unsynced.append(pt_verb.lower())
+
+    def sync(): # The rows are on disk before the progress store (and a sharded run's ledger) calls them written
+        if not unsynced:
+            return
+        for file in files.values():
+            file.flush()
+            if ledger:
+                os.fsync(file.fileno())
+        progress.flush()
+        if ledger:
+            ledger.finish(unsynced)
+        unsynced.clear()
+
+    def submit(conjugations, complete_only=True):
+        # Hands verbs to the pipeline as soon as they are conjugated; a verb cut off mid-block waits for its retry
+        for verb, data in conjugations.items():
+            if verb in pairs and verb not in queued and (len(data) == len(config['tenses']) or not complete_only):
+                queued.add(verb)
+                for en_verb, pt_verb in pairs[verb]:
+                    progress.plan(en_verb, pt_verb, config['tenses']) # Tenses the answer lacks stay missing, for --repair
+                    cards.put((en_verb, pt_verb, data, repairs.get(verb)))
+
+    def prepare(pt_verbs):
+        # Local conjugations and cached answers go straight to the pipeline; returns the verbs left for the API
+        if config['local_conjugation']:
+            local = {pt: conjugate(pt, config['tenses']) for pt in pt_verbs}
+            all_conjugations.update({pt.lower(): data for pt, data in local.items() if data})
+            pt_verbs = [pt for pt in pt_verbs if not local[pt]]
+            print(f"Conjugated {len(local) - len(pt_verbs)} verbs locally, {len(pt_verbs)} irregular or unknown verbs left.")
+            submit(all_conjugations) # The local conjugations start on their audio right away
+
+        cached, pt_verbs = llm_cache.cache.split('conjugation', pt_verbs, config['model'], config['prompt_version']) # Conjugations never change, so cached ones never expire
+        all_conjugations.update({verb.lower(): data for verb, data in cached.items()}) # Add the verbs answered on earlier runs
+        submit(all_conjugations)
+        print(f"Found {len(cached)} verbs in the LLM cache, {len(pt_verbs)} left for the API.")
+        return pt_verbs
+
+    def claim_verbs(): # --claim: the next batch's worth of verbs nobody else has, or [] once the ledger runs dry
+        while True:
+            claimed = ledger.claim(worker, config['batch_size'])
+            pt_verbs = prepare([pairs[verb][0][1] for verb in claimed])
+            if pt_verbs or not claimed:
+                return pt_verbs
+
+    print(f"Appending new Anki cards and audio files as the conjugations come in...")
+    try:
+        with pipeline.Pipeline(make_audio, write_card, workers=config['tts_workers'], max_pending=config['pipeline_queue_size'], idle=sync, label="Verbs") as cards:
+            batcher = TokenBatcher(config['model'], count_tokens(build_prompt([]), config['model']), config['completion_tokens_per_verb'],
+                                   max_items=config['batch_size'], max_output_tokens=config['max_tokens'])
+            queue = deque() if args.claim else deque(prepare([pt for _, pt in new_verb_pairs])) # Make a simple list of only Portuguese verbs
+            requeued = {} # How often each verb was sent again after a truncated response
+            batch_num = 0
+
+            while True: # Loop through the Portuguese verbs in batches
+                if not queue and args.claim:
+                    queue.extend(claim_verbs())
+                if not queue:
+                    break
+                batch_num += 1
+                if 0 < config['max_batches'] < batch_num:
+                    print(f"Reached the testing limit of {config['max_batches']} batches. Stopping.")
+                    break
         
-        print(f"\n--- Processing Batch {batch_num} ---")
-        batch = pt_verbs[i:i + config['batch_size']] # Use list slicing to extract a portion of the verb pairs
-        response_data = fetch_conjugations(batch) # Make API call and return the raw resonse data
-        parsed_data = parse_conjugations(response_data) # Parse the raw text into a structured dictionary
-        all_conjugations.update(parsed_data) # Add the parsed verbs into our main collection
-        print(f"Successfully parsed {len(parsed_data)} verbs from batch.")
-        time.sleep(2) # Add a pause to avoid API limits
-    
-    print(f"Appending new Anki cards and audio files...")
-    writers = { # Create a dictionary for each tense
-        tense: csv.writer(open(details['csv'], 'a', newline='', encoding='utf-8'))
-        for tense, details in config['tenses'].items()
-    }
+                print(f"\n--- Processing Batch {batch_num} ---")
+                batch = batcher.next_batch(queue) # As many verbs as fit within max_tokens
+                response_data, finish_reason = fetch_conjugations(batch, submit) # Make API call and return the raw resonse data; streamed verbs start on their audio early
+                parsed_data = parse_conjugations(response_data) # Parse the raw text into a structured dictionary
+                all_conjugations.update(parsed_data) # Add the parsed verbs into our main collection
+                for verb, data in parsed_data.items():
+                    if len(data) == len(config['tenses']): # Never cache a verb whose block was cut off
+                        llm_cache.cache.put('conjugation', verb, config['model'], config['prompt_version'], data)
+                print(f"Successfully parsed {len(parsed_data)} verbs from batch.")
+                submit(parsed_data) # Their audio is made while the next batch runs
 
-    for en_verb, pt_verb in new_verb_pairs: # Loop through the new verb pairs
-        if pt_verb.lower() in all_conjugations:
-            en_verb_clean = re.sub(r'\s*\(.*\)\s*', '', en_verb).strip() # Clean the English infinitive for gTTS by removing text within parenthesis
-            
-            for tense, data in all_conjugations[pt_verb.lower()].items(): # Loop through each Portuguese verb tense 
-                tense_folder = os.path.join(config['base_folder'], config['tenses'][tense]['folder']) # Determine the correct folder for each tense
-                os.makedirs(tense_folder, exist_ok=True) # Create folder if it does not exist
-                
-                audio_file = f"{pt_verb}_{tense}_verb.mp3" # Uniquely name each file with the correct verb and tense
-                audio_path = os.path.join(tense_folder, audio_file) # Determine the correct folder for each audio file
-                generate_audio(data['gTTS'], audio_path) # Call generate_audio()
-
-                front = f"{en_verb}<br>[sound:{en_verb_clean}_en.mp3]"
-                back  = f"<b>{pt_verb}</b><br>{data['html']}<br>[sound:{audio_file}]"
-                writers[tense].writerow([front, back]) # Write front and back for each tense
-    
-    print(f"\nSuccess! Appended new cards to {', '.join(d['csv'] for d in config['tenses'].values())}.") # Note: File handles are left open until the script exits. For more robust applications, use a 'with' block.
+                missing = [verb for verb in batch if len(parsed_data.get(verb.lower(), {})) < len(config['tenses'])]
+                if response_data: # An empty string is a failed request, already reported, not a response we couldn't read
+                    metrics.record_parse(len(batch), len(missing))
+                if batcher.record(batch, missing, finish_reason): # Truncated: send the lost verbs again in a smaller batch instead of dropping them
+                    for verb in reversed(missing):
+                        requeued[verb] = requeued.get(verb, 0) + 1
+                        if requeued[verb] <= 2:
+                            queue.appendleft(verb)
+                            metrics.count('retries')
+                metrics.sleep(2) # Add a pause to avoid API limits
+
+            submit(all_conjugations, complete_only=False) # Verbs whose retries ran out keep the tenses we did get
+    finally:
+        for file in files.values():
+            file.close() # Flush the appended rows before anything reads the CSVs back, also when a write failed
+        progress.flush()
+        print(progress.summary())
+        progress.close()
+
+    if ledger:
+        ledger.release(worker) # Verbs from a batch that failed outright go back to the other workers
+        print(ledger.summary())
+        print(f"Once every worker is done, add the part files to the decks with 'python shards.py merge --append {' '.join(details['csv'] for details in config['tenses'].values())}'.")
+
+    tts_engines.close()
+    if config['post_process_audio']:
+        audio_post.post_process(generated_audio)
+
+    if config['apkg_out'] and not ledger: # A worker only has its part of the decks; build the package after merging
+        sources = [(details['csv'], f"{config['deck_name']}::{tense.title()}") for tense, details in config['tenses'].items()]
+        folders = [os.path.join(config['base_folder'], details['folder']) for details in config['tenses'].values()]
+        apkg_export.export_csv(sources, config['apkg_out'], folders, apkg_export.verb_key)
+
+    print(llm_cache.cache.summary())
+    print(audio_cache.cache.summary())
+    metrics.finish()
+    print(f"\nSuccess! Appended new cards to {', '.join(csv_paths.values())}.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,94 @@
+import argparse
+import csv
+import csv_sample
+import os
+import re
+import sqlite3
+import time
+
+db_path = os.environ.get('ANKI_VOCAB_DB', 'vocabulary.sqlite')
+
+def remove_parentheses(word): return re.sub(r'\s*\(.*?\)', '', word).strip() # Same normalization words.py uses for audio file names
+
+class VocabularyStore:
+    # Indexed EN/PT vocabulary. (en, pt) is unique, the normalized audio names are stored alongside each pair and
+    # en_audio/pt_audio remember whether the mp3 is known to exist, so a run only looks at new or audio-missing rows.
+    def __init__(self, path=db_path, normalize=remove_parentheses):
+        self.normalize = normalize
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS pairs (
+                en TEXT NOT NULL, pt TEXT NOT NULL, en_clean TEXT NOT NULL, pt_clean TEXT NOT NULL,
+                en_audio INTEGER NOT NULL DEFAULT 0, pt_audio INTEGER NOT NULL DEFAULT 0, added REAL,
+                PRIMARY KEY (en, pt));
+            CREATE INDEX IF NOT EXISTS pairs_en ON pairs (en);
+            CREATE INDEX IF NOT EXISTS pairs_en_clean ON pairs (en_clean);
+            CREATE INDEX IF NOT EXISTS pairs_pt_clean ON pairs (pt_clean);
+            CREATE INDEX IF NOT EXISTS pairs_missing_audio ON pairs (en_audio, pt_audio);""")
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM pairs").fetchone()[0]
+
+    def add(self, pairs):
+        # Inserts the pairs we have not seen before and returns them, in input order. O(new * log N)
+        new_pairs = []
+        now = time.time()
+        with self.db:
+            for en, pt in pairs:
+                cursor = self.db.execute("INSERT OR IGNORE INTO pairs (en, pt, en_clean, pt_clean, added) VALUES (?, ?, ?, ?, ?)",
+                                         (en, pt, self.normalize(en), self.normalize(pt), now))
+                if cursor.rowcount:
+                    new_pairs.append((en, pt))
+        return new_pairs
+
+    def unknown(self, pairs):
+        # The pairs add() would insert, without inserting them (for dry runs). Same O(new * log N) index lookups
+        seen = self.db.execute
+        return [(en, pt) for en, pt in dict.fromkeys(pairs) if not seen("SELECT 1 FROM pairs WHERE en = ? AND pt = ?", (en, pt)).fetchone()]
+
+    def import_csv(self, path): # One-time migration from an existing filtered.csv
+        with open(path, 'r', newline='', encoding='utf-8') as file:
+            return len(self.add(tuple(row[:2]) for row in csv.reader(file) if len(row) >= 2))
+
+    def missing_audio(self):
+        # (en_clean, pt_clean, en, pt) for every pair whose EN or PT mp3 is not known to exist, sorted like the CSV
+        return self.db.execute("SELECT en_clean, pt_clean, en, pt FROM pairs WHERE en_audio = 0 OR pt_audio = 0 ORDER BY en, rowid").fetchall()
+
+    def mark_audio(self, en_present, pt_present):
+        # Records which cleaned words now have audio. Takes the cleaned names so one mp3 covers every pair that shares it
+        with self.db:
+            self.db.executemany("UPDATE pairs SET en_audio = 1 WHERE en_clean = ? AND en_audio = 0", ((w,) for w in en_present))
+            self.db.executemany("UPDATE pairs SET pt_audio = 1 WHERE pt_clean = ? AND pt_audio = 0", ((w,) for w in pt_present))
+
+    def export_csv(self, path):
+        # Writes the full list sorted by English word, the format filtered.csv has always had
+        tmp = f"{path}.tmp"
+        with open(tmp, mode='w', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerows(self.db.execute("SELECT en, pt FROM pairs ORDER BY en, rowid"))
+        os.replace(tmp, path) # Readers never see a half-written file
+        if os.path.exists(csv_sample.index_path(path)): # Keep an existing row index (see csv_sample.py) in step with the new file
+            csv_sample.build_index(path)
+
+    def close(self):
+        self.db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the indexed vocabulary store.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('import', help="Load pairs from a CSV file").add_argument('csv', nargs='?', default='filtered.csv')
+    sub.add_parser('export', help="Write the sorted vocabulary to a CSV file").add_argument('csv', nargs='?', default='filtered.csv')
+    sub.add_parser('stats', help="Show pair and missing-audio counts")
+    args = parser.parse_args()
+
+    store = VocabularyStore()
+    if args.command == 'import':
+        print(f"Imported {store.import_csv(args.csv)} new pairs from '{args.csv}'.")
+    elif args.command == 'export':
+        store.export_csv(args.csv)
+        print(f"Wrote {len(store)} sorted pairs to '{args.csv}'.")
+    else:
+        print(f"{len(store)} pairs, {len(store.missing_audio())} with missing audio.")
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import csv_sample
+import heapq
+import os
+import random
+import sqlite3
+import threading
+import time
+
+# Persistent per-word sentence coverage for sentence.py and sentences.py: how many sentence cards each word already
+# has and when the last one was made. sample() uses it to pick the words to send to the API:
+#   'least'    - fewest sentences first, then the longest since the last one (default)
+#   'weighted' - random, with weight 1 / (1 + sentences) ** power, so covered words still come up now and then
+#   'uniform'  - plain random, like the old random.sample over every row
+# All three take the rows as a stream and keep only k of them, so sample_csv() never loads the whole file; the counts
+# are looked up a batch of rows at a time rather than loaded for every covered word.
+
+db_path = os.environ.get('ANKI_COVERAGE_DB', 'word_coverage.sqlite')
+strategies = ('least', 'weighted', 'uniform')
+lookup_batch = 500 # Rows per coverage lookup, under SQLite's 999 bound parameters
+
+def word_key(row): # Rows are filtered.csv rows; the English word as written there identifies the word in both scripts
+    return row[0].strip().lower()
+
+class CoverageIndex:
+    def __init__(self, path=db_path):
+        self.path = path
+        self.db = None # Opened on first write, so sampling on a fresh checkout (or a dry run) creates nothing
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS coverage (word TEXT PRIMARY KEY, sentences INTEGER NOT NULL, last_generated REAL)")
+        return self.db
+
+    def lookup(self, words):
+        # {word: (sentences, last_generated)} for the given words that are covered, one primary-key lookup per word
+        words = list(set(words))
+        if not words or (self.db is None and not os.path.exists(self.path)):
+            return {}
+        with self.lock:
+            return {word: (count, last) for word, count, last in self.connect().execute(
+                f"SELECT word, sentences, last_generated FROM coverage WHERE word IN ({', '.join('?' * len(words))})", words)}
+
+    def annotate(self, rows):
+        # Yields (row, sentences, last_generated) for a stream of rows, looking counts up lookup_batch rows at a time so
+        # memory stays bounded by the batch rather than by how many words are covered
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == lookup_batch:
+                yield from self.annotate_batch(batch)
+                batch = []
+        yield from self.annotate_batch(batch)
+
+    def annotate_batch(self, batch):
+        counts = self.lookup(word_key(row) for row in batch if row)
+        for row in batch:
+            count, last = counts.get(word_key(row), (0, 0)) if row else (0, 0)
+            yield row, count, last
+
+    def record(self, words):
+        # One more sentence for each word (a word listed twice gets two)
+        now = time.time()
+        with self.lock:
+            db = self.connect()
+            with db:
+                db.executemany("""INSERT INTO coverage VALUES (?, 1, ?)
+                                  ON CONFLICT(word) DO UPDATE SET sentences = sentences + 1, last_generated = excluded.last_generated""",
+                               ((word.strip().lower(), now) for word in words))
+
+    def sample(self, rows, k, strategy='least', power=2.0, rng=random):
+        # rows can be any iterable (a list or a RowStream); only k of them are held at a time
+        if strategy == 'uniform':
+            return csv_sample.reservoir(rows, k, rng)
+        if strategy == 'weighted': # Efraimidis-Spirakis: the k largest random() ** (1 / weight) are a weighted sample without replacement
+            def priority(entry):
+                return rng.random() ** ((1 + entry[1]) ** power)
+            return [row for row, _, _ in heapq.nlargest(k, self.annotate(rows), key=priority)]
+        if strategy != 'least':
+            raise ValueError(f"Unknown sampling strategy '{strategy}', expected one of {', '.join(strategies)}")
+        def rank(entry): # Random last, so ties between equally covered words don't always favour the top of the file
+            _, count, last = entry
+            return count, last or 0, rng.random()
+        return [row for row, _, _ in heapq.nsmallest(k, self.annotate(rows), key=rank)]
+
+    def sample_csv(self, path, k, strategy='least', power=2.0, rng=random):
+        # (sampled rows, rows in the file). One streaming pass, or k seeks for 'uniform' when a fresh row index exists
+        if strategy == 'uniform':
+            row_index = csv_sample.RowIndex.load(path)
+            if row_index:
+                with row_index:
+                    return row_index.sample(k, rng), len(row_index)
+        rows = csv_sample.RowStream(path)
+        return self.sample(rows, k, strategy, power, rng), rows.count
+
+    def summary(self, rows=None):
+        if rows is None:
+            words = sentences = 0
+            if self.db is not None or os.path.exists(self.path):
+                with self.lock:
+                    words, sentences = self.connect().execute("SELECT COUNT(*), COALESCE(SUM(sentences), 0) FROM coverage").fetchone()
+            return f"Word coverage: {words} words have sentences, {sentences} sentences in total"
+        total = covered = 0
+        for row, count, _ in self.annotate(rows): # Streamed; a word listed twice counts twice
+            if row:
+                total += 1
+                covered += count > 0
+        return f"Word coverage: {covered} of {total} words have at least one sentence ({covered / total * 100 if total else 0:.0f}%)"
+
+coverage = CoverageIndex()
+
+def main():
+    parser = argparse.ArgumentParser(description="Show how much of a word list already has sentences.")
+    parser.add_argument('--csv', default='filtered.csv')
+    args = parser.parse_args()
+
+    if os.path.exists(args.csv):
+        print(coverage.summary(csv_sample.RowStream(args.csv)))
+    else:
+        print(coverage.summary())
+
+if __name__ == "__main__":
+    main()
@@ -1,94 +1,127 @@
+import apkg_export
 import csv
-from gtts import gTTS
 import os
+import audio_cache
+import audio_post
+import media_manifest
+import metrics
 import re
+import tts_engines
+from tts_pool import TTSExecutor
+from vocab_store import VocabularyStore
 
 csv_in = 'PT 9-27 Fix.csv'
 csv_out = 'words.csv'
 filtered_csv = 'filtered.csv'
+vocab_db = 'vocabulary.sqlite' # Indexed vocabulary (see vocab_store.py); filtered.csv is exported from it
+apkg_out = None # Also build an importable Anki package, e.g. 'words.apkg' (see apkg_export.py)
+deck_name = 'Portuguese::Words'
+post_process_audio = False # Trim silence, normalize loudness and re-encode new mp3s at a low bitrate with ffmpeg (see audio_post.py)
+export_filtered = True # Re-export the sorted filtered.csv when new pairs arrive. 'python vocab_store.py export' does it on demand
 en_folder = r'C:\Users\Mac\AppData\Roaming\Anki2\Mac\collection.media'
 pt_folder = r'C:\Users\Mac\AppData\Roaming\Anki2\Mac\collection.media'
+tts_engine = {'en': 'gtts', 'pt': 'gtts'} # TTS engine per language: 'gtts', 'cloud', or offline 'espeak' / 'piper' (see tts_engines.py)
+tts_workers = 8 # Number of concurrent TTS requests
+tts_rate = 10 # Max gTTS/Cloud requests per second (token bucket refill rate), 0 disables the limit. Offline engines aren't limited
+tts_burst = 10 # Token bucket size, i.e. how many requests may start at once
 
 def remove_parentheses(word): return re.sub(r'\s*\(.*?\)', '', word).strip() # Removes text inside parentheses
 
-all_pairs = []
-with open(filtered_csv, 'r', newline='', encoding='utf-8') as file:
-    reader = csv.reader(file)
-    for row in reader:
-        if row:
-            all_pairs.append(tuple(row))
+def main():
+    store = VocabularyStore(vocab_db, normalize=remove_parentheses)
+    if not len(store) and os.path.exists(filtered_csv): # First run: seed the store from the existing filtered.csv
+        print(f"Importing existing pairs from '{filtered_csv}'...")
+        store.import_csv(filtered_csv)
 
-existing_pairs = set(all_pairs) # Create the set for fast lookups from the list we just made
-new_pairs = []
+    candidate_pairs = []
 
-print("Reading input file and adding new unique pairs...")
-with open(csv_in, mode='r', encoding='utf-8') as file:
-    reader = csv.reader(file)
-    next(reader)
+    print("Reading input file and adding new unique pairs...")
+    with open(csv_in, mode='r', encoding='utf-8') as file, metrics.timer('csv_read'):
+        reader = csv.reader(file)
+        next(reader)
     
-    for row in reader:
-        en_word = row[0].strip()
-        pt_word = row[1].strip()
+        for row in reader:
+            en_word = row[0].strip()
+            pt_word = row[1].strip()
         
-        if not en_word or not pt_word:
-            continue
-            
-        current_pair = (en_word, pt_word)
-
-        if not (en_word.istitle() and pt_word.istitle()) and current_pair not in existing_pairs:
-            all_pairs.append(current_pair) # Add pair to the master list
-            new_pairs.append(current_pair) # Add pair for audio 
-            existing_pairs.add(current_pair) # Add existing pair to avoid duplicates
-
-
-print(f"Sorting all {len(all_pairs)} pairs...")
-all_pairs.sort(key=lambda x: x[0]) # Sort list and overwrite the file
-
-print(f"Overwriting '{filtered_csv}' with the newly sorted, complete list...")
-# We now open in 'w' (write) mode to erase and rewrite the file
-with open(filtered_csv, mode='w', newline='', encoding='utf-8') as file:
-    writer = csv.writer(file)
-    writer.writerows(all_pairs)
-
-print("Process complete. The file is now perfectly sorted.")
-
-en_exists = {f.rsplit("_en.mp3", 1)[0] for f in os.listdir(en_folder) if f.endswith("_en.mp3")}
-pt_exists = {f.rsplit("_pt.mp3", 1)[0] for f in os.listdir(pt_folder) if f.endswith("_pt.mp3")}
-
-# Generate gTTS list based on cleaned words for audio generation
-gTTS_list = [
-    (remove_parentheses(en_word), remove_parentheses(pt_word), en_word, pt_word)
-    for en_word, pt_word in all_pairs
-    if remove_parentheses(en_word) not in en_exists or remove_parentheses(pt_word) not in pt_exists
-]
-
-# Generate audio files
-for en_clean, pt_clean, en_word, pt_word in gTTS_list:
-    # If the cleaned word doesn't exist, generate audio
-    if en_clean not in en_exists:
-        tts = gTTS(text=en_clean, lang='en')
-        mp3_name = f"{en_clean}_en.mp3"
-        mp3_path = os.path.join(en_folder, mp3_name)
-        tts.save(mp3_path)
-        en_exists.add(en_clean)
-
-    if pt_clean not in pt_exists:
-        tts = gTTS(text=pt_clean, lang='pt')
-        mp3_name = f"{pt_clean}_pt.mp3"
-        mp3_path = os.path.join(pt_folder, mp3_name)
-        tts.save(mp3_path)
-        pt_exists.add(pt_clean) 
-
-# Create Anki flashcards file
-with open(csv_out, mode='w', newline='', encoding='utf-8') as file:
-    writer = csv.writer(file)
-
-    for en_clean, pt_clean, en_word, pt_word in gTTS_list:
-        front = f"{en_word}<br>[sound:{en_clean}_en.mp3]"
-        back = f"{pt_word}<br>[sound:{pt_clean}_pt.mp3]"
+            if not en_word or not pt_word:
+                continue
+
+            if not (en_word.istitle() and pt_word.istitle()):
+                candidate_pairs.append((en_word, pt_word))
+
+    with metrics.timer('vocab_store'):
+        new_pairs = store.add(candidate_pairs) # The unique (en, pt) key skips pairs we already have, no full reread or sort needed
+    print(f"Added {len(new_pairs)} new pairs, {len(store)} pairs in total.")
+
+    if export_filtered and new_pairs: # sentence.py, sentences.py and verbs.py still read the sorted CSV
+        print(f"Exporting the sorted list to '{filtered_csv}'...")
+        with metrics.timer('csv_write'):
+            store.export_csv(filtered_csv)
+
+    with metrics.timer('media_scan'): # Only rescans a folder that changed since the last run; en_folder and pt_folder may be the same folder
+        en_exists = media_manifest.folder(en_folder).with_suffix("_en.mp3") # 'word' in en_exists means word_en.mp3 is there
+        pt_exists = media_manifest.folder(pt_folder).with_suffix("_pt.mp3")
+
+    # Only new rows and rows whose audio was missing last time are scanned, using the stored cleaned words
+    missing_rows = store.missing_audio()
+    gTTS_list = [
+        (en_clean, pt_clean, en_word, pt_word)
+        for en_clean, pt_clean, en_word, pt_word in missing_rows
+        if en_clean not in en_exists or pt_clean not in pt_exists
+    ]
+
+    @metrics.timed('generate_audio')
+    def save_audio(text, lang, mp3_path, exists):
+        tts_engines.fetch(mp3_path, text, lang, tts_engine[lang], guard=exists.writing) # Reuse a cached clip when we have one
+        exists.add(text) # Only mark as existing once the file has actually been written
+        generated_audio.append(mp3_path)
+
+    generated_audio = [] # mp3s written this run, for the optional post-processing step
+
+    # Generate audio files. The executor only runs each (lang, cleaned word) key once, so duplicates are never synthesized twice
+    limited = {lang: tts_engines.get(engine).network for lang, engine in tts_engine.items()}
+    with TTSExecutor(workers=tts_workers, rate=tts_rate, burst=tts_burst, label="TTS") as executor:
+        for en_clean, pt_clean, en_word, pt_word in gTTS_list:
+            # If the cleaned word doesn't exist, generate audio
+            if en_clean not in en_exists:
+                mp3_path = os.path.join(en_folder, f"{en_clean}_en.mp3")
+                executor.submit(('en', en_clean), save_audio, en_clean, 'en', mp3_path, en_exists, limited=limited['en'])
+
+            if pt_clean not in pt_exists:
+                mp3_path = os.path.join(pt_folder, f"{pt_clean}_pt.mp3")
+                executor.submit(('pt', pt_clean), save_audio, pt_clean, 'pt', mp3_path, pt_exists, limited=limited['pt'])
+
+    tts_engines.close()
+    print(audio_cache.cache.summary())
+    store.mark_audio( # Rows with both files present are never scanned again
+        {row[0] for row in missing_rows if row[0] in en_exists},
+        {row[1] for row in missing_rows if row[1] in pt_exists}
+    )
+
+    # Create Anki flashcards file
+    with open(csv_out, mode='w', newline='', encoding='utf-8') as file, metrics.timer('csv_write'):
+        writer = csv.writer(file)
+
+        for en_clean, pt_clean, en_word, pt_word in gTTS_list:
+            front = f"{en_word}<br>[sound:{en_clean}_en.mp3]"
+            back = f"{pt_word}<br>[sound:{pt_clean}_pt.mp3]"
         
-        writer.writerow([front, back])
+            writer.writerow([front, back])
 
-        print(f"Front: {front}, Back: {back}, new card added!")
+            print(f"Front: {front}, Back: {back}, new card added!")
 
-print(f"\n--- Script Complete ---\nTotal new pairs added this session: {len(new_pairs)}")
+    if post_process_audio:
+        with en_exists.writing(), pt_exists.writing(): # Its temp files and renames are our own changes to the folders too
+            audio_post.post_process(generated_audio)
+
+    if apkg_out:
+        apkg_export.export_csv([(csv_out, deck_name)], apkg_out, [en_folder, pt_folder], apkg_export.word_key)
+
+    print(media_manifest.manifest.summary())
+    media_manifest.manifest.close() # Records the clips written above (after post-processing, which also touches the folder)
+    metrics.finish()
+    print(f"\n--- Script Complete ---\nTotal new pairs added this session: {len(new_pairs)}")
+
+if __name__ == "__main__":
+    main()